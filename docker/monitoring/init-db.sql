@@ -1,5 +1,8 @@
 -- Mesh Network Monitoring Database Initialization
 
+-- Later schema changes are applied by the collector (storage.MIGRATIONS),
+-- which records them in schema_version
+
 -- Nodes table
 CREATE TABLE IF NOT EXISTS nodes (
     hostname TEXT PRIMARY KEY,
@@ -36,6 +39,7 @@ CREATE TABLE IF NOT EXISTS services (
 );
 
 CREATE INDEX IF NOT EXISTS idx_services_hostname ON services(hostname, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_services_latest ON services(hostname, service_name, timestamp);
 
 -- OSPF neighbors table
 CREATE TABLE IF NOT EXISTS ospf_neighbors (
@@ -49,6 +53,19 @@ CREATE TABLE IF NOT EXISTS ospf_neighbors (
 );
 
 CREATE INDEX IF NOT EXISTS idx_ospf_hostname ON ospf_neighbors(hostname, timestamp DESC);
+CREATE INDEX IF NOT EXISTS idx_ospf_state_timestamp ON ospf_neighbors(state, timestamp);
+
+-- Reachability table (RTT and packet loss per sweep)
+CREATE TABLE IF NOT EXISTS reachability (
+    id SERIAL PRIMARY KEY,
+    hostname TEXT,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    rtt_ms REAL,
+    packet_loss REAL,
+    FOREIGN KEY (hostname) REFERENCES nodes(hostname) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_reachability_hostname ON reachability(hostname, timestamp DESC);
 
 -- Alerts table
 CREATE TABLE IF NOT EXISTS alerts (
@@ -72,13 +89,19 @@ CREATE TABLE IF NOT EXISTS sent_notifications (
     FOREIGN KEY (alert_id) REFERENCES alerts(id) ON DELETE CASCADE
 );
 
--- Cleanup old metrics (retention function)
+-- Cleanup old metrics (retention function; the collector also enforces
+-- retention.metrics_days itself, see rollups.py)
 CREATE OR REPLACE FUNCTION cleanup_old_metrics(days INTEGER)
 RETURNS void AS $$
 BEGIN
-    DELETE FROM metrics WHERE timestamp < NOW() - INTERVAL '1 day' * days;
+    -- metrics and reachability hold epoch seconds from schema version 8 on
+    DELETE FROM metrics WHERE timestamp < EXTRACT(EPOCH FROM NOW() - INTERVAL '1 day' * days);
     DELETE FROM services WHERE timestamp < NOW() - INTERVAL '1 day' * days;
     DELETE FROM ospf_neighbors WHERE timestamp < NOW() - INTERVAL '1 day' * days;
+    DELETE FROM reachability WHERE timestamp < EXTRACT(EPOCH FROM NOW() - INTERVAL '1 day' * days);
+    DELETE FROM metric_chunks WHERE chunk_end < NOW() - INTERVAL '1 day' * days;
+    DELETE FROM service_states WHERE ended_at < NOW() - INTERVAL '1 day' * days;
+    DELETE FROM ospf_states WHERE ended_at < NOW() - INTERVAL '1 day' * days;
 END;
 $$ LANGUAGE plpgsql;
 
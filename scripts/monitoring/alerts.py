@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Alert Engine
+Keeps one alerts row per incident, updated while it lasts and resolved when it clears
+"""
+
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from storage import Storage
+
+
+class AlertEngine:
+    """State machine of the open alert incidents, keyed by (hostname, type)
+
+    A condition that appears opens an incident (one alerts row). While it
+    holds, the same row is updated in place: last_seen, message and
+    severity (a severity change makes it due for notification again).
+    Once a check no longer reports it the row is resolved. Only the types
+    a check actually evaluated are resolved, so e.g. a node that is down
+    doesn't resolve its high_disk alert for lack of a disk reading.
+
+    A node's open incidents are loaded from the database when this
+    process checks it for the first time in stale_after seconds. Another
+    worker may have checked it meanwhile (a node that pushed its metrics,
+    then is polled again by its shard owner), so incidents cached from an
+    earlier stretch are not trusted. The cost of a check is proportional
+    to the node's active conditions, never to the alert history. Changes
+    are queued and written by BatchWriter.flush in the same transaction
+    as the metrics (see Storage._apply_alerts).
+    """
+
+    def __init__(self, storage: Storage, stale_after: float = 300):
+        self.storage = storage
+        self.stale_after = stale_after
+        # hostname -> type -> {'severity', 'message'} of each open incident
+        self._active: Dict[str, Dict[str, Dict]] = {}
+        # hostname -> time.monotonic() of its last check
+        self._checked: Dict[str, float] = {}
+        self._changes: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def _host(self, hostname: str) -> Dict[str, Dict]:
+        """Open incidents of hostname, reloaded if not checked lately"""
+        now = time.monotonic()
+        last = self._checked.get(hostname)
+        self._checked[hostname] = now
+        if last is None or now - last > self.stale_after:
+            self._active[hostname] = {
+                row['alert_type']: {'severity': row['severity'], 'message': row['message']}
+                for row in self.storage.query(
+                    'SELECT alert_type, severity, message FROM alerts WHERE hostname = ? AND resolved = ?',
+                    (hostname, False)
+                )
+            }
+        return self._active[hostname]
+
+    def incidents(self, hostname: str) -> Dict[str, Dict]:
+        """type -> {'severity', 'message'} of the open incidents of hostname"""
+        with self._lock:
+            return dict(self._host(hostname))
+
+    def evaluate(self, hostname: str, alerts: List[Dict], checked: Iterable[str],
+                 timestamp: Optional[datetime] = None) -> Dict[str, List[Dict]]:
+        """Apply the outcome of one check of a node
+
+        alerts are the conditions that hold now (severity, type, message
+        and optionally suppressed_by),
+        checked the alert types the check evaluated. Returns the alerts
+        that were opened, changed severity and resolved by this check.
+        """
+        timestamp = timestamp or datetime.now()
+        events = {'opened': [], 'changed': [], 'resolved': []}
+        current = {alert['type']: alert for alert in alerts}
+
+        with self._lock:
+            active = self._host(hostname)
+
+            for alert_type, alert in current.items():
+                key = (hostname, alert_type)
+                state = {'severity': alert['severity'], 'message': alert['message']}
+                row = (timestamp, hostname, alert['severity'], alert_type, alert['message'], timestamp,
+                       alert.get('suppressed_by'))
+                previous = active.get(alert_type)
+                active[alert_type] = state
+                if previous is None:
+                    events['opened'].append(alert)
+                    self._changes.append(('open', key, row))
+                    continue
+                if previous['severity'] != state['severity']:
+                    events['changed'].append(alert)
+                self._changes.append(('update', key, row))
+
+            for alert_type in set(checked) - set(current):
+                key = (hostname, alert_type)
+                if active.pop(alert_type, None) is not None:
+                    events['resolved'].append({'type': alert_type, 'hostname': hostname})
+                    self._changes.append(('resolve', key, timestamp))
+
+        return events
+
+    def active(self) -> int:
+        with self._lock:
+            return sum(len(incidents) for incidents in self._active.values())
+
+    def take(self) -> List[tuple]:
+        """Queued (action, key, row or timestamp) changes, oldest first"""
+        with self._lock:
+            changes, self._changes = self._changes, []
+        return changes
+
+    def reset(self):
+        """Forget the known incidents (after a failed write); reloaded on next use"""
+        with self._lock:
+            self._active = {}
+            self._checked = {}
@@ -0,0 +1,373 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Collection Benchmark
+Runs collection cycles against a simulated fleet of local SSH nodes
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import paramiko
+import yaml
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent))
+
+from mesh_monitor import MeshMonitor, SERVICES
+from probe import build_probe_script
+from procfs import PROCFS_COMMAND
+
+SSH_PORT = 2222
+
+
+def node_address(index: int) -> str:
+    """Loopback address for simulated node `index` (127.0.0.0/8 is all local)"""
+    return f'127.0.{index // 250}.{index % 250 + 2}'
+
+
+class FakeNode:
+    """State and canned command output for one simulated node"""
+
+    def __init__(self, index: int):
+        self.hostname = f'bench-{index}'
+        self.cpu_total = random.randint(10 ** 6, 10 ** 7)
+        self.cpu_idle = int(self.cpu_total * 0.9)
+        self.lock = threading.Lock()
+
+    def _tick(self):
+        with self.lock:
+            used = random.randint(5, 60)
+            self.cpu_total += 100
+            self.cpu_idle += 100 - used
+            return self.cpu_total, self.cpu_idle
+
+    def cpu_line(self) -> str:
+        total, idle = self._tick()
+        busy = total - idle
+        return f'cpu  {busy} 0 0 {idle} 0 0 0 0 0 0'
+
+    def respond(self, command: str, probe_script: str) -> str:
+        ospf = {'neighbors': {'10.0.0.1': {'address': '169.254.1.1', 'state': 'Full/DR'}}}
+        if command == probe_script:
+            return json.dumps({
+                'cpu_stat': self.cpu_line(),
+                'memory_percent': round(random.uniform(20, 60), 1),
+                'disk_percent': random.randint(10, 50),
+                'uptime_seconds': 86400,
+                'services': {service: 'active' for service in SERVICES},
+                'ospf': ospf
+            }) + '\n'
+        if command == PROCFS_COMMAND:
+            return (f'{self.cpu_line()}\n'
+                    'MemTotal:        1000000 kB\n'
+                    'MemAvailable:     600000 kB\n'
+                    '86400.00 170000.00\n'
+                    'statvfs 4096 1000000 700000 650000\n')
+        if command.startswith('systemctl is-active'):
+            return 'active\n'
+        if 'vtysh' in command:
+            return json.dumps(ospf) + '\n'
+        return ''
+
+
+class FakeNodeServer(paramiko.ServerInterface):
+    """Accepts any public key and answers exec requests from a FakeNode"""
+
+    def __init__(self, node: FakeNode, options: Dict):
+        self.node = node
+        self.options = options
+
+    def check_auth_publickey(self, username, key):
+        return paramiko.AUTH_SUCCESSFUL
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=self._run, args=(channel, command.decode('utf-8')), daemon=True).start()
+        return True
+
+    def _run(self, channel, command: str):
+        latency = self.options['latency_ms'] / 1000.0
+        jitter = self.options['jitter_ms'] / 1000.0
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+        try:
+            if random.random() < self.options['failure_rate']:
+                channel.send_exit_status(1)
+            else:
+                channel.sendall(self.node.respond(command, self.options['probe_script']).encode('utf-8'))
+                channel.send_exit_status(0)
+        except Exception:
+            pass
+        finally:
+            channel.close()
+
+
+def _serve_connection(sock: socket.socket, node: FakeNode, host_key, options: Dict):
+    transport = paramiko.Transport(sock)
+    transport.add_server_key(host_key)
+    try:
+        transport.start_server(server=FakeNodeServer(node, options))
+    except Exception:
+        transport.close()
+        return
+    # Exec requests are answered from check_channel_exec_request; accepted
+    # channels are only held here so they aren't closed when collected
+    channels = []
+    while transport.is_active():
+        channel = transport.accept(timeout=1)
+        channels = [c for c in channels if not c.closed]
+        if channel is not None:
+            channels.append(channel)
+
+
+def _serve_node(index: int, host_key, options: Dict, dead: bool, ready):
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((node_address(index), SSH_PORT))
+    listener.listen(16)
+    ready.release()
+
+    node = FakeNode(index)
+    while True:
+        sock, _ = listener.accept()
+        if dead:
+            # Accept the TCP connection but never speak SSH
+            continue
+        threading.Thread(
+            target=_serve_connection,
+            args=(sock, node, host_key, options),
+            daemon=True
+        ).start()
+
+
+def run_fleet(count: int, options: Dict, started):
+    """Serve `count` fake nodes from this (separate) process"""
+    # Reachability sweeps open and drop TCP connections; don't log those
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    host_key = paramiko.RSAKey.generate(2048)
+    dead = set(random.sample(range(count), int(count * options['dead_rate'])))
+    ready = threading.Semaphore(0)
+
+    for index in range(count):
+        threading.Thread(
+            target=_serve_node,
+            args=(index, host_key, options, index in dead, ready),
+            daemon=True
+        ).start()
+    for _ in range(count):
+        ready.acquire()
+
+    started.set()
+    while True:
+        time.sleep(3600)
+
+
+class BenchMonitor(MeshMonitor):
+    """MeshMonitor that records how long each collection phase takes"""
+
+    def __init__(self, config_file: str):
+        self.timings = {'sweep': [], 'ssh': [], 'node': [], 'store': []}
+        self._timings_lock = threading.Lock()
+        super().__init__(config_file)
+
+    def _timed(self, phase: str, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._timings_lock:
+                self.timings[phase].append(time.perf_counter() - start)
+
+    def sweep_reachability(self, nodes):
+        return self._timed('sweep', super().sweep_reachability, nodes)
+
+    def ssh_execute(self, ip, command):
+        return self._timed('ssh', super().ssh_execute, ip, command)
+
+    def collect_node_metrics(self, node, reachability=None):
+        return self._timed('node', super().collect_node_metrics, node, reachability)
+
+    def store_batch(self, batch):
+        return self._timed('store', super().store_batch, batch)
+
+
+def percentiles(values: List[float]) -> Dict:
+    if not values:
+        return {'p50': None, 'p95': None, 'p99': None, 'max': None}
+    values = sorted(values)
+
+    def pick(fraction):
+        return values[min(len(values) - 1, int(fraction * len(values)))] * 1000
+
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': values[-1] * 1000}
+
+
+def benchmark(count: int, args, workdir: str) -> Dict:
+    """Start a fleet of `count` nodes, run the cycles and summarize"""
+    key_file = os.path.join(workdir, 'id_rsa')
+    if not os.path.exists(key_file):
+        paramiko.RSAKey.generate(2048).write_private_key_file(key_file)
+
+    probe_script = build_probe_script(SERVICES)
+    options = {
+        'latency_ms': args.latency_ms,
+        'jitter_ms': args.jitter_ms,
+        'failure_rate': args.failure_rate,
+        'dead_rate': args.dead_rate,
+        'probe_script': probe_script
+    }
+
+    started = multiprocessing.Event()
+    fleet = multiprocessing.Process(target=run_fleet, args=(count, options, started), daemon=True)
+    fleet.start()
+    if not started.wait(timeout=120):
+        fleet.terminate()
+        raise RuntimeError("Simulated fleet did not start")
+
+    config = {
+        'network': {
+            'auto_discovery': False,
+            'nodes': [
+                {'hostname': f'bench-{i}', 'ip': node_address(i), 'type': 'mesh-router'}
+                for i in range(count)
+            ]
+        },
+        'monitoring': {
+            'interval': args.interval,
+            'timeout': args.timeout,
+            'ssh_user': 'bench',
+            'ssh_key': key_file,
+            'ssh_port': SSH_PORT,
+            'collection_mode': args.mode,
+            'reachability_method': 'tcp',
+            'ping_timeout': args.timeout,
+            'max_concurrency': args.concurrency,
+            'node_deadline': args.node_deadline,
+            'cycle_deadline': args.interval
+        },
+        'database': {
+            'type': 'sqlite',
+            'path': os.path.join(workdir, f'metrics-{count}.db')
+        }
+    }
+    config_file = os.path.join(workdir, f'config-{count}.yml')
+    with open(config_file, 'w') as f:
+        yaml.safe_dump(config, f)
+
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+
+    try:
+        monitor = BenchMonitor(config_file)
+        nodes = monitor.discover_nodes()
+        cycle_times = []
+        statuses = []
+
+        cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+        for _ in range(args.cycles):
+            start = time.perf_counter()
+            sys.stdout = devnull
+            try:
+                results = monitor.collect_nodes(nodes)
+            finally:
+                sys.stdout = stdout
+            cycle_times.append(time.perf_counter() - start)
+            statuses.extend(m.get('status') if m else 'failed' for m in results)
+        cpu_end = resource.getrusage(resource.RUSAGE_SELF)
+
+        cpu_seconds = ((cpu_end.ru_utime - cpu_start.ru_utime) +
+                       (cpu_end.ru_stime - cpu_start.ru_stime))
+        pool = monitor.ssh_pool.stats()
+        monitor.ssh_pool.close_all()
+        monitor.storage.close()
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+        fleet.terminate()
+        fleet.join(timeout=5)
+
+    return {
+        'nodes': count,
+        'cycles': args.cycles,
+        'mode': args.mode,
+        'cycle_ms': percentiles(cycle_times),
+        'phases_ms': {phase: percentiles(values) for phase, values in monitor.timings.items()},
+        'cpu_ms_per_node_cycle': cpu_seconds * 1000 / (count * args.cycles),
+        'statuses': {status: statuses.count(status) for status in sorted(set(statuses))},
+        'ssh_pool': pool
+    }
+
+
+def print_report(result: Dict):
+    def fmt(value):
+        return '     -' if value is None else f'{value:8.1f}'
+
+    print(f"\n=== {result['nodes']} nodes, {result['cycles']} cycles, mode={result['mode']} ===")
+    print(f"{'phase':10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    rows = [('cycle', result['cycle_ms'])] + list(result['phases_ms'].items())
+    for name, stats in rows:
+        print(f"{name:10} {fmt(stats['p50'])} {fmt(stats['p95'])} {fmt(stats['p99'])} {fmt(stats['max'])}")
+
+    pool = result['ssh_pool']
+    print(f"CPU per node per cycle: {result['cpu_ms_per_node_cycle']:.2f} ms")
+    print(f"Results: {', '.join(f'{k}={v}' for k, v in result['statuses'].items())}")
+    print(f"SSH pool: {pool['handshakes']} handshakes, {pool['reuses']} reuses "
+          f"({pool['reuse_ratio']:.0%} reuse), {pool['failures']} failures")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the collection path against simulated nodes')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 50, 200],
+                        help='Fleet sizes to benchmark')
+    parser.add_argument('--cycles', type=int, default=5, help='Collection cycles per fleet size')
+    parser.add_argument('--mode', choices=['probe', 'commands'], default='probe',
+                        help='monitoring.collection_mode to benchmark')
+    parser.add_argument('--latency-ms', type=float, default=20, help='Simulated per-command latency')
+    parser.add_argument('--jitter-ms', type=float, default=5, help='Random +/- latency jitter')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Probability that a command fails')
+    parser.add_argument('--dead-rate', type=float, default=0.0,
+                        help='Fraction of nodes that accept TCP but never answer SSH')
+    parser.add_argument('--concurrency', type=int, default=16, help='monitoring.max_concurrency')
+    parser.add_argument('--timeout', type=float, default=5, help='monitoring.timeout')
+    parser.add_argument('--node-deadline', type=float, default=20, help='monitoring.node_deadline')
+    parser.add_argument('--interval', type=float, default=60, help='Cycle deadline in seconds')
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    # Timed-out handshakes against dead nodes are expected here
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='mesh-bench-') as workdir:
+        for count in args.nodes:
+            result = benchmark(count, args, workdir)
+            results.append(result)
+            if not args.json:
+                print_report(result)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Compressed Metric Chunks
+Gorilla-style encoding of per-host metric samples (database.metrics_format: chunks)
+"""
+
+import math
+import struct
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Sample values stored in a chunk, in order
+FIELDS = ('cpu_percent', 'memory_percent', 'disk_percent', 'uptime_seconds')
+
+CHUNK_SECONDS = 3600
+EPOCH = datetime(1970, 1, 1)
+
+# Delta-of-delta timestamp buckets: (prefix, prefix bits, value bits)
+DOD_BUCKETS = [
+    (0b10, 2, 7),
+    (0b110, 3, 9),
+    (0b1110, 4, 12)
+]
+
+
+def to_seconds(timestamp: datetime) -> int:
+    """Naive datetime -> whole seconds since EPOCH (chunks store 1 s resolution)"""
+    return int((timestamp - EPOCH).total_seconds())
+
+
+def from_seconds(seconds: int) -> datetime:
+    return EPOCH + timedelta(seconds=seconds)
+
+
+def _float_bits(value) -> int:
+    if value is None:
+        value = math.nan
+    return struct.unpack('>Q', struct.pack('>d', float(value)))[0]
+
+
+def _bits_float(bits: int) -> Optional[float]:
+    value = struct.unpack('>d', struct.pack('>Q', bits))[0]
+    return None if math.isnan(value) else value
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.length = 0
+
+    def write(self, bits: int, count: int):
+        self.value = (self.value << count) | (bits & ((1 << count) - 1))
+        self.length += count
+
+    def getvalue(self) -> bytes:
+        padding = -self.length % 8
+        return (self.value << padding).to_bytes((self.length + padding) // 8, 'big')
+
+
+class BitReader:
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, 'big')
+        self.length = len(data) * 8
+        self.position = 0
+
+    def read(self, count: int) -> int:
+        self.position += count
+        return (self.value >> (self.length - self.position)) & ((1 << count) - 1)
+
+
+class _XorState:
+    """Previous value and leading/trailing zero window of one float stream"""
+
+    def __init__(self, bits: int):
+        self.previous = bits
+        self.leading = -1
+        self.trailing = 0
+
+
+def _write_value(writer: BitWriter, state: _XorState, bits: int):
+    xor = bits ^ state.previous
+    state.previous = bits
+    if xor == 0:
+        writer.write(0, 1)
+        return
+
+    leading = min(64 - xor.bit_length(), 31)
+    trailing = (xor & -xor).bit_length() - 1
+    if state.leading >= 0 and leading >= state.leading and trailing >= state.trailing:
+        # Fits the previous window: only the meaningful bits
+        writer.write(0b10, 2)
+        writer.write(xor >> state.trailing, 64 - state.leading - state.trailing)
+    else:
+        meaningful = 64 - leading - trailing
+        writer.write(0b11, 2)
+        writer.write(leading, 5)
+        writer.write(meaningful % 64, 6)
+        writer.write(xor >> trailing, meaningful)
+        state.leading, state.trailing = leading, trailing
+
+
+def _read_value(reader: BitReader, state: _XorState) -> int:
+    if reader.read(1) == 0:
+        return state.previous
+    if reader.read(1) == 1:
+        state.leading = reader.read(5)
+        meaningful = reader.read(6) or 64
+        state.trailing = 64 - state.leading - meaningful
+    meaningful = 64 - state.leading - state.trailing
+    state.previous ^= reader.read(meaningful) << state.trailing
+    return state.previous
+
+
+def encode_chunk(samples: List[Tuple[int, tuple]]) -> bytes:
+    """Encode (seconds, values) samples; values line up with FIELDS
+
+    Layout: sample count (32 bits), first timestamp (64), first values
+    (64 each), then per sample a delta-of-delta timestamp and one XOR
+    coded value per field.
+    """
+    writer = BitWriter()
+    writer.write(len(samples), 32)
+    if not samples:
+        return writer.getvalue()
+
+    first_time, first_values = samples[0]
+    writer.write(first_time, 64)
+    states = []
+    for value in first_values:
+        bits = _float_bits(value)
+        writer.write(bits, 64)
+        states.append(_XorState(bits))
+
+    previous_time, previous_delta = first_time, 0
+    for timestamp, values in samples[1:]:
+        delta = timestamp - previous_time
+        dod = delta - previous_delta
+        previous_time, previous_delta = timestamp, delta
+
+        if dod == 0:
+            writer.write(0, 1)
+        else:
+            for prefix, prefix_bits, value_bits in DOD_BUCKETS:
+                if -(1 << (value_bits - 1)) <= dod < (1 << (value_bits - 1)):
+                    writer.write(prefix, prefix_bits)
+                    writer.write(dod, value_bits)
+                    break
+            else:
+                writer.write(0b1111, 4)
+                writer.write(dod, 32)
+
+        for state, value in zip(states, values):
+            _write_value(writer, state, _float_bits(value))
+
+    return writer.getvalue()
+
+
+def _signed(value: int, bits: int) -> int:
+    return value - (1 << bits) if value >= (1 << (bits - 1)) else value
+
+
+def decode_chunk(data: bytes) -> Iterator[Tuple[int, tuple]]:
+    """Yield (seconds, values) samples one at a time"""
+    reader = BitReader(bytes(data))
+    count = reader.read(32)
+    if not count:
+        return
+
+    timestamp = reader.read(64)
+    states = [_XorState(reader.read(64)) for _ in FIELDS]
+    yield timestamp, tuple(_bits_float(state.previous) for state in states)
+
+    delta = 0
+    for _ in range(count - 1):
+        if reader.read(1) == 0:
+            dod = 0
+        else:
+            for _prefix, prefix_bits, value_bits in DOD_BUCKETS:
+                if prefix_bits == 4 or reader.read(1) == 0:
+                    break
+            if prefix_bits == 4 and reader.read(1) == 1:
+                dod = _signed(reader.read(32), 32)
+            else:
+                dod = _signed(reader.read(value_bits), value_bits)
+        delta += dod
+        timestamp += delta
+        yield timestamp, tuple(_bits_float(_read_value(reader, state)) for state in states)
+
+
+def chunk_row(hostname: str, samples: List[Tuple[int, tuple]], sealed: bool) -> tuple:
+    """metric_chunks row (see storage.COLUMNS) for samples of one host"""
+    start = samples[0][0] // CHUNK_SECONDS * CHUNK_SECONDS if sealed else samples[0][0]
+    return (
+        hostname,
+        from_seconds(start),
+        from_seconds(samples[-1][0]),
+        len(samples),
+        encode_chunk(samples),
+        sealed
+    )
+
+
+class ChunkBuffer:
+    """Per-host samples waiting to be written as a chunk segment
+
+    Samples are held in memory and written as one small segment per host
+    every flush_interval seconds (or when the hour changes), instead of
+    one row per sample. Up to flush_interval seconds of samples are lost
+    if the collector dies. Segments of a finished hour are later merged
+    into a single sealed chunk by compact_chunks().
+    """
+
+    def __init__(self, flush_interval: float = 300):
+        self.flush_interval = flush_interval
+        self._open: Dict[str, List[Tuple[int, tuple]]] = {}
+        self._ready: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def add(self, hostname: str, timestamp: datetime, values: tuple):
+        seconds = to_seconds(timestamp)
+        with self._lock:
+            samples = self._open.setdefault(hostname, [])
+            # Segments never span two chunk hours
+            if samples and samples[0][0] // CHUNK_SECONDS != seconds // CHUNK_SECONDS:
+                self._ready.append(chunk_row(hostname, samples, sealed=False))
+                samples = self._open[hostname] = []
+            samples.append((seconds, tuple(values)))
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(samples) for samples in self._open.values()) + len(self._ready)
+
+    def take(self, now: Optional[datetime] = None, force: bool = False) -> List[tuple]:
+        """Segment rows that are due for writing"""
+        cutoff = to_seconds(now or datetime.now()) - self.flush_interval
+        with self._lock:
+            rows, self._ready = self._ready, []
+            for hostname in list(self._open):
+                samples = self._open[hostname]
+                if force or samples[0][0] <= cutoff:
+                    rows.append(chunk_row(hostname, samples, sealed=False))
+                    del self._open[hostname]
+        return rows
+
+
+def create_chunk_buffer(config: dict) -> Optional[ChunkBuffer]:
+    """ChunkBuffer when database.metrics_format is 'chunks', else None"""
+    database = config.get('database') or {}
+    if database.get('metrics_format', 'rows') != 'chunks':
+        return None
+    return ChunkBuffer(flush_interval=database.get('chunk_flush_interval', 300))
+
+
+def _parse_time(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def read_metrics(storage, since: datetime, until: Optional[datetime] = None,
+                 hostname: Optional[str] = None) -> List[Dict]:
+    """Samples in [since, until) as metrics-table style dicts, oldest first
+
+    Only chunks overlapping the range are fetched, and each is decoded
+    sample by sample, stopping once past the range.
+    """
+    until = until or datetime.now() + timedelta(days=1)
+    statement = 'SELECT hostname, data FROM metric_chunks WHERE chunk_end >= ? AND chunk_start < ?'
+    params = [since, until]
+    if hostname is not None:
+        statement += ' AND hostname = ?'
+        params.append(hostname)
+
+    start, end = to_seconds(since), to_seconds(until)
+    rows = []
+    for chunk in storage.query(statement, tuple(params)):
+        for seconds, values in decode_chunk(chunk['data']):
+            if seconds >= end:
+                break
+            if seconds >= start:
+                row = {'hostname': chunk['hostname'], 'timestamp': from_seconds(seconds)}
+                row.update(zip(FIELDS, values))
+                if row['uptime_seconds'] is not None:
+                    row['uptime_seconds'] = int(row['uptime_seconds'])
+                rows.append(row)
+
+    rows.sort(key=lambda row: (row['timestamp'], row['hostname']))
+    return rows
+
+
+def compact_chunks(storage, before: datetime) -> int:
+    """Merge the segments of each finished hour into one sealed chunk
+
+    Segments (and any sealed chunk already written for the same hour, if
+    late segments arrived) are decoded, merged in time order and written
+    back as one chunk per host and hour. Returns the chunks written.
+    """
+    with storage.transaction() as cursor:
+        cursor.execute(
+            storage.sql('SELECT hostname, chunk_start, data FROM metric_chunks WHERE sealed = ? AND chunk_start < ?'),
+            (False, before)
+        )
+        segments = [dict(row) for row in cursor.fetchall()]
+        if not segments:
+            return 0
+
+        hours: Dict[Tuple[str, int], List[Tuple[int, tuple]]] = {}
+        for segment in segments:
+            start = to_seconds(_parse_time(segment['chunk_start']))
+            key = (segment['hostname'], start // CHUNK_SECONDS * CHUNK_SECONDS)
+            hours.setdefault(key, []).extend(decode_chunk(segment['data']))
+
+        for (hostname, hour), samples in hours.items():
+            cursor.execute(
+                storage.sql('SELECT data FROM metric_chunks WHERE hostname = ? AND chunk_start = ? AND sealed = ?'),
+                (hostname, from_seconds(hour), True)
+            )
+            existing = cursor.fetchone()
+            if existing:
+                samples.extend(decode_chunk(existing['data']))
+
+        cursor.executemany(
+            storage.sql('DELETE FROM metric_chunks WHERE hostname = ? AND chunk_start = ? AND sealed = ?'),
+            [(segment['hostname'], segment['chunk_start'], False) for segment in segments] +
+            [(hostname, from_seconds(hour), True) for hostname, hour in hours]
+        )
+
+        rows = []
+        for (hostname, _hour), samples in hours.items():
+            samples.sort(key=lambda sample: sample[0])
+            rows.append(chunk_row(hostname, samples, sealed=True))
+        cursor.executemany(
+            storage.sql('INSERT INTO metric_chunks (hostname, chunk_start, chunk_end, samples, data, sealed) '
+                        'VALUES (?, ?, ?, ?, ?, ?)'),
+            rows
+        )
+    return len(rows)
@@ -4,116 +4,302 @@ Mesh Network Monitor - Metrics Collector Daemon
 Continuously collects metrics and generates alerts
 """
 
+import argparse
+import multiprocessing
 import sys
 import time
+from datetime import datetime
 from pathlib import Path
+from typing import Dict, Optional
+
+import yaml
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from mesh_monitor import MeshMonitor
-from notifications import NotificationManager
+from mesh_monitor import MeshMonitor, CONFIG_FILE
+from notifications import NotificationManager, NotificationDispatcher
+from ingest import PushListener
+from node_registry import NodeRegistry
+from scheduler import CollectionScheduler
+from sharding import ShardMap
+from rollups import RollupManager
+from maintenance import Maintenance
+from storage import parse_timestamp
 
 
-def main():
-    print("Starting Mesh Network Monitor Collector...")
+def start_push_listener(config: dict, registry: NodeRegistry):
+    """Start the push ingestion listener if enabled in config"""
+    push_config = config.get('push', {})
+    if not push_config.get('enabled', False):
+        return None
+
+    listener = PushListener(
+        registry,
+        listen=push_config.get('listen', '0.0.0.0'),
+        port=push_config.get('port', 9110),
+        token=push_config.get('token'),
+        max_queue=push_config.get('max_queue', 10000)
+    )
+    listener.start()
+    return listener
+
+
+def wait_and_ingest(monitor: MeshMonitor, listener, seconds: float) -> int:
+    """Sleep until the next collection, draining pushed metrics in batches
+
+    Returns the number of pushed payloads ingested while waiting.
+    """
+    if listener is None:
+        time.sleep(seconds)
+        return 0
+
+    batch_interval = monitor.config.get('push', {}).get('batch_interval', 5)
+    deadline = time.monotonic() + seconds
+    ingested = 0
+    while True:
+        batch = listener.drain()
+        if batch:
+            alert_count = monitor.ingest(batch)
+            ingested += len(batch)
+            print(f"Ingested {len(batch)} pushed payload(s), {alert_count} alert(s)")
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        time.sleep(min(batch_interval, remaining))
+
+    return ingested
+
+
+def collect_due(monitor: MeshMonitor, scheduler: CollectionScheduler, worker: int = 0) -> int:
+    """Poll the nodes that are due and schedule their next poll
+
+    pop_due takes the nodes off the schedule and only record() puts them
+    back, so they are rescheduled (as failed, i.e. backed off) even when
+    the cycle raises, e.g. because the database is locked while storing
+    the batch. Returns the number of nodes polled.
+    """
+    due = scheduler.pop_due()
+    if not due:
+        return 0
+
+    print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] [worker {worker}] "
+          f"Collecting metrics from {len(due)} node(s)...")
+    results = []
+    try:
+        results = monitor.collect_nodes(due)
+    finally:
+        for index, node in enumerate(due):
+            scheduler.record(node, results[index] if index < len(results) else None)
+    return len(due)
+
+
+def notification_alert(alert_row: Dict) -> Dict:
+    """Alert dict for the notifiers from an alerts row
+
+    The timestamp is ISO text: PostgreSQL returns a datetime, which the
+    webhook and Discord payloads could not JSON-encode.
+    """
+    return {
+        'id': alert_row['id'],
+        'timestamp': parse_timestamp(alert_row['timestamp']).isoformat(),
+        'hostname': alert_row['hostname'],
+        'severity': alert_row['severity'],
+        'type': alert_row['alert_type'],
+        'message': alert_row['message']
+    }
+
+
+def send_notifications(monitor: MeshMonitor, dispatcher: NotificationDispatcher):
+    """Queue notifications for open incidents not notified yet
+
+    That is incidents just opened and those whose severity changed
+    (AlertEngine clears notified_at then). Only open alerts are looked at;
+    alerts suppressed behind a root cause wait until that is lifted.
+    Delivery, with retries, happens in the dispatcher's threads; see
+    report_notifications for the outcome.
+    """
+    pending = monitor.storage.query('''
+        SELECT id, timestamp, hostname, severity, alert_type, message
+        FROM alerts
+        WHERE resolved = ? AND notified_at IS NULL AND suppressed_by IS NULL
+        ORDER BY timestamp
+    ''', (False,))
+
+    for alert_row in pending:
+        alert = notification_alert(alert_row)
+        print(f"  🔔 New alert: {alert['severity'].upper()} - {alert['hostname']} - {alert['type']}")
+        dispatcher.submit(alert)
+
+    if pending:
+        # Handed to the dispatcher; each incident is notified once. One
+        # transaction for the whole batch, however many alerts it holds.
+        notified_at = datetime.now()
+        with monitor.storage.transaction() as cursor:
+            cursor.executemany(
+                monitor.storage.sql('UPDATE alerts SET notified_at = ? WHERE id = ?'),
+                [(notified_at, alert_row['id']) for alert_row in pending]
+            )
+
 
+def report_notifications(dispatcher: NotificationDispatcher):
+    """Log the notifications the dispatcher finished since the last call"""
+    for alerts, channel, success, attempts in dispatcher.results():
+        if len(alerts) == 1:
+            label = f"{alerts[0]['hostname']} - {alerts[0]['type']}"
+        else:
+            label = f"digest of {len(alerts)} alerts"
+        if success:
+            print(f"    ✓ {channel} notification sent ({label})")
+        else:
+            print(f"    ✗ {channel} notification failed after {attempts} attempt(s) ({label})")
+
+
+def load_config(config_file: str = CONFIG_FILE) -> dict:
+    """Load the config before any worker (and its MeshMonitor) is started"""
+    with open(config_file, 'r') as f:
+        return yaml.safe_load(f)
+
+
+def run_collector(worker: int = 0, shards: Optional[ShardMap] = None, shared=None):
+    """Collection loop for one worker process
+
+    Only nodes owned by this worker (see ShardMap) are polled. Worker 0
+    runs the push listener and shares the set of pushing nodes with the
+    other workers through `shared`. Worker 0 of the first instance in
+    sharding.instances also sends notifications, maintains rollups and
+    runs database maintenance (in a background thread), so that work
+    happens only once.
+    """
     monitor = MeshMonitor()
-    notifier = NotificationManager(monitor.config)
+    scheduler = CollectionScheduler(monitor.config)
+    listener = start_push_listener(monitor.config, monitor.registry) if worker == 0 else None
+
+    # Notifications, rollups and retention run once per deployment
+    dispatcher = None
+    rollups = None
+    maintenance = None
+    if worker == 0 and (shards is None or shards.instance == shards.instances[0]):
+        dispatcher = NotificationDispatcher(NotificationManager(monitor.config), monitor.config)
+        dispatcher.start()
+        rollups = RollupManager(monitor.storage, monitor.config)
+        maintenance = Maintenance(monitor.storage, monitor.config)
+        maintenance.start()
 
-    # Track sent alerts to avoid duplicates
-    sent_alerts = set()
+    monitoring = monitor.config.get('monitoring', {})
+    interval = monitoring.get('interval', 30)
+    discovery_interval = monitoring.get('discovery_interval', interval)
+    stale_after = monitor.config.get('push', {}).get('stale_after', 3 * interval)
+    next_discovery = 0.0
+    next_rollup = 0.0
 
     while True:
         try:
-            print(f"\n[{time.strftime('%Y-%m-%d %H:%M:%S')}] Collecting metrics...")
-
-            # Collect from all nodes
-            monitor.collect_all()
-
-            # Get new unresolved alerts
-            cursor = monitor.db.cursor()
-            cursor.execute('''
-                SELECT id, timestamp, hostname, severity, alert_type, message
-                FROM alerts
-                WHERE resolved = 0
-                AND id NOT IN (
-                    SELECT alert_id FROM sent_notifications
-                )
-                ORDER BY timestamp DESC
-            ''')
-
-            new_alerts = cursor.fetchall()
-
-            # Send notifications for new alerts
-            for alert_row in new_alerts:
-                alert_id, timestamp, hostname, severity, alert_type, message = alert_row
-
-                alert_key = f"{hostname}:{alert_type}:{severity}"
-
-                # Avoid duplicate notifications
-                if alert_key not in sent_alerts:
-                    alert = {
-                        'id': alert_id,
-                        'timestamp': timestamp,
-                        'hostname': hostname,
-                        'severity': severity,
-                        'type': alert_type,
-                        'message': message
-                    }
-
-                    print(f"  🔔 New alert: {severity.upper()} - {hostname} - {alert_type}")
-
-                    # Send notifications
-                    results = notifier.send_alert(alert)
-
-                    # Track sent notifications
-                    sent_alerts.add(alert_key)
-
-                    # Log notification results
-                    for channel, success in results:
-                        if success:
-                            print(f"    ✓ {channel} notification sent")
-                        else:
-                            print(f"    ✗ {channel} notification failed")
-
-            # Clean up resolved alerts from tracking
-            cursor.execute('''
-                SELECT hostname, alert_type, severity
-                FROM alerts
-                WHERE resolved = 1
-            ''')
-            for row in cursor.fetchall():
-                alert_key = f"{row[0]}:{row[1]}:{row[2]}"
-                sent_alerts.discard(alert_key)
-
-            # Sleep until next collection interval
-            interval = monitor.config.get('monitoring', {}).get('interval', 30)
-            print(f"Waiting {interval} seconds until next collection...")
-            time.sleep(interval)
+            # Refresh the node list, leaving out nodes that push their own
+            # metrics and nodes owned by other workers
+            if time.monotonic() >= next_discovery:
+                nodes = monitor.discover_nodes()
+
+                pushing = set()
+                if listener is not None:
+                    pushing = listener.recent_sources(stale_after)
+                    if shared is not None:
+                        shared['pushing'] = list(pushing)
+                elif shared is not None:
+                    pushing = set(shared.get('pushing', []))
+
+                nodes = [
+                    node for node in nodes
+                    if node['ip'] not in pushing
+                    and (shards is None or shards.owns(node['ip'], worker))
+                ]
+                for node in scheduler.update_nodes(nodes):
+                    # No longer polled here (gone, pushing or moved to
+                    # another worker); a later poll starts a new baseline
+                    monitor.cpu_tracker.forget(node['hostname'])
+                next_discovery = time.monotonic() + discovery_interval
+                print(f"[worker {worker}] Scheduling {len(scheduler)} nodes")
+
+            collect_due(monitor, scheduler, worker)
+
+            if dispatcher is not None:
+                send_notifications(monitor, dispatcher)
+                report_notifications(dispatcher)
+
+            if rollups is not None and time.monotonic() >= next_rollup:
+                rollups.run()
+                next_rollup = time.monotonic() + rollups.interval
+
+            # Sleep until the next node is due or discovery runs again
+            wake = min(scheduler.next_due() or next_discovery, next_discovery)
+            wait_and_ingest(monitor, listener, max(wake - time.monotonic(), 0.1))
 
         except KeyboardInterrupt:
-            print("\nShutting down collector...")
+            print(f"\n[worker {worker}] Shutting down collector...")
             break
         except Exception as e:
-            print(f"Error in collector loop: {e}")
+            print(f"[worker {worker}] Error in collector loop: {e}")
             time.sleep(10)
 
-    monitor.db.close()
+    if listener is not None:
+        listener.stop()
+    if maintenance is not None:
+        maintenance.stop()
+    if dispatcher is not None:
+        dispatcher.stop()
+        report_notifications(dispatcher)
+    monitor.ssh_pool.close_all()
+    # Write out chunk segments still held in memory
+    monitor.writer.flush(final=True)
+    monitor.storage.close()
 
 
-if __name__ == '__main__':
-    # Create sent_notifications table if it doesn't exist
-    import sqlite3
-    db = sqlite3.connect('/var/lib/mesh-monitor/metrics.db')
-    cursor = db.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sent_notifications (
-            alert_id INTEGER PRIMARY KEY,
-            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    db.commit()
-    db.close()
+def main():
+    parser = argparse.ArgumentParser(description='Mesh Network Monitor Collector')
+    parser.add_argument('--workers', type=int,
+                        help='Worker processes for this instance (default: sharding.workers)')
+    parser.add_argument('--instance',
+                        help='Name of this instance in sharding.instances (default: hostname)')
+    args = parser.parse_args()
+
+    print("Starting Mesh Network Monitor Collector...")
+
+    config = load_config()
+    shards = ShardMap(config, instance=args.instance, workers=args.workers)
+
+    if not shards.enabled:
+        run_collector()
+        return
 
+    if shards.instance not in shards.instances:
+        print(f"Error: instance '{shards.instance}' is not listed in sharding.instances")
+        sys.exit(1)
+
+    print(f"Instance {shards.instance}: {shards.workers} worker(s), "
+          f"{len(shards.instances)} instance(s)")
+
+    shared = None
+    workers = []
+    if shards.workers > 1:
+        shared = multiprocessing.Manager().dict()
+        for worker in range(1, shards.workers):
+            process = multiprocessing.Process(
+                target=run_collector,
+                args=(worker, shards, shared),
+                name=f'collector-{worker}',
+                daemon=True
+            )
+            process.start()
+            workers.append(process)
+
+    try:
+        run_collector(0, shards, shared)
+    finally:
+        for process in workers:
+            process.terminate()
+            process.join(timeout=5)
+
+
+if __name__ == '__main__':
     main()
@@ -7,7 +7,6 @@ Flask-based web interface with real-time updates via WebSocket
 from flask import Flask, render_template, jsonify, request, session, redirect, url_for
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
-import sqlite3
 import yaml
 import json
 from datetime import datetime, timedelta
@@ -15,6 +14,10 @@ from pathlib import Path
 import threading
 import time
 
+from storage import create_storage, parse_timestamp
+from rollups import RollupManager
+from state_history import services_at, ospf_neighbors_at, state_changes
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'  # Will be overridden by config
 CORS(app)
@@ -31,11 +34,23 @@ dashboard_config = config.get('dashboard', {})
 app.config['SECRET_KEY'] = dashboard_config.get('secret_key', 'change-me')
 
 
-def get_db():
-    """Get database connection"""
-    db = sqlite3.connect(DB_FILE)
-    db.row_factory = sqlite3.Row
-    return db
+# SQLite (WAL mode, so reads don't block the collector) or PostgreSQL
+storage = create_storage(config, default_path=DB_FILE)
+rollups = RollupManager(storage, config)
+
+
+def with_text_timestamps(rows, columns=('timestamp',)):
+    """Rows with their timestamp columns as 'YYYY-MM-DD HH:MM:SS' text
+
+    PostgreSQL and the metric history return datetimes (which jsonify
+    would send as HTTP dates), SQLite returns text; every endpoint gives
+    them out in this one form.
+    """
+    return [
+        dict(row, **{column: parse_timestamp(row[column]).isoformat(sep=' ')
+                     for column in columns if row.get(column) is not None})
+        for row in rows
+    ]
 
 
 def require_auth(f):
@@ -86,24 +101,16 @@ def index():
 @require_auth
 def api_status():
     """Get overall network status"""
-    db = get_db()
-    cursor = db.cursor()
-
-    # Count nodes
-    cursor.execute('SELECT COUNT(*) as total FROM nodes')
-    total_nodes = cursor.fetchone()['total']
-
-    cursor.execute("SELECT COUNT(*) as online FROM nodes WHERE status = 'online'")
-    online_nodes = cursor.fetchone()['online']
+    total_nodes = storage.query_one('SELECT COUNT(*) as total FROM nodes')['total']
+    online_nodes = storage.query_one("SELECT COUNT(*) as online FROM nodes WHERE status = 'online'")['online']
 
     # Count alerts
-    cursor.execute("SELECT COUNT(*) as critical FROM alerts WHERE resolved = 0 AND severity = 'critical'")
-    critical_alerts = cursor.fetchone()['critical']
-
-    cursor.execute("SELECT COUNT(*) as warning FROM alerts WHERE resolved = 0 AND severity = 'warning'")
-    warning_alerts = cursor.fetchone()['warning']
-
-    db.close()
+    critical_alerts = storage.query_one(
+        "SELECT COUNT(*) as critical FROM alerts WHERE resolved = ? AND severity = 'critical'", (False,)
+    )['critical']
+    warning_alerts = storage.query_one(
+        "SELECT COUNT(*) as warning FROM alerts WHERE resolved = ? AND severity = 'warning'", (False,)
+    )['warning']
 
     return jsonify({
         'nodes': {
@@ -122,27 +129,16 @@ def api_status():
 @require_auth
 def api_nodes():
     """Get all nodes"""
-    db = get_db()
-    cursor = db.cursor()
-
-    cursor.execute('''
+    rows = with_text_timestamps(storage.query('''
         SELECT n.hostname, n.ip, n.type, n.status, n.last_seen,
-               m.cpu_percent, m.memory_percent, m.disk_percent, m.uptime_seconds
+               c.cpu_percent, c.memory_percent, c.disk_percent, c.uptime_seconds
         FROM nodes n
-        LEFT JOIN (
-            SELECT hostname, cpu_percent, memory_percent, disk_percent, uptime_seconds
-            FROM metrics
-            WHERE (hostname, timestamp) IN (
-                SELECT hostname, MAX(timestamp)
-                FROM metrics
-                GROUP BY hostname
-            )
-        ) m ON n.hostname = m.hostname
+        LEFT JOIN node_current c ON n.hostname = c.hostname
         ORDER BY n.hostname
-    ''')
+    '''), ('last_seen',))
 
     nodes = []
-    for row in cursor.fetchall():
+    for row in rows:
         nodes.append({
             'hostname': row['hostname'],
             'ip': row['ip'],
@@ -157,99 +153,101 @@ def api_nodes():
             }
         })
 
-    db.close()
     return jsonify(nodes)
 
 
 @app.route('/api/nodes/<hostname>')
 @require_auth
 def api_node_detail(hostname):
-    """Get detailed information for a specific node"""
-    db = get_db()
-    cursor = db.cursor()
+    """Get detailed information for a specific node
 
+    With ?at=<ISO timestamp>, services and OSPF neighbors are the ones
+    in effect at that moment.
+    """
     # Node info
-    cursor.execute('SELECT * FROM nodes WHERE hostname = ?', (hostname,))
-    node = cursor.fetchone()
+    node = storage.query_one('SELECT * FROM nodes WHERE hostname = ?', (hostname,))
 
     if not node:
-        db.close()
         return jsonify({'error': 'Node not found'}), 404
+    node = with_text_timestamps([node], ('last_seen',))[0]
 
     # Recent metrics (last 24 hours)
-    cursor.execute('''
-        SELECT timestamp, cpu_percent, memory_percent, disk_percent
-        FROM metrics
-        WHERE hostname = ? AND timestamp > datetime('now', '-24 hours')
-        ORDER BY timestamp DESC
-    ''', (hostname,))
-    metrics = [dict(row) for row in cursor.fetchall()]
-
-    # Services
-    cursor.execute('''
-        SELECT service_name, status
-        FROM services
-        WHERE hostname = ? AND (hostname, timestamp) IN (
-            SELECT hostname, MAX(timestamp)
-            FROM services
+    metrics = with_text_timestamps(
+        {field: row[field] for field in ('timestamp', 'cpu_percent', 'memory_percent', 'disk_percent')}
+        for row in reversed(rollups.raw(datetime.now() - timedelta(hours=24), hostname=hostname))
+    )
+
+    at = request.args.get('at')
+    if at:
+        try:
+            moment = datetime.fromisoformat(at)
+        except ValueError:
+            return jsonify({'error': 'Invalid timestamp'}), 400
+        services = services_at(storage, moment, hostname).get(hostname, {})
+        neighbors = ospf_neighbors_at(storage, moment, hostname).get(hostname, [])
+    else:
+        # Services
+        rows = storage.query('''
+            SELECT service_name, status
+            FROM service_current
+            WHERE hostname = ?
+        ''', (hostname,))
+        services = {row['service_name']: row['status'] for row in rows}
+
+        # OSPF neighbors
+        neighbors = storage.query('''
+            SELECT neighbor_id, neighbor_ip, state
+            FROM ospf_current
             WHERE hostname = ?
-            GROUP BY service_name
-        )
-    ''', (hostname, hostname))
-    services = {row['service_name']: row['status'] for row in cursor.fetchall()}
-
-    # OSPF neighbors
-    cursor.execute('''
-        SELECT neighbor_id, neighbor_ip, state
-        FROM ospf_neighbors
-        WHERE hostname = ? AND timestamp = (
-            SELECT MAX(timestamp) FROM ospf_neighbors WHERE hostname = ?
-        )
-    ''', (hostname, hostname))
-    neighbors = [dict(row) for row in cursor.fetchall()]
-
-    db.close()
+        ''', (hostname,))
 
     return jsonify({
-        'node': dict(node),
+        'node': node,
         'metrics': metrics,
         'services': services,
         'ospf_neighbors': neighbors
     })
 
 
+@app.route('/api/nodes/<hostname>/history')
+@require_auth
+def api_node_state_history(hostname):
+    """Service and OSPF neighbor state changes of a node over the last ?hours= (default 24)"""
+    hours = int(request.args.get('hours', 24))
+    since = datetime.now() - timedelta(hours=hours)
+    columns = ('started_at', 'ended_at')
+    return jsonify({
+        'services': with_text_timestamps(state_changes(storage, 'service_states', hostname, since), columns),
+        'ospf_neighbors': with_text_timestamps(state_changes(storage, 'ospf_states', hostname, since), columns)
+    })
+
+
 @app.route('/api/topology')
 @require_auth
 def api_topology():
     """Get network topology (nodes and OSPF connections)"""
-    db = get_db()
-    cursor = db.cursor()
-
     # Get all nodes
-    cursor.execute('SELECT hostname, ip, type, status FROM nodes')
-    nodes = [dict(row) for row in cursor.fetchall()]
+    nodes = storage.query('SELECT hostname, ip, type, status FROM nodes')
+    hostname_by_ip = {node['ip']: node['hostname'] for node in nodes}
 
     # Get OSPF connections (edges)
-    cursor.execute('''
+    rows = storage.query('''
         SELECT DISTINCT o.hostname as source, o.neighbor_ip as target_ip
-        FROM ospf_neighbors o
-        WHERE o.timestamp > datetime('now', '-5 minutes')
+        FROM ospf_current o
+        WHERE o.timestamp > ?
         AND o.state = 'Full'
-    ''')
+    ''', (datetime.now() - timedelta(minutes=5),))
 
     edges = []
-    for row in cursor.fetchall():
+    for row in rows:
         # Find target hostname by IP
-        cursor.execute('SELECT hostname FROM nodes WHERE ip = ?', (row['target_ip'],))
-        target = cursor.fetchone()
+        target = hostname_by_ip.get(row['target_ip'])
         if target:
             edges.append({
                 'source': row['source'],
-                'target': target['hostname']
+                'target': target
             })
 
-    db.close()
-
     return jsonify({
         'nodes': nodes,
         'edges': edges
@@ -260,41 +258,30 @@ def api_topology():
 @require_auth
 def api_alerts():
     """Get active alerts"""
-    db = get_db()
-    cursor = db.cursor()
-
     resolved = request.args.get('resolved', 'false').lower() == 'true'
     limit = int(request.args.get('limit', 50))
 
-    cursor.execute('''
-        SELECT id, timestamp, hostname, severity, alert_type, message, resolved, resolved_at
+    alerts = storage.query('''
+        SELECT id, timestamp, last_seen, hostname, severity, alert_type, message, suppressed_by,
+               resolved, resolved_at
         FROM alerts
         WHERE resolved = ?
         ORDER BY timestamp DESC
         LIMIT ?
-    ''', (1 if resolved else 0, limit))
-
-    alerts = [dict(row) for row in cursor.fetchall()]
-    db.close()
+    ''', (resolved, limit))
 
-    return jsonify(alerts)
+    return jsonify(with_text_timestamps(alerts, ('timestamp', 'last_seen', 'resolved_at')))
 
 
 @app.route('/api/alerts/<int:alert_id>/resolve', methods=['POST'])
 @require_auth
 def api_alert_resolve(alert_id):
     """Resolve an alert"""
-    db = get_db()
-    cursor = db.cursor()
-
-    cursor.execute('''
+    storage.execute('''
         UPDATE alerts
-        SET resolved = 1, resolved_at = ?
+        SET resolved = ?, resolved_at = ?
         WHERE id = ?
-    ''', (datetime.now(), alert_id))
-
-    db.commit()
-    db.close()
+    ''', (True, datetime.now(), alert_id))
 
     return jsonify({'success': True})
 
@@ -302,22 +289,9 @@ def api_alert_resolve(alert_id):
 @app.route('/api/metrics/<hostname>')
 @require_auth
 def api_metrics_history(hostname):
-    """Get metrics history for a node"""
+    """Get metrics history for a node (raw or rolled up, depending on range)"""
     hours = int(request.args.get('hours', 24))
-    db = get_db()
-    cursor = db.cursor()
-
-    cursor.execute('''
-        SELECT timestamp, cpu_percent, memory_percent, disk_percent
-        FROM metrics
-        WHERE hostname = ? AND timestamp > datetime('now', ? || ' hours')
-        ORDER BY timestamp ASC
-    ''', (hostname, f'-{hours}'))
-
-    metrics = [dict(row) for row in cursor.fetchall()]
-    db.close()
-
-    return jsonify(metrics)
+    return jsonify(with_text_timestamps(rollups.history(hostname, hours)))
 
 
 def background_updates():
@@ -326,19 +300,11 @@ def background_updates():
         time.sleep(5)  # Update every 5 seconds
 
         # Get current status
-        db = get_db()
-        cursor = db.cursor()
-
-        cursor.execute('SELECT COUNT(*) as total FROM nodes')
-        total_nodes = cursor.fetchone()['total']
-
-        cursor.execute("SELECT COUNT(*) as online FROM nodes WHERE status = 'online'")
-        online_nodes = cursor.fetchone()['online']
-
-        cursor.execute("SELECT COUNT(*) as critical FROM alerts WHERE resolved = 0 AND severity = 'critical'")
-        critical_alerts = cursor.fetchone()['critical']
-
-        db.close()
+        total_nodes = storage.query_one('SELECT COUNT(*) as total FROM nodes')['total']
+        online_nodes = storage.query_one("SELECT COUNT(*) as online FROM nodes WHERE status = 'online'")['online']
+        critical_alerts = storage.query_one(
+            "SELECT COUNT(*) as critical FROM alerts WHERE resolved = ? AND severity = 'critical'", (False,)
+        )['critical']
 
         # Emit update to all connected clients
         socketio.emit('status_update', {
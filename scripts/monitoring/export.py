@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Export / Import
+Streams history tables to CSV or Parquet files and loads them back
+"""
+
+import csv
+import json
+import os
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+from storage import Storage, COLUMNS, EPOCH_TABLES, ROLLUP_TIERS, insert_sql, to_epoch
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATS = ('csv', 'parquet')
+NULL = '\\N'
+STATE_FILE = 'export-state.json'
+
+# Exported tables in import order -> (time column, columns as exported).
+# Tables keyed by host_id are exported with the hostname instead, so
+# files can be loaded into a database with different host ids. Current
+# state tables are left out; the collector rebuilds them.
+EXPORT_TABLES = {
+    'nodes': (None, COLUMNS['nodes']),
+    'metrics': ('timestamp', ('hostname',) + COLUMNS['metrics'][1:]),
+    'reachability': ('timestamp', ('hostname',) + COLUMNS['reachability'][1:]),
+    **{table: ('bucket', ('hostname',) + COLUMNS[table][1:]) for table in ROLLUP_TIERS},
+    'metric_chunks': ('chunk_start', COLUMNS['metric_chunks']),
+    'service_states': ('started_at', COLUMNS['service_states'] + ('ended_at',)),
+    'ospf_states': ('started_at', COLUMNS['ospf_states'] + ('ended_at',)),
+    'alerts': ('timestamp', COLUMNS['alerts'] + ('resolved', 'resolved_at', 'notified_at'))
+}
+HOST_ID_TABLES = EPOCH_TABLES + tuple(ROLLUP_TIERS)
+
+# Columns ordering rows after the time column, so that an export
+# resumes from an exact row. Unique together with it where the table
+# has a key; metrics and reachability have none, so rows sharing a whole
+# key there are counted instead.
+EXPORT_KEYS = {
+    'nodes': ('hostname',),
+    'metrics': ('host_id',),
+    'reachability': ('host_id',),
+    **{table: ('host_id',) for table in ROLLUP_TIERS},
+    'metric_chunks': ('hostname', 'sealed'),
+    'service_states': ('hostname', 'service_name'),
+    'ospf_states': ('hostname', 'neighbor_id'),
+    'alerts': ('id',)
+}
+# Column --since applies to where it isn't the time column: a chunk
+# that starts before the bound can still hold samples after it
+SINCE_COLUMNS = {'metric_chunks': 'chunk_end'}
+
+TEXT_COLUMNS = {
+    'hostname', 'ip', 'type', 'status', 'service_name', 'neighbor_id', 'neighbor_ip',
+    'state', 'severity', 'alert_type', 'message', 'suppressed_by'
+}
+INT_COLUMNS = {'uptime_seconds', 'samples', 'bucket'}
+DATETIME_COLUMNS = {'last_seen', 'chunk_start', 'chunk_end', 'started_at', 'ended_at', 'resolved_at', 'notified_at'}
+BOOL_COLUMNS = {'resolved', 'sealed'}
+BINARY_COLUMNS = {'data'}
+
+
+def column_kind(table: str, column: str) -> str:
+    """text, int, float, datetime, bool or binary"""
+    if column == 'timestamp':
+        return 'int' if table in HOST_ID_TABLES else 'datetime'
+    for kind, columns in (('text', TEXT_COLUMNS), ('int', INT_COLUMNS), ('datetime', DATETIME_COLUMNS),
+                          ('bool', BOOL_COLUMNS), ('binary', BINARY_COLUMNS)):
+        if column in columns:
+            return kind
+    return 'float'
+
+
+def normalize(kind: str, value):
+    """Database value -> the Python type of its kind (backends differ)"""
+    if value is None:
+        return None
+    if kind == 'datetime':
+        return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    if kind == 'bool':
+        return bool(value)
+    if kind == 'binary':
+        return bytes(value)
+    if kind == 'int':
+        return int(value)
+    if kind == 'float':
+        return float(value)
+    return str(value)
+
+
+def to_text(value) -> str:
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    return str(value)
+
+
+def from_text(kind: str, text: str):
+    if text == NULL:
+        return None
+    if kind == 'datetime':
+        return datetime.fromisoformat(text)
+    if kind == 'bool':
+        return text == 'true'
+    if kind == 'binary':
+        return bytes.fromhex(text)
+    if kind == 'int':
+        return int(text)
+    if kind == 'float':
+        return float(text)
+    return text
+
+
+def _arrow_schema(table: str, columns: tuple):
+    types = {
+        'text': pyarrow.string(),
+        'int': pyarrow.int64(),
+        'float': pyarrow.float64(),
+        'datetime': pyarrow.timestamp('us'),
+        'bool': pyarrow.bool_(),
+        'binary': pyarrow.binary()
+    }
+    return pyarrow.schema([(column, types[column_kind(table, column)]) for column in columns])
+
+
+def _position(value):
+    """JSON-safe form of a time column value, comparable on resume"""
+    return value if value is None or isinstance(value, int) else str(value)
+
+
+def _key(row: Dict) -> List:
+    """Resume position of an exported row (its key_N columns)"""
+    return [_position(value) for name, value in row.items() if name.startswith('key_')]
+
+
+def _load_json(path: str) -> Optional[Dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_json(path: str, data: Dict):
+    # Written beside and renamed, so the state is never half-written
+    with open(path + '.tmp', 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(path + '.tmp', path)
+
+
+class Exporter:
+    """Writes tables to a directory, chunk_size rows at a time
+
+    CSV goes to <table>.csv, Parquet to <table>/part-NNNNN.parquet (one
+    part per chunk). After every chunk the position reached (key of the
+    last row, see EXPORT_KEYS, rows written at it, file offset) is saved in
+    export-state.json, so an interrupted export resumes where the last
+    complete chunk ended. The state also holds the export's id, under
+    which imports record their progress. Rows are read through a streaming cursor, so
+    memory stays at about one chunk.
+    """
+
+    def __init__(self, storage: Storage, directory: str, fmt: str = 'csv', chunk_size: int = 10000,
+                 since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 hosts: Optional[List[str]] = None, tables: Optional[List[str]] = None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format '{fmt}' (expected {' or '.join(FORMATS)})")
+        if fmt == 'parquet' and pyarrow is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        unknown = set(tables or []) - set(EXPORT_TABLES)
+        if unknown:
+            raise ValueError(f"Unknown table(s): {', '.join(sorted(unknown))}")
+
+        self.storage = storage
+        self.directory = directory
+        self.format = fmt
+        self.chunk_size = chunk_size
+        self.since = since
+        self.until = until
+        self.hosts = sorted(hosts) if hosts else None
+        self.tables = [table for table in EXPORT_TABLES if not tables or table in tables]
+
+    def settings(self) -> Dict:
+        """What the export covers; a resumed export must match"""
+        return {
+            'format': self.format,
+            'since': self.since.isoformat() if self.since else None,
+            'until': self.until.isoformat() if self.until else None,
+            'hosts': self.hosts,
+            'tables': self.tables
+        }
+
+    def run(self, resume: bool = False) -> Dict[str, int]:
+        """Export every table; returns the rows written per table"""
+        os.makedirs(self.directory, exist_ok=True)
+        state_path = os.path.join(self.directory, STATE_FILE)
+        state = _load_json(state_path)
+        if state is not None and not resume:
+            raise RuntimeError(f"{self.directory} already holds an export; use --resume to continue it")
+        if state is not None and state['settings'] != self.settings():
+            raise RuntimeError("The export in progress was started with different options")
+        if state is not None and any(not isinstance(progress['last'], (list, type(None)))
+                                     for progress in state['tables'].values()):
+            raise RuntimeError("The export in progress was started by an older version; start it over")
+        if state is None:
+            state = {'id': uuid.uuid4().hex, 'settings': self.settings(), 'tables': {}}
+
+        written = {}
+        for table in self.tables:
+            progress = state['tables'].setdefault(
+                table, {'done': False, 'rows': 0, 'last': None, 'at_last': 0, 'parts': 0, 'offset': 0}
+            )
+            if not progress['done']:
+                self._export_table(table, progress, lambda: _save_json(state_path, state))
+                progress['done'] = True
+                _save_json(state_path, state)
+            written[table] = progress['rows']
+            print(f"  {table}: {progress['rows']} rows")
+        return written
+
+    def _query(self, table: str, progress: Dict) -> tuple:
+        time_column, columns = EXPORT_TABLES[table]
+        conditions, params = [], []
+
+        if table in HOST_ID_TABLES:
+            select = ', '.join(['h.hostname'] + [f't.{column}' for column in columns[1:]])
+            source = f'{table} t JOIN hosts h ON h.id = t.host_id'
+            host_column = 'h.hostname'
+            bound = to_epoch
+        else:
+            select = ', '.join(f't.{column}' for column in columns)
+            source = f'{table} t'
+            host_column = 't.hostname'
+            bound = lambda moment: moment
+        key = [f't.{column}' for column in ((time_column,) if time_column else ()) + EXPORT_KEYS[table]]
+        # Selected again under their own names, for the resume position
+        select += ''.join(f', {column} AS key_{index}' for index, column in enumerate(key))
+
+        if time_column:
+            if self.since:
+                conditions.append(f't.{SINCE_COLUMNS.get(table, time_column)} >= ?')
+                params.append(bound(self.since))
+            if self.until:
+                conditions.append(f't.{time_column} < ?')
+                params.append(bound(self.until))
+            if progress['last'] is not None:
+                conditions.append(f"({', '.join(key)}) >= ({', '.join('?' * len(key))})")
+                params.extend(progress['last'])
+        if self.hosts:
+            conditions.append(f"{host_column} IN ({', '.join('?' * len(self.hosts))})")
+            params.extend(self.hosts)
+
+        statement = f'SELECT {select} FROM {source}'
+        if conditions:
+            statement += ' WHERE ' + ' AND '.join(conditions)
+        return statement + ' ORDER BY ' + ', '.join(key), tuple(params)
+
+    def _rows(self, table: str, progress: Dict) -> Iterator[List[Dict]]:
+        """Chunks of rows not exported yet"""
+        time_column, _columns = EXPORT_TABLES[table]
+        statement, params = self._query(table, progress)
+        # Rows at the resume position that were already written
+        skip = progress['at_last'] if time_column else progress['rows']
+        for rows in self.storage.stream(statement, params, self.chunk_size):
+            if skip:
+                if time_column:
+                    kept = []
+                    for row in rows:
+                        if skip and _key(row) == progress['last']:
+                            skip -= 1
+                        else:
+                            skip = 0
+                            kept.append(row)
+                    rows = kept
+                else:
+                    dropped = min(skip, len(rows))
+                    rows, skip = rows[dropped:], skip - dropped
+            if rows:
+                yield rows
+
+    def _export_table(self, table: str, progress: Dict, save):
+        time_column, columns = EXPORT_TABLES[table]
+        kinds = [column_kind(table, column) for column in columns]
+
+        if self.format == 'csv':
+            path = os.path.join(self.directory, f'{table}.csv')
+            handle = open(path, 'a+', newline='')
+            # Drop anything after the last complete chunk
+            handle.truncate(progress['offset'])
+            handle.seek(progress['offset'])
+            writer = csv.writer(handle)
+            if progress['offset'] == 0:
+                writer.writerow(columns)
+        else:
+            os.makedirs(os.path.join(self.directory, table), exist_ok=True)
+            schema = _arrow_schema(table, columns)
+
+        try:
+            for rows in self._rows(table, progress):
+                values = [[normalize(kind, row[column]) for column, kind in zip(columns, kinds)] for row in rows]
+                if self.format == 'csv':
+                    writer.writerows([to_text(value) for value in row] for row in values)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                    progress['offset'] = handle.tell()
+                else:
+                    path = os.path.join(self.directory, table, f"part-{progress['parts']:05d}.parquet")
+                    data = pyarrow.Table.from_pylist([dict(zip(columns, row)) for row in values], schema=schema)
+                    pyarrow.parquet.write_table(data, path + '.tmp')
+                    os.replace(path + '.tmp', path)
+                    progress['parts'] += 1
+
+                progress['rows'] += len(rows)
+                if time_column:
+                    for row in rows:
+                        position = _key(row)
+                        if position == progress['last']:
+                            progress['at_last'] += 1
+                        else:
+                            progress['last'], progress['at_last'] = position, 1
+                save()
+        finally:
+            if self.format == 'csv':
+                handle.close()
+
+
+class Importer:
+    """Loads a directory written by Exporter into the configured database
+
+    Tables go in export order (nodes first). Host-keyed rows get this
+    database's host ids. Progress is recorded per export in the
+    import_progress table, in the same transaction as each chunk's rows,
+    so an interrupted import resumes after the last committed chunk and
+    importing the same export again adds nothing. Most tables have no
+    key to deduplicate rows by, so this holds per export: a second
+    export of the same history is imported in full.
+    """
+
+    def __init__(self, storage: Storage, directory: str, chunk_size: int = 10000,
+                 tables: Optional[List[str]] = None):
+        self.storage = storage
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.tables = [table for table in EXPORT_TABLES if not tables or table in tables]
+
+    def export_id(self) -> str:
+        """The export's id; the directory for exports written without one"""
+        state = _load_json(os.path.join(self.directory, STATE_FILE)) or {}
+        return state.get('id') or os.path.realpath(self.directory)
+
+    def run(self) -> Dict[str, int]:
+        """Import every exported table found; returns rows read per table"""
+        export_id = self.export_id()
+        state = {
+            row['table_name']: {'rows': row['imported_rows'], 'parts': row['imported_parts']}
+            for row in self.storage.query(
+                'SELECT table_name, imported_rows, imported_parts FROM import_progress WHERE export_id = ?',
+                (export_id,)
+            )
+        }
+        imported = {}
+
+        for table in self.tables:
+            progress = state.setdefault(table, {'rows': 0, 'parts': 0})
+            for rows in self._chunks(table, progress):
+                progress['rows'] += len(rows)
+                self._insert(table, rows, (export_id, table, progress['rows'], progress['parts']))
+            if progress['rows']:
+                imported[table] = progress['rows']
+                print(f"  {table}: {progress['rows']} rows")
+        return imported
+
+    def _chunks(self, table: str, progress: Dict) -> Iterator[List[list]]:
+        """Chunks of typed rows (export column order) not imported yet"""
+        columns = EXPORT_TABLES[table][1]
+        csv_path = os.path.join(self.directory, f'{table}.csv')
+        parquet_dir = os.path.join(self.directory, table)
+
+        if os.path.exists(csv_path):
+            with open(csv_path, newline='') as handle:
+                reader = csv.reader(handle)
+                header = next(reader, None)
+                if header is None:
+                    return
+                kinds = [column_kind(table, column) for column in header]
+                skip, chunk = progress['rows'], []
+                for row in reader:
+                    if skip:
+                        skip -= 1
+                        continue
+                    record = dict(zip(header, (from_text(kind, text) for kind, text in zip(kinds, row))))
+                    chunk.append([record.get(column) for column in columns])
+                    if len(chunk) >= self.chunk_size:
+                        yield chunk
+                        chunk = []
+                if chunk:
+                    yield chunk
+
+        elif os.path.isdir(parquet_dir):
+            if pyarrow is None:
+                raise RuntimeError("Parquet import requires pyarrow (pip install pyarrow)")
+            parts = sorted(name for name in os.listdir(parquet_dir) if name.endswith('.parquet'))
+            # Each part was one export chunk; it is imported as one chunk
+            for name in parts[progress['parts']:]:
+                records = pyarrow.parquet.read_table(os.path.join(parquet_dir, name)).to_pylist()
+                progress['parts'] += 1
+                yield [[record.get(column) for column in columns] for record in records]
+
+    def _insert(self, table: str, rows: List[list], progress: tuple):
+        """Insert one chunk and record progress (export_id, table, rows,
+        parts) in the same transaction"""
+        columns = EXPORT_TABLES[table][1]
+        if table in HOST_ID_TABLES:
+            ids = self.storage.host_ids({row[0] for row in rows})
+            rows = [[ids[row[0]]] + row[1:] for row in rows]
+            columns = ('host_id',) + columns[1:]
+
+        values = '(' + ', '.join('?' * len(columns)) + ')'
+        if table == 'nodes':
+            statement = insert_sql('nodes', values)
+        else:
+            statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values} ON CONFLICT DO NOTHING"
+        with self.storage.transaction() as cursor:
+            cursor.executemany(self.storage.sql(statement), [tuple(row) for row in rows])
+            cursor.execute(self.storage.sql(
+                'INSERT INTO import_progress (export_id, table_name, imported_rows, imported_parts) '
+                'VALUES (?, ?, ?, ?) ON CONFLICT (export_id, table_name) '
+                'DO UPDATE SET imported_rows = excluded.imported_rows, imported_parts = excluded.imported_parts'
+            ), progress)
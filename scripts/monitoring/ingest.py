@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Push Ingestion
+Receives metric payloads pushed by mesh-monitor-agent over UDP
+"""
+
+import hmac
+import json
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from probe import probe_fields
+from node_registry import NodeRegistry
+
+
+class PushListener:
+    """UDP listener for node agent payloads
+
+    Each datagram is one JSON document using the probe field names plus
+    'hostname' (and 'token' when a shared token is configured). The
+    sender is looked up by source address in the NodeRegistry, and the
+    node's registered hostname, IP and type are used, whatever name the
+    agent reports; payloads from addresses that are not a known node are
+    rejected. Valid payloads are turned into metrics dicts and queued;
+    the collector drains the queue in batches and feeds them through the
+    normal store_metrics/check_alerts pipeline.
+    """
+
+    def __init__(self, registry: NodeRegistry, listen: str = '0.0.0.0', port: int = 9110,
+                 token: Optional[str] = None, max_queue: int = 10000):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self.token = token
+        self.queue = queue.Queue(maxsize=max_queue)
+        # Unknown senders already logged
+        self._unknown: set = set()
+
+        self.last_push: Dict[str, float] = {}
+        self.received = 0
+        self.rejected = 0
+        self.dropped = 0
+
+        self._sock = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Bind the socket and start receiving in a background thread"""
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.listen, self.port))
+        self._sock.settimeout(1)
+
+        self._thread = threading.Thread(target=self._run, name='push-listener', daemon=True)
+        self._thread.start()
+        print(f"Listening for pushed metrics on udp/{self.listen}:{self.port}")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=2)
+        if self._sock:
+            self._sock.close()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data, (source, _) = self._sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+
+            self.received += 1
+            metrics = self.parse(data, source)
+            if metrics is None:
+                self.rejected += 1
+                continue
+
+            try:
+                self.queue.put_nowait(metrics)
+            except queue.Full:
+                self.dropped += 1
+                continue
+            # Keyed like the node list, so the node is not polled as well
+            self.last_push[metrics['ip']] = time.monotonic()
+
+    def parse(self, data: bytes, source: str) -> Optional[Dict]:
+        """Validate a payload and convert it to a metrics dict"""
+        try:
+            doc = json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            return None
+
+        if not isinstance(doc, dict) or not doc.get('hostname'):
+            return None
+
+        if self.token and not hmac.compare_digest(str(doc.get('token', '')), self.token):
+            return None
+
+        node = self.registry.find(source)
+        if node is None:
+            if source not in self._unknown:
+                self._unknown.add(source)
+                print(f"Ignoring pushed metrics from unknown node {source} ({doc['hostname']})")
+            return None
+
+        metrics = {
+            'hostname': node['hostname'],
+            'ip': node['ip'],
+            'type': node.get('type', 'unknown'),
+            'status': 'online',
+            'timestamp': datetime.now(),
+            'source': 'push'
+        }
+        metrics.update(probe_fields(doc))
+        return metrics
+
+    def drain(self, limit: int = 1000) -> List[Dict]:
+        """Take up to limit queued payloads without blocking"""
+        batch = []
+        while len(batch) < limit:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def recent_sources(self, max_age: float) -> set:
+        """IPs that pushed within the last max_age seconds"""
+        cutoff = time.monotonic() - max_age
+        return {ip for ip, seen in list(self.last_push.items()) if seen >= cutoff}
+
+    def stats(self) -> Dict:
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'dropped': self.dropped,
+            'queued': self.queue.qsize(),
+            'sources': len(self.last_push)
+        }
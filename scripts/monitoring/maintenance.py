@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Database Maintenance
+Batched retention deletes, space reclaim and ANALYZE in a background thread
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from storage import Storage, ROLLUP_TIERS, EPOCH_TABLES, to_epoch
+from rollups import rollup_retention
+
+# Raw history tables pruned with retention.metrics_days (EPOCH_TABLES
+# hold epoch seconds)
+RAW_TABLES = ('metrics', 'services', 'ospf_neighbors', 'reachability')
+
+# Transition tables: states that ended before retention.metrics_days are
+# pruned, the current (open) state always stays
+STATE_TABLES = ('service_states', 'ospf_states')
+
+
+class Maintenance:
+    """Keeps the database within its retention without stalling it
+
+    Expired rows are deleted in batches of maintenance.batch_size, each
+    its own short transaction along an index, pausing
+    maintenance.pause seconds between batches so the collector and the
+    dashboard get the database in between. Free pages are returned to
+    the filesystem (SQLite incremental_vacuum) and planner statistics are
+    refreshed (ANALYZE) on their own schedules. stats holds the rows
+    reclaimed and time spent by the last run of each job.
+    """
+
+    def __init__(self, storage: Storage, config: dict):
+        self.storage = storage
+        maintenance = config.get('maintenance', {})
+        self.batch_size = maintenance.get('batch_size', 1000)
+        self.pause = maintenance.get('pause', 0.1)
+        self.retention_interval = maintenance.get(
+            'retention_interval', config.get('rollups', {}).get('retention_interval', 3600)
+        )
+        self.vacuum_interval = maintenance.get('vacuum_interval', 3600)
+        self.vacuum_pages = maintenance.get('vacuum_pages', 2000)
+        self.analyze_interval = maintenance.get('analyze_interval', 86400)
+
+        retention = config.get('retention', {})
+        self.metrics_days = retention.get('metrics_days', 30)
+        self.alerts_days = retention.get('alerts_days', 90)
+        self.rollup_days = rollup_retention(config)
+
+        self.stats: Dict[str, Dict] = {}
+        self._next = {'retention': 0.0, 'vacuum': 0.0, 'analyze': 0.0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Run due jobs in a background thread until stop()"""
+        self._thread = threading.Thread(target=self._loop, name='maintenance', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run()
+            except Exception as e:
+                print(f"Maintenance error: {e}")
+            self._stop.wait(60)
+
+    def run(self, force: bool = False) -> Dict[str, Dict]:
+        """Run the jobs that are due (all of them with force); returns their stats"""
+        jobs = [
+            ('retention', self.retention_interval, self.enforce_retention),
+            ('vacuum', self.vacuum_interval, self.reclaim_space),
+            ('analyze', self.analyze_interval, self.analyze)
+        ]
+        ran = {}
+        for name, interval, job in jobs:
+            if self._stop.is_set():
+                break
+            if force or time.monotonic() >= self._next[name]:
+                ran[name] = self.stats[name] = job()
+                self._next[name] = time.monotonic() + interval
+        return ran
+
+    def retention_rules(self, now: datetime) -> List[tuple]:
+        """(table, where, params, order) for every kind of expired row"""
+        cutoff = now - timedelta(days=self.metrics_days)
+        rules = [
+            (table, 'timestamp < ?', (to_epoch(cutoff) if table in EPOCH_TABLES else cutoff,), 'timestamp')
+            for table in RAW_TABLES
+        ]
+        rules.append(('metric_chunks', 'chunk_end < ?', (cutoff,), 'chunk_end'))
+        rules.extend((table, 'ended_at < ?', (cutoff,), 'ended_at') for table in STATE_TABLES)
+        rules.extend(
+            (table, 'bucket < ?', (to_epoch(now - timedelta(days=self.rollup_days[table])),), 'bucket')
+            for table in ROLLUP_TIERS
+        )
+        # Unresolved alerts stay until they are resolved
+        rules.append((
+            'alerts', 'resolved = ? AND timestamp < ?',
+            (True, now - timedelta(days=self.alerts_days)), 'resolved, timestamp'
+        ))
+        return rules
+
+    def enforce_retention(self, now: Optional[datetime] = None) -> Dict:
+        """Delete expired rows batch by batch"""
+        now = now or datetime.now()
+        start = time.monotonic()
+        deleted = {}
+        batches = 0
+
+        for table, where, params, order in self.retention_rules(now):
+            deleted[table] = 0
+            while not self._stop.is_set():
+                count = self.storage.delete_batch(table, where, params, order, self.batch_size)
+                deleted[table] += count
+                batches += 1
+                if count < self.batch_size:
+                    break
+                # Let the collector and dashboard in between batches
+                self._stop.wait(self.pause)
+
+        stats = {
+            'at': now,
+            'rows': sum(deleted.values()),
+            'deleted': deleted,
+            'batches': batches,
+            'seconds': round(time.monotonic() - start, 2)
+        }
+        if stats['rows']:
+            print(f"Retention: deleted {stats['rows']} rows in {stats['batches']} batches, "
+                  f"{stats['seconds']}s (" + ', '.join(f'{t}={n}' for t, n in deleted.items() if n) + ")")
+        return stats
+
+    def reclaim_space(self) -> Dict:
+        """Give up to maintenance.vacuum_pages free pages back to the filesystem"""
+        start = time.monotonic()
+        freed = self.storage.reclaim_space(self.vacuum_pages)
+        stats = {'at': datetime.now(), 'bytes': freed, 'seconds': round(time.monotonic() - start, 2)}
+        if freed:
+            print(f"Vacuum: reclaimed {freed / 1048576:.1f} MB in {stats['seconds']}s")
+        return stats
+
+    def analyze(self) -> Dict:
+        """Refresh the query planner's statistics"""
+        start = time.monotonic()
+        self.storage.execute('ANALYZE')
+        return {'at': datetime.now(), 'seconds': round(time.monotonic() - start, 2)}
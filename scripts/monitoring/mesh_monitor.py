@@ -8,24 +8,48 @@ import argparse
 import sys
 import yaml
 import json
-import subprocess
-import paramiko
-import sqlite3
-from datetime import datetime, timedelta
-from pathlib import Path
+from datetime import datetime
 from typing import Dict, List, Optional
-import socket
 import time
+import threading
+import queue
+from collections import deque
+
+from ssh_pool import SSHConnectionPool
+from probe import build_probe_script, parse_probe_output
+from reachability import ReachabilitySweeper
+from procfs import PROCFS_COMMAND, parse_procfs_dump, CpuDeltaTracker
+from node_registry import NodeRegistry
+from sharding import ShardMap
+from storage import create_storage, BatchWriter
+from alerts import AlertEngine
+from rules import AlertRules
+from topology import TopologySuppressor
+from chunks import create_chunk_buffer
+from maintenance import Maintenance
+from export import Exporter, Importer, FORMATS, EXPORT_TABLES
 
 # Configuration
 CONFIG_FILE = '/etc/mesh-monitor/config.yml'
 DB_FILE = '/var/lib/mesh-monitor/metrics.db'
 
+# Services checked on every node
+SERVICES = ['frr', 'etcd', 'coredns', 'unbound', 'isc-dhcp-server']
+
 class MeshMonitor:
     def __init__(self, config_file: str = CONFIG_FILE):
         self.config = self.load_config(config_file)
-        self.db = sqlite3.connect(DB_FILE)
+        self.storage = create_storage(self.config, default_path=DB_FILE)
         self.init_database()
+        self.rules = AlertRules(self.config)
+        self.alerts = AlertEngine(self.storage, stale_after=self.rules.stale_after)
+        self.suppressor = TopologySuppressor(self.storage, self.config)
+        self.writer = BatchWriter(self.storage, chunks=create_chunk_buffer(self.config), alerts=self.alerts)
+        self.ssh_pool = self.create_ssh_pool()
+        self.sweeper = self.create_sweeper()
+        self.probe_script = build_probe_script(SERVICES)
+        self.cpu_tracker = CpuDeltaTracker()
+        self.registry = NodeRegistry(self.config)
 
     def load_config(self, config_file: str) -> dict:
         """Load configuration from YAML file"""
@@ -40,401 +64,336 @@ class MeshMonitor:
             sys.exit(1)
 
     def init_database(self):
-        """Initialize SQLite database"""
-        cursor = self.db.cursor()
-
-        # Nodes table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS nodes (
-                hostname TEXT PRIMARY KEY,
-                ip TEXT,
-                type TEXT,
-                last_seen TIMESTAMP,
-                status TEXT
-            )
-        ''')
-
-        # Metrics table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hostname TEXT,
-                timestamp TIMESTAMP,
-                cpu_percent REAL,
-                memory_percent REAL,
-                disk_percent REAL,
-                uptime_seconds INTEGER,
-                FOREIGN KEY (hostname) REFERENCES nodes(hostname)
-            )
-        ''')
-
-        # Services table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS services (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hostname TEXT,
-                timestamp TIMESTAMP,
-                service_name TEXT,
-                status TEXT,
-                FOREIGN KEY (hostname) REFERENCES nodes(hostname)
-            )
-        ''')
-
-        # OSPF neighbors table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ospf_neighbors (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                hostname TEXT,
-                timestamp TIMESTAMP,
-                neighbor_id TEXT,
-                neighbor_ip TEXT,
-                state TEXT,
-                FOREIGN KEY (hostname) REFERENCES nodes(hostname)
-            )
-        ''')
-
-        # Alerts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS alerts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TIMESTAMP,
-                hostname TEXT,
-                severity TEXT,
-                alert_type TEXT,
-                message TEXT,
-                resolved BOOLEAN DEFAULT 0,
-                resolved_at TIMESTAMP
-            )
-        ''')
-
-        self.db.commit()
-
-    def discover_nodes(self) -> List[Dict]:
-        """Discover nodes via OSPF"""
-        nodes = []
-
-        # Get configured nodes
-        if 'nodes' in self.config.get('network', {}):
-            nodes.extend(self.config['network']['nodes'])
-
-        # Auto-discover via OSPF if enabled
-        if self.config.get('network', {}).get('auto_discovery', True):
-            try:
-                result = subprocess.run(
-                    ['vtysh', '-c', 'show ip ospf neighbor json'],
-                    capture_output=True,
-                    text=True,
-                    timeout=5
-                )
-
-                if result.returncode == 0:
-                    ospf_data = json.loads(result.stdout)
-                    for neighbor_id, neighbor_data in ospf_data.get('neighbors', {}).items():
-                        if isinstance(neighbor_data, dict):
-                            ip = neighbor_data.get('address', '')
-                            if ip and not any(n['ip'] == ip for n in nodes):
-                                nodes.append({
-                                    'hostname': f'node-{ip.split(".")[-1]}',
-                                    'ip': ip,
-                                    'type': 'unknown'
-                                })
-            except Exception as e:
-                print(f"Warning: OSPF discovery failed: {e}")
-
-        return nodes
-
-    def check_node_reachable(self, ip: str, timeout: int = 2) -> bool:
-        """Check if node is reachable via ping"""
-        try:
-            result = subprocess.run(
-                ['ping', '-c', '1', '-W', str(timeout), ip],
-                capture_output=True,
-                timeout=timeout + 1
-            )
-            return result.returncode == 0
-        except:
-            return False
+        """Create or upgrade the schema (SQLite or PostgreSQL)"""
+        for version in self.storage.migrate():
+            print(f"Applied schema migration {version}")
+
+    def discover_nodes(self, force: bool = False) -> List[Dict]:
+        """Discover nodes from config and OSPF (cached for network.discovery_ttl)"""
+        return self.registry.nodes(force=force)
+
+    def create_sweeper(self) -> ReachabilitySweeper:
+        """Create the reachability sweeper from config"""
+        monitoring = self.config.get('monitoring', {})
+        return ReachabilitySweeper(
+            method=monitoring.get('reachability_method', 'auto'),
+            timeout=monitoring.get('ping_timeout', 2),
+            count=monitoring.get('ping_count', 1),
+            tcp_port=monitoring.get('ssh_port', 22)
+        )
+
+    def sweep_reachability(self, nodes: List[Dict]) -> Dict[str, Dict]:
+        """Check reachability of all nodes in one pass, keyed by IP"""
+        return self.sweeper.sweep([node['ip'] for node in nodes])
+
+    def check_node_reachable(self, ip: str) -> bool:
+        """Check if a single node is reachable"""
+        return self.sweeper.sweep([ip])[ip]['reachable']
+
+    def create_ssh_pool(self) -> SSHConnectionPool:
+        """Create the persistent SSH connection pool from config"""
+        ssh_config = self.config.get('monitoring', {})
+        return SSHConnectionPool(
+            username=ssh_config.get('ssh_user', 'mesh-monitor'),
+            key_filename=ssh_config.get('ssh_key', '/opt/mesh-monitor/.ssh/id_ed25519'),
+            timeout=ssh_config.get('timeout', 5),
+            keepalive=ssh_config.get('ssh_keepalive', 30),
+            idle_timeout=ssh_config.get('ssh_idle_timeout', 300)
+        )
 
     def ssh_execute(self, ip: str, command: str) -> Optional[str]:
-        """Execute command on remote node via SSH"""
-        try:
-            ssh_config = self.config.get('monitoring', {})
-            ssh_user = ssh_config.get('ssh_user', 'mesh-monitor')
-            ssh_key = ssh_config.get('ssh_key', '/opt/mesh-monitor/.ssh/id_ed25519')
-            timeout = ssh_config.get('timeout', 5)
-
-            ssh = paramiko.SSHClient()
-            ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh.connect(
-                ip,
-                username=ssh_user,
-                key_filename=ssh_key,
-                timeout=timeout,
-                look_for_keys=False,
-                allow_agent=False
-            )
-
-            stdin, stdout, stderr = ssh.exec_command(command, timeout=timeout)
-            output = stdout.read().decode('utf-8')
-            ssh.close()
-
-            return output
-        except Exception as e:
-            return None
+        """Execute command on remote node via the pooled SSH connection"""
+        port = self.config.get('monitoring', {}).get('ssh_port', 22)
+        return self.ssh_pool.execute(ip, command, port=port)
+
+    def collect_node_metrics(self, node: Dict, reachability: Optional[Dict] = None) -> Optional[Dict]:
+        """Collect metrics from a single node
 
-    def collect_node_metrics(self, node: Dict) -> Optional[Dict]:
-        """Collect metrics from a single node"""
+        reachability is this node's entry from sweep_reachability; the node
+        is swept on its own if it is not given.
+        """
         hostname = node['hostname']
         ip = node['ip']
 
+        if reachability is None:
+            reachability = self.sweep_reachability([node])[ip]
+
         # Check if reachable
-        if not self.check_node_reachable(ip):
+        if not reachability['reachable']:
             return {
                 'hostname': hostname,
+                'ip': ip,
+                'type': node.get('type', 'unknown'),
                 'status': 'unreachable',
-                'timestamp': datetime.now()
+                'timestamp': datetime.now(),
+                'packet_loss': reachability['packet_loss']
             }
 
         metrics = {
             'hostname': hostname,
             'ip': ip,
+            'type': node.get('type', 'unknown'),
             'status': 'online',
-            'timestamp': datetime.now()
+            'timestamp': datetime.now(),
+            'rtt_ms': reachability['rtt_ms'],
+            'packet_loss': reachability['packet_loss']
         }
 
         # Collect system metrics via SSH
-        if self.config.get('monitoring', {}).get('ssh_enabled', True):
-            # CPU
-            cpu_output = self.ssh_execute(ip, "top -bn1 | grep 'Cpu(s)' | awk '{print $2}'")
-            if cpu_output:
-                try:
-                    metrics['cpu_percent'] = float(cpu_output.strip().replace('%', '').replace(',', '.'))
-                except:
-                    pass
-
-            # Memory
-            mem_output = self.ssh_execute(ip, "free | grep Mem | awk '{print ($3/$2) * 100.0}'")
-            if mem_output:
-                try:
-                    metrics['memory_percent'] = float(mem_output.strip())
-                except:
-                    pass
-
-            # Disk
-            disk_output = self.ssh_execute(ip, "df -h / | tail -1 | awk '{print $5}'")
-            if disk_output:
-                try:
-                    metrics['disk_percent'] = float(disk_output.strip().replace('%', ''))
-                except:
-                    pass
-
-            # Uptime
-            uptime_output = self.ssh_execute(ip, "cat /proc/uptime | awk '{print $1}'")
-            if uptime_output:
-                try:
-                    metrics['uptime_seconds'] = int(float(uptime_output.strip()))
-                except:
-                    pass
-
-            # Services
-            services = ['frr', 'etcd', 'coredns', 'unbound', 'isc-dhcp-server']
-            metrics['services'] = {}
-            for service in services:
-                svc_output = self.ssh_execute(ip, f"systemctl is-active {service}")
-                if svc_output:
-                    metrics['services'][service] = svc_output.strip()
-
-            # OSPF neighbors
-            ospf_output = self.ssh_execute(ip, "sudo vtysh -c 'show ip ospf neighbor json'")
-            if ospf_output:
-                try:
-                    ospf_data = json.loads(ospf_output)
-                    metrics['ospf_neighbors'] = ospf_data.get('neighbors', {})
-                except:
-                    pass
+        monitoring = self.config.get('monitoring', {})
+        if monitoring.get('ssh_enabled', True):
+            probed = None
+            if monitoring.get('collection_mode', 'probe') == 'probe':
+                probed = self.collect_via_probe(ip)
+
+            if probed is not None:
+                metrics.update(probed)
+            else:
+                self.collect_via_commands(ip, metrics)
+
+            # CPU% is the delta against this node's counters from last cycle
+            counters = metrics.pop('cpu_counters', None)
+            if counters:
+                cpu = self.cpu_tracker.update(hostname, counters)
+                if cpu is not None:
+                    metrics['cpu_percent'] = cpu
 
         return metrics
 
-    def store_metrics(self, metrics: Dict):
-        """Store metrics in database"""
-        cursor = self.db.cursor()
-        hostname = metrics['hostname']
-        timestamp = metrics['timestamp']
-
-        # Update/insert node
-        cursor.execute('''
-            INSERT OR REPLACE INTO nodes (hostname, ip, type, last_seen, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (
-            hostname,
-            metrics.get('ip', ''),
-            metrics.get('type', 'unknown'),
-            timestamp,
-            metrics.get('status', 'unknown')
-        ))
-
-        # Store metrics if available
-        if 'cpu_percent' in metrics:
-            cursor.execute('''
-                INSERT INTO metrics (hostname, timestamp, cpu_percent, memory_percent, disk_percent, uptime_seconds)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                hostname,
-                timestamp,
-                metrics.get('cpu_percent'),
-                metrics.get('memory_percent'),
-                metrics.get('disk_percent'),
-                metrics.get('uptime_seconds')
-            ))
-
-        # Store service status
-        for service, status in metrics.get('services', {}).items():
-            cursor.execute('''
-                INSERT INTO services (hostname, timestamp, service_name, status)
-                VALUES (?, ?, ?, ?)
-            ''', (hostname, timestamp, service, status))
-
-        # Store OSPF neighbors
-        for neighbor_id, neighbor_data in metrics.get('ospf_neighbors', {}).items():
-            if isinstance(neighbor_data, dict):
-                cursor.execute('''
-                    INSERT INTO ospf_neighbors (hostname, timestamp, neighbor_id, neighbor_ip, state)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (
-                    hostname,
-                    timestamp,
-                    neighbor_id,
-                    neighbor_data.get('address', ''),
-                    neighbor_data.get('state', '')
-                ))
-
-        self.db.commit()
-
-    def check_alerts(self, metrics: Dict):
-        """Check for alert conditions"""
-        hostname = metrics['hostname']
-        thresholds = self.config.get('thresholds', {})
-        alerts = []
-
-        # Node unreachable
-        if metrics.get('status') == 'unreachable':
-            alerts.append({
-                'severity': 'critical',
-                'type': 'node_down',
-                'message': f"Node {hostname} is unreachable"
-            })
-
-        # High CPU
-        cpu = metrics.get('cpu_percent', 0)
-        if cpu >= thresholds.get('cpu_critical', 90):
-            alerts.append({
-                'severity': 'critical',
-                'type': 'high_cpu',
-                'message': f"CPU usage on {hostname} is {cpu:.1f}% (critical)"
-            })
-        elif cpu >= thresholds.get('cpu_warning', 70):
-            alerts.append({
-                'severity': 'warning',
-                'type': 'high_cpu',
-                'message': f"CPU usage on {hostname} is {cpu:.1f}% (warning)"
-            })
-
-        # High Memory
-        mem = metrics.get('memory_percent', 0)
-        if mem >= thresholds.get('memory_critical', 95):
-            alerts.append({
-                'severity': 'critical',
-                'type': 'high_memory',
-                'message': f"Memory usage on {hostname} is {mem:.1f}% (critical)"
-            })
-        elif mem >= thresholds.get('memory_warning', 80):
-            alerts.append({
-                'severity': 'warning',
-                'type': 'high_memory',
-                'message': f"Memory usage on {hostname} is {mem:.1f}% (warning)"
-            })
-
-        # High Disk
-        disk = metrics.get('disk_percent', 0)
-        if disk >= thresholds.get('disk_critical', 90):
-            alerts.append({
-                'severity': 'critical',
-                'type': 'high_disk',
-                'message': f"Disk usage on {hostname} is {disk:.1f}% (critical)"
-            })
-        elif disk >= thresholds.get('disk_warning', 80):
-            alerts.append({
-                'severity': 'warning',
-                'type': 'high_disk',
-                'message': f"Disk usage on {hostname} is {disk:.1f}% (warning)"
-            })
-
-        # Service failures
-        for service, status in metrics.get('services', {}).items():
-            if status != 'active':
-                alerts.append({
-                    'severity': 'critical',
-                    'type': 'service_down',
-                    'message': f"Service {service} on {hostname} is {status}"
-                })
-
-        # Store alerts
-        cursor = self.db.cursor()
-        for alert in alerts:
-            cursor.execute('''
-                INSERT INTO alerts (timestamp, hostname, severity, alert_type, message)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                datetime.now(),
-                hostname,
-                alert['severity'],
-                alert['type'],
-                alert['message']
-            ))
-        self.db.commit()
-
-        return alerts
-
-    def collect_all(self):
-        """Collect metrics from all nodes"""
+    def collect_via_probe(self, ip: str) -> Optional[Dict]:
+        """Collect all metrics in one SSH round trip using the probe script
+
+        Returns an empty dict if SSH failed, or None if the node answered
+        with something other than probe JSON (so the caller can fall back
+        to per-command collection).
+        """
+        output = self.ssh_execute(ip, self.probe_script)
+        if output is None:
+            return {}
+        return parse_probe_output(output)
+
+    def collect_via_commands(self, ip: str, metrics: Dict):
+        """Collect metrics with separate SSH commands (fallback mode)"""
+        # CPU counters, memory, uptime and disk in one read
+        procfs_output = self.ssh_execute(ip, PROCFS_COMMAND)
+        if procfs_output:
+            metrics.update(parse_procfs_dump(procfs_output))
+
+        # Services
+        metrics['services'] = {}
+        for service in SERVICES:
+            svc_output = self.ssh_execute(ip, f"systemctl is-active {service}")
+            if svc_output:
+                metrics['services'][service] = svc_output.strip()
+
+        # OSPF neighbors
+        ospf_output = self.ssh_execute(ip, "sudo vtysh -c 'show ip ospf neighbor json'")
+        if ospf_output:
+            try:
+                ospf_data = json.loads(ospf_output)
+                metrics['ospf_neighbors'] = ospf_data.get('neighbors', {})
+            except:
+                pass
+
+    def store_metrics(self, metrics: Dict, commit: bool = True):
+        """Store metrics in database
+
+        With commit=False the rows are only buffered until the next
+        flush of self.writer (see store_batch).
+        """
+        self.writer.add_metrics(metrics)
+        if commit:
+            self.writer.flush()
+
+    def check_alerts(self, metrics: Dict, commit: bool = True) -> List[Dict]:
+        """Check for alert conditions (see check_batch)"""
+        opened = self.check_batch([metrics])
+        if commit:
+            self.writer.flush()
+        return opened
+
+    def check_batch(self, batch: List[Dict]) -> List[Dict]:
+        """Run the alert rules over a cycle's metrics in one pass
+
+        node_down alerts of nodes behind another failed node are marked
+        as suppressed (see TopologySuppressor). The firing alerts of each
+        node are then handed to the alert engine, which opens, updates or
+        resolves its incidents. Returns the alerts that were newly opened.
+        """
+        opened = []
+        for metrics, alerts in self.suppressor.apply(self.rules.evaluate(batch, self.alerts.incidents)):
+            events = self.alerts.evaluate(metrics['hostname'], alerts, self.rules.types, metrics.get('timestamp'))
+            opened.extend(events['opened'])
+        return opened
+
+    def collect_all(self, skip_ips: Optional[set] = None):
+        """Collect metrics from all nodes
+
+        Nodes whose IP is in skip_ips (e.g. nodes currently pushing their
+        own metrics) are not polled.
+        """
         nodes = self.discover_nodes()
         print(f"Discovered {len(nodes)} nodes")
 
-        for node in nodes:
-            print(f"Collecting metrics from {node['hostname']} ({node['ip']})...", end=' ')
-            metrics = self.collect_node_metrics(node)
+        if skip_ips:
+            nodes = [node for node in nodes if node['ip'] not in skip_ips]
+            print(f"Polling {len(nodes)} nodes ({len(skip_ips)} pushing)")
 
-            if metrics:
-                self.store_metrics(metrics)
-                alerts = self.check_alerts(metrics)
+        return self.collect_nodes(nodes)
 
-                if metrics.get('status') == 'online':
-                    print("OK")
-                else:
-                    print("UNREACHABLE")
+    def ingest(self, batch: List[Dict]) -> int:
+        """Store and check alerts for a batch of pushed metrics"""
+        return self.store_batch(batch)
 
-                if alerts:
-                    print(f"  ⚠ {len(alerts)} alert(s) generated")
-            else:
-                print("FAILED")
+    def store_batch(self, batch: List[Dict]) -> int:
+        """Store metrics and check alerts for many nodes in one transaction
+
+        All rows are written with executemany and a single commit.
+        Returns the number of alerts opened.
+        """
+        for metrics in batch:
+            self.store_metrics(metrics, commit=False)
+        alert_count = len(self.check_batch(batch))
+        self.writer.flush()
+        return alert_count
+
+    def _collect_worker(self, node: Dict, reachability: Dict, index: int, done: queue.Queue):
+        """Collect one node on a worker thread and report back to collect_nodes"""
+        try:
+            done.put((index, self.collect_node_metrics(node, reachability), None))
+        except Exception as e:
+            done.put((index, None, e))
+
+    def collect_nodes(self, nodes: List[Dict]) -> List[Dict]:
+        """Collect metrics from nodes concurrently
+
+        At most max_concurrency nodes are polled at once. A node that runs
+        past node_deadline, or has not finished when cycle_deadline expires,
+        is recorded with status 'timeout' and its worker slot is handed to
+        the next node, so slow or dead nodes cannot hold up healthy ones.
+        Reachability of the whole node set is swept up front in one pass.
+        Results are stored and checked for alerts in one transaction at
+        the end of the cycle, and returned in the same order as nodes
+        (None where collection failed).
+        """
+        monitoring = self.config.get('monitoring', {})
+        max_concurrency = max(1, int(monitoring.get('max_concurrency', 16)))
+        node_deadline = monitoring.get('node_deadline', 20)
+        cycle_deadline = monitoring.get('cycle_deadline', monitoring.get('interval', 30))
+
+        cycle_start = time.monotonic()
+        cycle_end = cycle_start + cycle_deadline
+        reachability = self.sweep_reachability(nodes)
+        waiting = deque(enumerate(nodes))
+        running = {}
+        done = queue.Queue()
+        results = [None] * len(nodes)
+
+        while waiting or running:
+            now = time.monotonic()
+
+            # Expire nodes that ran out of time. Their threads are abandoned;
+            # the SSH and ping timeouts bound how long they linger.
+            for index, (node, begun) in list(running.items()):
+                if now >= cycle_end or now - begun >= node_deadline:
+                    del running[index]
+                    results[index] = self._report_result(node, self._timeout_metrics(node))
+
+            if now >= cycle_end:
+                while waiting:
+                    index, node = waiting.popleft()
+                    results[index] = self._report_result(node, self._timeout_metrics(node))
+                break
+
+            while waiting and len(running) < max_concurrency:
+                index, node = waiting.popleft()
+                running[index] = (node, now)
+                threading.Thread(
+                    target=self._collect_worker,
+                    args=(node, reachability[node['ip']], index, done),
+                    name=f"collect-{node['hostname']}",
+                    daemon=True
+                ).start()
+
+            if not running:
+                # The last nodes just expired; nothing left to wait for
+                break
+
+            next_deadline = min([cycle_end] + [begun + node_deadline for _, begun in running.values()])
+            try:
+                index, metrics, error = done.get(timeout=max(next_deadline - now, 0))
+            except queue.Empty:
+                continue
+
+            if index not in running:
+                # Finished after its deadline; already recorded as timeout
+                continue
+
+            node, _ = running.pop(index)
+            if error:
+                print(f"Error collecting from {node['hostname']}: {error}")
+            results[index] = self._report_result(node, metrics)
+
+        alert_count = self.store_batch([m for m in results if m])
+        if alert_count:
+            print(f"  ⚠ {alert_count} new alert(s)")
+
+        elapsed = time.monotonic() - cycle_start
+        statuses = [m.get('status') for m in results if m]
+        print(f"Collected {len(nodes)} nodes in {elapsed:.1f}s "
+              f"({statuses.count('online')} online, "
+              f"{statuses.count('unreachable')} unreachable, "
+              f"{statuses.count('timeout')} timed out)")
+
+        self.ssh_pool.evict_idle()
+        pool = self.ssh_pool.stats()
+        print(f"SSH pool: {pool['connections']} connections, "
+              f"{pool['handshakes']} handshakes, {pool['reuses']} reuses "
+              f"({pool['reuse_ratio']:.0%} reuse), {pool['failures']} failures")
+
+        return results
+
+    def _timeout_metrics(self, node: Dict) -> Dict:
+        """Result recorded for a node that missed its collection deadline"""
+        return {
+            'hostname': node['hostname'],
+            'ip': node['ip'],
+            'type': node.get('type', 'unknown'),
+            'status': 'timeout',
+            'timestamp': datetime.now()
+        }
+
+    def _report_result(self, node: Dict, metrics: Optional[Dict]) -> Optional[Dict]:
+        """Print the outcome of collecting one node"""
+        label = f"{node['hostname']} ({node['ip']})"
+        status = metrics.get('status') if metrics else None
+
+        if status is None:
+            print(f"  {label}: FAILED")
+        elif status == 'online':
+            print(f"  {label}: OK")
+        elif status == 'timeout':
+            print(f"  {label}: TIMEOUT")
+        else:
+            print(f"  {label}: UNREACHABLE")
+
+        return metrics
 
     def show_status(self):
         """Show network overview"""
-        cursor = self.db.cursor()
-
         # Count nodes by status
-        cursor.execute('''
-            SELECT status, COUNT(*) FROM nodes GROUP BY status
+        rows = self.storage.query('''
+            SELECT status, COUNT(*) AS count FROM nodes GROUP BY status
         ''')
-        status_counts = dict(cursor.fetchall())
+        status_counts = {row['status']: row['count'] for row in rows}
 
         # Count alerts
-        cursor.execute('''
-            SELECT severity, COUNT(*) FROM alerts
-            WHERE resolved = 0
+        rows = self.storage.query('''
+            SELECT severity, COUNT(*) AS count FROM alerts
+            WHERE resolved = ?
             GROUP BY severity
-        ''')
-        alert_counts = dict(cursor.fetchall())
+        ''', (False,))
+        alert_counts = {row['severity']: row['count'] for row in rows}
 
         print("╔═══════════════════════════════════════════════╗")
         print("║       Mesh Network Monitoring Status          ║")
@@ -450,36 +409,51 @@ class MeshMonitor:
 
     def list_nodes(self):
         """List all nodes"""
-        cursor = self.db.cursor()
-        cursor.execute('''
+        rows = self.storage.query('''
             SELECT hostname, ip, type, status, last_seen
             FROM nodes
             ORDER BY hostname
         ''')
 
-        print("╔═══════════════════════════════════════════════════════════════╗")
-        print("║                        Mesh Nodes                              ║")
-        print("╠═══════════════╦═══════════════╦═══════════╦══════════════════╣")
-        print("║ Hostname      ║ IP Address    ║ Status    ║ Last Seen        ║")
-        print("╠═══════════════╬═══════════════╬═══════════╬══════════════════╣")
-
-        for row in cursor.fetchall():
-            hostname, ip, node_type, status, last_seen = row
+        # Show which collector instance/worker owns each node when sharded
+        shards = ShardMap(self.config)
+
+        if shards.enabled:
+            print("╔═══════════════════════════════════════════════════════════════════════════════╗")
+            print("║                                  Mesh Nodes                                    ║")
+            print("╠═══════════════╦═══════════════╦═══════════╦══════════════════╦═══════════════╣")
+            print("║ Hostname      ║ IP Address    ║ Status    ║ Last Seen        ║ Shard         ║")
+            print("╠═══════════════╬═══════════════╬═══════════╬══════════════════╬═══════════════╣")
+        else:
+            print("╔═══════════════════════════════════════════════════════════════╗")
+            print("║                        Mesh Nodes                              ║")
+            print("╠═══════════════╦═══════════════╦═══════════╦══════════════════╣")
+            print("║ Hostname      ║ IP Address    ║ Status    ║ Last Seen        ║")
+            print("╠═══════════════╬═══════════════╬═══════════╬══════════════════╣")
+
+        for row in rows:
+            hostname, ip, status = row['hostname'], row['ip'], row['status']
+            last_seen = str(row['last_seen'])[:16]
             status_icon = "✓" if status == "online" else "✗"
-            print(f"║ {hostname:13} ║ {ip:13} ║ {status_icon} {status:7} ║ {last_seen:16} ║")
+            line = f"║ {hostname:13} ║ {ip:13} ║ {status_icon} {status:7} ║ {last_seen:16} ║"
+            if shards.enabled:
+                line += f" {shards.label(ip):13} ║"
+            print(line)
 
-        print("╚═══════════════╩═══════════════╩═══════════╩══════════════════╝")
+        if shards.enabled:
+            print("╚═══════════════╩═══════════════╩═══════════╩══════════════════╩═══════════════╝")
+        else:
+            print("╚═══════════════╩═══════════════╩═══════════╩══════════════════╝")
 
     def show_alerts(self):
         """Show active alerts"""
-        cursor = self.db.cursor()
-        cursor.execute('''
+        rows = self.storage.query('''
             SELECT timestamp, hostname, severity, message
             FROM alerts
-            WHERE resolved = 0
+            WHERE resolved = ?
             ORDER BY timestamp DESC
             LIMIT 20
-        ''')
+        ''', (False,))
 
         print("╔════════════════════════════════════════════════════════════════════╗")
         print("║                        Active Alerts                                ║")
@@ -487,22 +461,58 @@ class MeshMonitor:
         print("║ Time             ║ Level  ║ Message                                ║")
         print("╠══════════════════╬════════╬═══════════════════════════════════════╣")
 
-        for row in cursor.fetchall():
-            timestamp, hostname, severity, message = row
+        for row in rows:
+            timestamp = str(row['timestamp'])[:16]
+            severity, message = row['severity'], row['message']
             severity_icon = "🔴" if severity == "critical" else "⚠"
             print(f"║ {timestamp:16} ║ {severity_icon} {severity:5} ║ {message[:35]:35} ║")
 
         print("╚══════════════════╩════════╩═══════════════════════════════════════╝")
 
+    def check_schema(self) -> bool:
+        """Show the schema version and verify the hot queries use their indexes"""
+        print(f"Schema version: {self.storage.schema_version()}")
+        problems = self.storage.check_query_plans()
+        for problem in problems:
+            print(f"  ✗ {problem}")
+        if not problems:
+            print("  ✓ All hot queries use their indexes")
+        return not problems
+
+    def run_maintenance(self):
+        """Run retention, space reclaim and ANALYZE once, now"""
+        stats = Maintenance(self.storage, self.config).run(force=True)
+        retention, vacuum = stats['retention'], stats['vacuum']
+        print(f"Retention: {retention['rows']} rows deleted in {retention['batches']} batches "
+              f"({retention['seconds']}s)")
+        if vacuum['bytes'] is None:
+            print("Space reclaim: left to the database server")
+        else:
+            print(f"Space reclaim: {vacuum['bytes'] / 1048576:.1f} MB ({vacuum['seconds']}s)")
+        print(f"ANALYZE: {stats['analyze']['seconds']}s")
+
 
 def main():
     parser = argparse.ArgumentParser(description='Mesh Network Monitor')
     parser.add_argument('command', nargs='?', default='status',
-                       choices=['status', 'nodes', 'alerts', 'collect', 'discover'],
+                       choices=['status', 'nodes', 'alerts', 'collect', 'discover', 'schema', 'maintenance',
+                                'export', 'import'],
                        help='Command to execute')
     parser.add_argument('--config', default=CONFIG_FILE, help='Config file path')
 
+    transfer = parser.add_argument_group('export / import')
+    transfer.add_argument('--dir', help='Directory to export to or import from')
+    transfer.add_argument('--format', choices=FORMATS, default='csv', help='Export file format')
+    transfer.add_argument('--since', type=datetime.fromisoformat, help='Export rows from this time (ISO format)')
+    transfer.add_argument('--until', type=datetime.fromisoformat, help='Export rows before this time (ISO format)')
+    transfer.add_argument('--host', action='append', dest='hosts', help='Only export this node (repeatable)')
+    transfer.add_argument('--tables', nargs='+', choices=list(EXPORT_TABLES), help='Tables to transfer (default: all)')
+    transfer.add_argument('--chunk-size', type=int, default=10000, help='Rows per chunk')
+    transfer.add_argument('--resume', action='store_true', help='Continue an interrupted export')
+
     args = parser.parse_args()
+    if args.command in ('export', 'import') and not args.dir:
+        parser.error(f'{args.command} requires --dir')
 
     monitor = MeshMonitor(args.config)
 
@@ -515,10 +525,21 @@ def main():
     elif args.command == 'collect':
         monitor.collect_all()
     elif args.command == 'discover':
-        nodes = monitor.discover_nodes()
+        nodes = monitor.discover_nodes(force=True)
         print(f"Discovered {len(nodes)} nodes:")
         for node in nodes:
             print(f"  - {node['hostname']} ({node['ip']})")
+    elif args.command == 'schema':
+        sys.exit(0 if monitor.check_schema() else 1)
+    elif args.command == 'maintenance':
+        monitor.run_maintenance()
+    elif args.command == 'export':
+        print(f"Exporting to {args.dir} ({args.format})...")
+        Exporter(monitor.storage, args.dir, fmt=args.format, chunk_size=args.chunk_size,
+                 since=args.since, until=args.until, hosts=args.hosts, tables=args.tables).run(resume=args.resume)
+    elif args.command == 'import':
+        print(f"Importing from {args.dir}...")
+        Importer(monitor.storage, args.dir, chunk_size=args.chunk_size, tables=args.tables).run()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Node Registry
+Cached, indexed list of nodes from config and OSPF discovery
+"""
+
+import ipaddress
+import json
+import subprocess
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+def _walk(data) -> Iterator[Dict]:
+    """Yield every dict nested anywhere in decoded JSON"""
+    if isinstance(data, dict):
+        yield data
+        for value in data.values():
+            yield from _walk(value)
+    elif isinstance(data, list):
+        for value in data:
+            yield from _walk(value)
+
+
+def parse_router_lsas(ospf_data: Dict) -> Dict[str, List[str]]:
+    """Map advertising router ID -> interface addresses from router LSAs
+
+    Tolerates the layout differences between FRR versions by looking for
+    any dict with an advertising router and collecting the addresses of
+    its stub (/32) and point-to-point links.
+    """
+    routers: Dict[str, List[str]] = {}
+
+    for lsa in _walk(ospf_data):
+        router_id = lsa.get('advertisingRouter') or lsa.get('advRouter')
+        if not router_id or not isinstance(router_id, str):
+            continue
+
+        addresses = routers.setdefault(router_id, [])
+        for link in _walk({k: v for k, v in lsa.items() if 'link' in k.lower()}):
+            link_type = str(link.get('linkType', link.get('type', ''))).lower()
+            address = None
+            if 'stub' in link_type:
+                mask = link.get('networkMask') or link.get('linkData') or ''
+                if mask == '255.255.255.255':
+                    address = link.get('networkAddress') or link.get('linkId') or link.get('linkID')
+            elif 'routerInterfaceAddress' in link:
+                address = link['routerInterfaceAddress']
+
+            if address and address not in addresses:
+                addresses.append(address)
+
+    return routers
+
+
+class NodeRegistry:
+    """Nodes indexed by IP and hostname, refreshed at most every ttl seconds
+
+    Configured nodes (network.nodes) are always present. With
+    network.auto_discovery enabled, every router in the OSPF link-state
+    database is added, so routers that are not adjacent to the monitoring
+    host are found too. The direct neighbor table is used as a fallback
+    when the LSDB query fails. Every address a router advertises maps to
+    its node (by_address), so traffic from any of its interfaces can be
+    attributed to it.
+    """
+
+    def __init__(self, config: dict, ttl: Optional[float] = None):
+        network = config.get('network', {})
+        self.configured = network.get('nodes') or []
+        self.auto_discovery = network.get('auto_discovery', True)
+        self.ttl = ttl if ttl is not None else network.get('discovery_ttl', 300)
+        self.mesh_network = ipaddress.ip_network(network.get('mesh_prefix', '169.254.0.0/16'))
+
+        self.by_ip: Dict[str, Dict] = {}
+        self.by_hostname: Dict[str, Dict] = {}
+        self.by_address: Dict[str, Dict] = {}
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+    def nodes(self, force: bool = False) -> List[Dict]:
+        """Current node list, refreshing discovery if the TTL has expired"""
+        with self._lock:
+            if force or self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.ttl:
+                self._refresh()
+            return list(self.by_ip.values())
+
+    def get(self, ip: str) -> Optional[Dict]:
+        return self.by_ip.get(ip)
+
+    def get_by_hostname(self, hostname: str) -> Optional[Dict]:
+        return self.by_hostname.get(hostname)
+
+    def find(self, address: str) -> Optional[Dict]:
+        """Node owning any of its addresses, refreshing discovery if the TTL has expired"""
+        with self._lock:
+            if self.refreshed_at is None or time.monotonic() - self.refreshed_at >= self.ttl:
+                self._refresh()
+            return self.by_address.get(address)
+
+    def _refresh(self):
+        self.by_ip = {}
+        self.by_hostname = {}
+        self.by_address = {}
+
+        for node in self.configured:
+            self._add(dict(node))
+
+        if self.auto_discovery:
+            try:
+                discovered = self._discover_lsdb() or self._discover_neighbors()
+            except Exception as e:
+                print(f"Warning: OSPF discovery failed: {e}")
+                discovered = []
+
+            for addresses in discovered:
+                # Routers already known under any of their addresses only
+                # add their other addresses
+                known = next((self.by_ip[address] for address in addresses if address in self.by_ip), None)
+                if known is None:
+                    ip = self._pick_address(addresses)
+                    known = {'hostname': self._hostname_for(ip), 'ip': ip, 'type': 'unknown'}
+                    self._add(known)
+                for address in addresses:
+                    self.by_address.setdefault(address, known)
+
+        self.refreshed_at = time.monotonic()
+
+    def _add(self, node: Dict):
+        self.by_ip[node['ip']] = node
+        self.by_hostname[node['hostname']] = node
+        self.by_address[node['ip']] = node
+
+    def _hostname_for(self, ip: str) -> str:
+        hostname = f'node-{ip.split(".")[-1]}'
+        if hostname in self.by_hostname:
+            hostname = f'node-{ip.replace(".", "-")}'
+        return hostname
+
+    def _pick_address(self, addresses: List[str]) -> str:
+        """Prefer an address on the mesh network for polling"""
+        for address in addresses:
+            try:
+                if ipaddress.ip_address(address) in self.mesh_network:
+                    return address
+            except ValueError:
+                continue
+        return addresses[0]
+
+    def _vtysh_json(self, command: str) -> Optional[Dict]:
+        result = subprocess.run(
+            ['vtysh', '-c', command],
+            capture_output=True,
+            text=True,
+            timeout=5
+        )
+        if result.returncode != 0:
+            return None
+        return json.loads(result.stdout)
+
+    def _discover_lsdb(self) -> List[List[str]]:
+        """Every router in the LSDB, as lists of its addresses"""
+        data = self._vtysh_json('show ip ospf database router json')
+        if not data:
+            return []
+
+        own_id = data.get('routerId')
+        discovered = []
+        for router_id, addresses in parse_router_lsas(data).items():
+            if router_id == own_id:
+                continue
+            discovered.append(addresses + [router_id] if router_id not in addresses else addresses)
+        return discovered
+
+    def _discover_neighbors(self) -> List[List[str]]:
+        """Direct OSPF neighbors only"""
+        data = self._vtysh_json('show ip ospf neighbor json')
+        if not data:
+            return []
+
+        discovered = []
+        for neighbor_id, neighbor_data in data.get('neighbors', {}).items():
+            # FRR 8+ returns a list of adjacencies per neighbor
+            entries = neighbor_data if isinstance(neighbor_data, list) else [neighbor_data]
+            for entry in entries:
+                if isinstance(entry, dict) and entry.get('address'):
+                    discovered.append([entry['address']])
+        return discovered
@@ -4,39 +4,125 @@ Mesh Network Monitor - Notification System
 Sends alerts via Email, Telegram, Discord, Slack, and custom webhooks
 """
 
+import queue
 import smtplib
+import threading
+import time
 import requests
 import yaml
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime
 
+CHANNELS = ('email', 'telegram', 'discord', 'slack', 'webhook')
+
+SEVERITY_ORDER = ('info', 'warning', 'critical')
+
+
+def digest_alert(alerts: List[Dict], top: int = 5, window: Optional[float] = None) -> Dict:
+    """One alert summing up several, for the channels' usual formatting
+
+    The message counts the alerts by type and severity and names the top
+    hosts by alert count. The original alerts are kept under 'alerts'.
+    """
+    by_type: Dict[str, int] = {}
+    by_severity: Dict[str, int] = {}
+    by_host: Dict[str, int] = {}
+    for alert in alerts:
+        by_type[alert.get('type', 'alert')] = by_type.get(alert.get('type', 'alert'), 0) + 1
+        by_severity[alert.get('severity', 'unknown')] = by_severity.get(alert.get('severity', 'unknown'), 0) + 1
+        by_host[alert.get('hostname', 'unknown')] = by_host.get(alert.get('hostname', 'unknown'), 0) + 1
+
+    hosts = sorted(by_host.items(), key=lambda item: (-item[1], item[0]))
+    top_hosts = ', '.join(f'{host} ({count})' if count > 1 else host for host, count in hosts[:top])
+    if len(hosts) > top:
+        top_hosts += f' and {len(hosts) - top} more'
+
+    period = f' in the last {window:.0f}s' if window else ''
+    lines = [
+        f'{len(alerts)} alerts on {len(hosts)} node(s){period}',
+        'By type: ' + ', '.join(f'{name} {count}' for name, count in sorted(by_type.items(), key=lambda item: -item[1])),
+        'By severity: ' + ', '.join(f'{name} {count}' for name, count in sorted(by_severity.items(), key=lambda item: -item[1])),
+        f'Nodes: {top_hosts}'
+    ]
+    severity = max(by_severity, key=lambda name: SEVERITY_ORDER.index(name) if name in SEVERITY_ORDER else -1)
+    return {
+        'timestamp': datetime.now().isoformat(),
+        'hostname': f'{len(hosts)} nodes',
+        'severity': severity,
+        'type': next(iter(by_type)) if len(by_type) == 1 else 'digest',
+        'message': '\n'.join(lines),
+        'alerts': alerts
+    }
 
-class NotificationManager:
-    def __init__(self, config: dict):
-        self.config = config.get('notifications', {})
 
-    def send_alert(self, alert: Dict):
-        """Send alert via all enabled notification channels"""
-        results = []
-
-        if self.config.get('email', {}).get('enabled', False):
-            results.append(('email', self.send_email(alert)))
+class NotificationManager:
+    """Formats and sends alerts, one method per channel
 
-        if self.config.get('telegram', {}).get('enabled', False):
-            results.append(('telegram', self.send_telegram(alert)))
+    HTTP channels each keep a requests.Session, so the HTTPS connection
+    is reused between alerts, and email keeps its SMTP session (STARTTLS
+    and login done once) until the server drops it. Each channel's
+    connection must only be used by one thread at a time, which
+    NotificationDispatcher guarantees.
+    """
 
-        if self.config.get('discord', {}).get('enabled', False):
-            results.append(('discord', self.send_discord(alert)))
+    def __init__(self, config: dict):
+        self.config = config.get('notifications', {})
+        self._sessions: Dict[str, requests.Session] = {}
+        self._smtp: Optional[smtplib.SMTP] = None
 
-        if self.config.get('slack', {}).get('enabled', False):
-            results.append(('slack', self.send_slack(alert)))
+    def enabled_channels(self) -> List[str]:
+        return [channel for channel in CHANNELS if self.config.get(channel, {}).get('enabled', False)]
 
-        if self.config.get('webhook', {}).get('enabled', False):
-            results.append(('webhook', self.send_webhook(alert)))
+    def send(self, channel: str, alert: Dict) -> bool:
+        """Send alert via one channel"""
+        return getattr(self, f'send_{channel}')(alert)
 
-        return results
+    def send_alert(self, alert: Dict):
+        """Send alert via all enabled notification channels, one after another"""
+        return [(channel, self.send(channel, alert)) for channel in self.enabled_channels()]
+
+    def _http(self, channel: str) -> requests.Session:
+        session = self._sessions.get(channel)
+        if session is None:
+            session = self._sessions[channel] = requests.Session()
+        return session
+
+    def _smtp_session(self) -> smtplib.SMTP:
+        """The open SMTP session, reconnecting if the server dropped it"""
+        if self._smtp is not None:
+            try:
+                self._smtp.noop()
+                return self._smtp
+            except (smtplib.SMTPException, OSError):
+                self._close_smtp()
+
+        email_config = self.config['email']
+        server = smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port'], timeout=10)
+        try:
+            server.starttls()
+            server.login(email_config['smtp_user'], email_config['smtp_password'])
+        except Exception:
+            server.close()
+            raise
+        self._smtp = server
+        return server
+
+    def _close_smtp(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self._smtp.close()
+            self._smtp = None
+
+    def close(self):
+        """Close the kept SMTP and HTTP connections"""
+        self._close_smtp()
+        for session in self._sessions.values():
+            session.close()
+        self._sessions = {}
 
     def send_email(self, alert: Dict) -> bool:
         """Send email notification"""
@@ -52,16 +138,15 @@ class NotificationManager:
             body = self._format_email_body(alert)
             msg.attach(MIMEText(body, 'plain'))
 
-            # Send via SMTP
-            with smtplib.SMTP(email_config['smtp_server'], email_config['smtp_port']) as server:
-                server.starttls()
-                server.login(email_config['smtp_user'], email_config['smtp_password'])
-                server.send_message(msg)
+            # Send via the kept SMTP session
+            self._smtp_session().send_message(msg)
 
             return True
 
         except Exception as e:
             print(f"Email notification failed: {e}")
+            # Start over with a fresh session next time
+            self._close_smtp()
             return False
 
     def send_telegram(self, alert: Dict) -> bool:
@@ -80,7 +165,7 @@ class NotificationManager:
                 'parse_mode': 'Markdown'
             }
 
-            response = requests.post(url, data=data, timeout=10)
+            response = self._http('telegram').post(url, data=data, timeout=10)
             return response.status_code == 200
 
         except Exception as e:
@@ -96,7 +181,7 @@ class NotificationManager:
             embed = self._format_discord_embed(alert)
 
             data = {'embeds': [embed]}
-            response = requests.post(webhook_url, json=data, timeout=10)
+            response = self._http('discord').post(webhook_url, json=data, timeout=10)
             return response.status_code == 204
 
         except Exception as e:
@@ -111,7 +196,7 @@ class NotificationManager:
 
             message = self._format_slack_message(alert)
 
-            response = requests.post(webhook_url, json=message, timeout=10)
+            response = self._http('slack').post(webhook_url, json=message, timeout=10)
             return response.status_code == 200
 
         except Exception as e:
@@ -133,11 +218,16 @@ class NotificationManager:
                 'type': alert.get('type', ''),
                 'message': alert.get('message', '')
             }
+            if 'alerts' in alert:
+                # Digest: the alerts it stands for
+                data['alerts'] = [
+                    {key: str(value) for key, value in item.items()} for item in alert['alerts']
+                ]
 
             if method.upper() == 'POST':
-                response = requests.post(url, json=data, headers=headers, timeout=10)
+                response = self._http('webhook').post(url, json=data, headers=headers, timeout=10)
             elif method.upper() == 'PUT':
-                response = requests.put(url, json=data, headers=headers, timeout=10)
+                response = self._http('webhook').put(url, json=data, headers=headers, timeout=10)
             else:
                 return False
 
@@ -320,21 +410,150 @@ View dashboard: http://monitor.mesh.local:8080
             'message': 'This is a test notification from Mesh Network Monitor'
         }
 
-        if notification_type == 'email':
-            return self.send_email(test_alert)
-        elif notification_type == 'telegram':
-            return self.send_telegram(test_alert)
-        elif notification_type == 'discord':
-            return self.send_discord(test_alert)
-        elif notification_type == 'slack':
-            return self.send_slack(test_alert)
-        elif notification_type == 'webhook':
-            return self.send_webhook(test_alert)
+        if notification_type in CHANNELS:
+            try:
+                return self.send(notification_type, test_alert)
+            finally:
+                self.close()
         else:
             print(f"Unknown notification type: {notification_type}")
             return False
 
 
+class NotificationDispatcher:
+    """Sends notifications in the background, one worker thread per channel
+
+    submit() only queues the alert on each enabled channel's queue, so a
+    slow or unreachable endpoint delays its own channel and never the
+    collector loop. A failed send is retried up to notifications.dispatch
+    .retries times, waiting backoff, 2 x backoff, ... (at most
+    max_backoff) seconds in between. Outcomes are collected and handed
+    out by results().
+
+    During alert storms alerts are batched per channel: an alert that
+    arrives within digest_window seconds of the channel's last message is
+    held, and everything held when that window runs out goes out as one
+    digest (digest_alert). An isolated alert is still sent at once.
+    """
+
+    def __init__(self, manager: NotificationManager, config: dict):
+        dispatch = config.get('notifications', {}).get('dispatch', {})
+        self.retries = dispatch.get('retries', 3)
+        self.backoff = dispatch.get('backoff', 2)
+        self.max_backoff = dispatch.get('max_backoff', 60)
+        queue_size = dispatch.get('queue_size', 1000)
+        self.digest_top = dispatch.get('digest_top', 5)
+
+        self.manager = manager
+        self._queues = {channel: queue.Queue(maxsize=queue_size) for channel in manager.enabled_channels()}
+        # notifications.<channel>.digest_window over dispatch.digest_window; 0 disables
+        self.windows = {
+            channel: manager.config.get(channel, {}).get('digest_window', dispatch.get('digest_window', 30))
+            for channel in self._queues
+        }
+        self._results = queue.Queue()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        for channel in self._queues:
+            thread = threading.Thread(target=self._worker, args=(channel,), name=f'notify-{channel}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, alert: Dict) -> List[str]:
+        """Queue alert on every enabled channel; returns the channels"""
+        for channel, channel_queue in self._queues.items():
+            try:
+                channel_queue.put_nowait(alert)
+            except queue.Full:
+                print(f"Notification queue for {channel} is full, dropping alert")
+                self._results.put(([alert], channel, False, 0))
+        return list(self._queues)
+
+    def pending(self) -> int:
+        return sum(channel_queue.qsize() for channel_queue in self._queues.values())
+
+    def results(self) -> List[tuple]:
+        """(alerts, channel, success, attempts) of the sends finished since the
+        last call; alerts holds several alerts for a digest"""
+        finished = []
+        while True:
+            try:
+                finished.append(self._results.get_nowait())
+            except queue.Empty:
+                return finished
+
+    def _worker(self, channel: str):
+        channel_queue = self._queues[channel]
+        window = self.windows[channel]
+        held: List[Dict] = []
+        flush_at = None
+        last_sent = None
+        while True:
+            timeout = None if flush_at is None else max(flush_at - time.monotonic(), 0)
+            try:
+                alert = channel_queue.get(timeout=timeout)
+            except queue.Empty:
+                alert = False
+            if alert is None:
+                # Stopping: what is held goes out now
+                if held:
+                    self._deliver(channel, held)
+                break
+
+            now = time.monotonic()
+            if alert:
+                if window and (held or (last_sent is not None and now - last_sent < window)):
+                    held.append(alert)
+                    if flush_at is None:
+                        # A digest at most every window seconds
+                        flush_at = last_sent + window
+                else:
+                    self._deliver(channel, [alert])
+                    last_sent = time.monotonic()
+
+            if flush_at is not None and time.monotonic() >= flush_at:
+                self._deliver(channel, held)
+                held, flush_at = [], None
+                last_sent = time.monotonic()
+
+    def _deliver(self, channel: str, alerts: List[Dict]):
+        """Send one alert, or a digest of several, retrying on failure"""
+        message = alerts[0] if len(alerts) == 1 else digest_alert(alerts, self.digest_top, self.windows[channel])
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                success = self.manager.send(channel, message)
+            except Exception as e:
+                print(f"{channel} notification failed: {e}")
+                success = False
+            if success or attempts > self.retries:
+                break
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            # Retries are abandoned on shutdown
+            if self._stop.wait(delay):
+                break
+        self._results.put((alerts, channel, success, attempts))
+
+    def stop(self, timeout: float = 10):
+        """Give queued notifications up to timeout seconds to go out, then
+        abandon retries and close the connections"""
+        for channel_queue in self._queues.values():
+            try:
+                channel_queue.put_nowait(None)
+            except queue.Full:
+                pass
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(timeout=max(deadline - time.monotonic(), 0))
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=1)
+        self.manager.close()
+
+
 if __name__ == '__main__':
     import sys
 
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Node Probe
+Single remote script that reports all node metrics as one JSON document
+"""
+
+import json
+from typing import Dict, List, Optional
+
+from procfs import parse_cpu_line
+
+
+# POSIX sh so it runs on any node without extra packages. Everything the
+# collector needs comes back in one round trip; values that cannot be read
+# are reported as null. CPU is sent as the raw /proc/stat line so the
+# collector can compute usage over the whole interval between cycles.
+# {services} is replaced with the unit list.
+PROBE_TEMPLATE = r'''
+cpu=$(head -n 1 /proc/stat)
+
+mem=$(awk '/^MemTotal:/ { t = $2 } /^MemAvailable:/ { a = $2 } END { if (t > 0) printf "%.1f", (t - a) * 100 / t }' /proc/meminfo)
+disk=$(df -P / 2>/dev/null | awk 'NR == 2 { sub("%", "", $5); print $5 }')
+uptime=$(awk '{ printf "%d", $1 }' /proc/uptime)
+
+services=""
+states=$(systemctl is-active {services} 2>/dev/null)
+if [ -n "$states" ]; then
+    set -- $states
+    for unit in {services}; do
+        [ $# -gt 0 ] || break
+        [ -n "$services" ] && services="$services,"
+        services="$services\"$unit\":\"$1\""
+        shift
+    done
+fi
+
+ospf=$(sudo -n vtysh -c 'show ip ospf neighbor json' 2>/dev/null)
+case "$ospf" in
+    "{"*) ;;
+    *) ospf=null ;;
+esac
+
+printf '{"cpu_stat":"%s","memory_percent":%s,"disk_percent":%s,"uptime_seconds":%s,"services":{%s},"ospf":%s}\n' \
+    "$cpu" "${mem:-null}" "${disk:-null}" "${uptime:-null}" "$services" "$ospf"
+'''
+
+
+def build_probe_script(services: List[str]) -> str:
+    """Render the probe script for the given systemd units"""
+    return PROBE_TEMPLATE.replace('{services}', ' '.join(services))
+
+
+def parse_probe_output(output: str) -> Optional[Dict]:
+    """Turn probe output into metrics dict fields, or None if it is unusable"""
+    try:
+        doc = json.loads(output)
+    except (TypeError, ValueError):
+        return None
+
+    if not isinstance(doc, dict):
+        return None
+
+    return probe_fields(doc)
+
+
+def probe_fields(doc: Dict) -> Dict:
+    """Extract metrics dict fields from a decoded probe document"""
+    metrics = {}
+    for key, cast in (('cpu_percent', float),
+                      ('memory_percent', float),
+                      ('disk_percent', float),
+                      ('uptime_seconds', int)):
+        value = doc.get(key)
+        if value is not None:
+            try:
+                metrics[key] = cast(value)
+            except (TypeError, ValueError):
+                pass
+
+    # Raw counters from the probe; turned into cpu_percent by the collector
+    cpu_stat = doc.get('cpu_stat')
+    if isinstance(cpu_stat, str):
+        counters = parse_cpu_line(cpu_stat)
+        if counters:
+            metrics['cpu_counters'] = counters
+
+    services = doc.get('services')
+    if isinstance(services, dict):
+        metrics['services'] = {name: status for name, status in services.items() if status}
+
+    ospf = doc.get('ospf')
+    if isinstance(ospf, dict):
+        metrics['ospf_neighbors'] = ospf.get('neighbors', {})
+
+    return metrics
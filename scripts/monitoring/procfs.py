@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Procfs Metrics
+Reads CPU, memory, uptime and disk usage from one raw procfs dump
+"""
+
+import threading
+from typing import Dict, Optional, Tuple
+
+# One remote command: first line of /proc/stat, the two meminfo lines we
+# need, /proc/uptime and statvfs("/") as printed by stat -f
+PROCFS_COMMAND = (
+    "head -n 1 /proc/stat; "
+    "grep -E '^(MemTotal|MemAvailable):' /proc/meminfo; "
+    "cat /proc/uptime; "
+    "stat -f -c 'statvfs %S %b %f %a' /"
+)
+
+
+def parse_cpu_line(line: str) -> Optional[Tuple[int, int]]:
+    """Return (total, idle) jiffies from the aggregate 'cpu' line of /proc/stat"""
+    fields = line.split()
+    if not fields or fields[0] != 'cpu' or len(fields) < 5:
+        return None
+    try:
+        values = [int(v) for v in fields[1:9]]
+    except ValueError:
+        return None
+    # user nice system idle iowait irq softirq steal; guest is already in user
+    idle = values[3] + (values[4] if len(values) > 4 else 0)
+    return sum(values), idle
+
+
+def parse_procfs_dump(output: str) -> Dict:
+    """Parse PROCFS_COMMAND output
+
+    Returns memory_percent, uptime_seconds and disk_percent where
+    available, plus 'cpu_counters' as (total, idle) for CpuDeltaTracker.
+    """
+    result = {}
+    meminfo = {}
+
+    for line in output.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+
+        if fields[0] == 'cpu':
+            counters = parse_cpu_line(line)
+            if counters:
+                result['cpu_counters'] = counters
+        elif fields[0] in ('MemTotal:', 'MemAvailable:') and len(fields) >= 2:
+            try:
+                meminfo[fields[0][:-1]] = int(fields[1])
+            except ValueError:
+                pass
+        elif fields[0] == 'statvfs' and len(fields) == 5:
+            try:
+                _, total, free, avail = (int(v) for v in fields[1:])
+            except ValueError:
+                continue
+            used = total - free
+            # Same formula as df: reserved blocks don't count as available
+            if used + avail > 0:
+                result['disk_percent'] = round(used * 100.0 / (used + avail), 1)
+        elif len(fields) == 2 and 'uptime_seconds' not in result:
+            try:
+                result['uptime_seconds'] = int(float(fields[0]))
+            except ValueError:
+                pass
+
+    total = meminfo.get('MemTotal')
+    if total and 'MemAvailable' in meminfo:
+        result['memory_percent'] = round((total - meminfo['MemAvailable']) * 100.0 / total, 1)
+
+    return result
+
+
+class CpuDeltaTracker:
+    """Per-node CPU counters from the previous cycle
+
+    CPU% is computed from the jiffies consumed between two collections of
+    the same node, so it reflects the whole interval rather than a single
+    snapshot. The first sample of a node (or the first after a reboot,
+    when counters go backwards) falls back to the average since boot.
+    """
+
+    def __init__(self):
+        self._previous: Dict[str, Tuple[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def update(self, hostname: str, counters: Tuple[int, int]) -> Optional[float]:
+        """Record counters for hostname and return CPU% since the last call"""
+        total, idle = counters
+        with self._lock:
+            previous = self._previous.get(hostname)
+            self._previous[hostname] = counters
+
+        if previous and total > previous[0] and idle >= previous[1]:
+            delta_total = total - previous[0]
+            delta_idle = idle - previous[1]
+        else:
+            delta_total, delta_idle = total, idle
+
+        if delta_total <= 0:
+            return None
+        return round((delta_total - delta_idle) * 100.0 / delta_total, 1)
+
+    def forget(self, hostname: str):
+        """Drop the baseline of a node that is no longer polled"""
+        with self._lock:
+            self._previous.pop(hostname, None)
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Reachability Sweeper
+Checks the whole node set in one pass using ICMP echo or TCP connect
+"""
+
+import errno
+import os
+import selectors
+import socket
+import struct
+import time
+from typing import Dict, List, Optional
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def _echo_request(ident: int, seq: int) -> bytes:
+    payload = struct.pack('!d', time.monotonic()) + b'mesh-monitor'
+    header = struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    checksum = _checksum(header + payload)
+    return struct.pack('!BBHHH', ICMP_ECHO_REQUEST, 0, checksum, ident, seq) + payload
+
+
+class ReachabilitySweeper:
+    """Concurrent liveness check for a set of nodes
+
+    method 'icmp' sends echo requests to every node from a single socket
+    (unprivileged ICMP datagram socket, or a raw socket when running as
+    root) and collects replies until the timeout. method 'tcp' opens
+    non-blocking connections to tcp_port instead; a refused connection
+    still proves the host is up. 'auto' uses ICMP when the kernel allows
+    it and falls back to TCP otherwise. A full sweep takes about one
+    timeout regardless of the number of nodes.
+    """
+
+    def __init__(self, method: str = 'auto', timeout: float = 2, count: int = 1,
+                 tcp_port: int = 22):
+        self.method = method
+        self.timeout = timeout
+        self.count = max(1, count)
+        self.tcp_port = tcp_port
+        self.ident = os.getpid() & 0xffff
+
+    def _open_icmp_socket(self):
+        """Return (socket, is_raw) or (None, False) if ICMP is not permitted"""
+        for sock_type, is_raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+            try:
+                sock = socket.socket(socket.AF_INET, sock_type, socket.IPPROTO_ICMP)
+                sock.setblocking(False)
+                return sock, is_raw
+            except (PermissionError, OSError):
+                continue
+        return None, False
+
+    def sweep(self, targets: List[str]) -> Dict[str, Dict]:
+        """Check every target and return {ip: result}
+
+        Each result has 'reachable', 'rtt_ms' (best round trip, or None),
+        'packet_loss' (0.0 - 1.0) and the 'method' used.
+        """
+        results = {}
+        addresses = {}
+        for target in dict.fromkeys(targets):
+            try:
+                addresses[target] = socket.gethostbyname(target)
+            except (socket.gaierror, UnicodeError):
+                results[target] = self._result(False, None, 1.0, 'resolve')
+
+        if not addresses:
+            return results
+
+        sock, is_raw = (None, False)
+        if self.method in ('auto', 'icmp'):
+            sock, is_raw = self._open_icmp_socket()
+
+        if sock is not None:
+            try:
+                swept = self._sweep_icmp(sock, is_raw, set(addresses.values()))
+            finally:
+                sock.close()
+            method = 'icmp'
+        else:
+            if self.method == 'icmp':
+                print("Warning: ICMP sockets not permitted, falling back to TCP reachability checks")
+            swept = self._sweep_tcp(set(addresses.values()))
+            method = 'tcp'
+
+        for target, address in addresses.items():
+            rtts, sent = swept[address]
+            results[target] = self._result(
+                bool(rtts),
+                round(min(rtts) * 1000, 3) if rtts else None,
+                1.0 - len(rtts) / sent if sent else 1.0,
+                method
+            )
+
+        return results
+
+    def _result(self, reachable: bool, rtt_ms: Optional[float], loss: float, method: str) -> Dict:
+        return {
+            'reachable': reachable,
+            'rtt_ms': rtt_ms,
+            'packet_loss': loss,
+            'method': method
+        }
+
+    def _sweep_icmp(self, sock: socket.socket, is_raw: bool, addresses: set) -> Dict:
+        """Send count echo requests per address and wait for the replies"""
+        swept = {address: ([], 0) for address in addresses}
+        outstanding = {}
+        seq = 0
+
+        for _ in range(self.count):
+            for address in addresses:
+                seq = (seq + 1) & 0xffff
+                try:
+                    sock.sendto(_echo_request(self.ident, seq), (address, 0))
+                except OSError:
+                    # No route / host unreachable: counts as lost
+                    pass
+                rtts, sent = swept[address]
+                swept[address] = (rtts, sent + 1)
+                outstanding[seq] = (address, time.monotonic())
+
+        selector = selectors.DefaultSelector()
+        selector.register(sock, selectors.EVENT_READ)
+        deadline = time.monotonic() + self.timeout
+
+        try:
+            while outstanding:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not selector.select(remaining):
+                    break
+
+                while True:
+                    try:
+                        data, (source, _) = sock.recvfrom(2048)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    received = time.monotonic()
+
+                    if is_raw:
+                        data = data[(data[0] & 0x0f) * 4:]
+                    if len(data) < 8:
+                        continue
+
+                    icmp_type, _, _, ident, reply_seq = struct.unpack('!BBHHH', data[:8])
+                    if icmp_type != ICMP_ECHO_REPLY:
+                        continue
+                    # Datagram sockets get their identifier rewritten by the
+                    # kernel and only see their own replies
+                    if is_raw and ident != self.ident:
+                        continue
+
+                    sent_to = outstanding.get(reply_seq)
+                    if sent_to is None or sent_to[0] != source:
+                        continue
+                    del outstanding[reply_seq]
+                    swept[source][0].append(received - sent_to[1])
+        finally:
+            selector.close()
+
+        return swept
+
+    def _sweep_tcp(self, addresses: set) -> Dict:
+        """Open a non-blocking connection to every address at once"""
+        swept = {address: ([], 1) for address in addresses}
+        selector = selectors.DefaultSelector()
+
+        for address in addresses:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            started = time.monotonic()
+            err = sock.connect_ex((address, self.tcp_port))
+            if err in (0, errno.ECONNREFUSED):
+                swept[address][0].append(time.monotonic() - started)
+                sock.close()
+            elif err in (errno.EINPROGRESS, errno.EWOULDBLOCK):
+                selector.register(sock, selectors.EVENT_WRITE, (address, started))
+            else:
+                sock.close()
+
+        deadline = time.monotonic() + self.timeout
+        try:
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    address, started = key.data
+                    err = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    if err in (0, errno.ECONNREFUSED):
+                        swept[address][0].append(time.monotonic() - started)
+                    selector.unregister(key.fileobj)
+                    key.fileobj.close()
+        finally:
+            for key in list(selector.get_map().values()):
+                key.fileobj.close()
+            selector.close()
+
+        return swept
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Metric Rollups
+Downsamples metric history into 1m/5m/1h tiers
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from storage import Storage, ROLLUP_TIERS, ROLLUP_FIELDS, ROLLUP_STATS, parse_timestamp, to_epoch, from_epoch
+from chunks import read_metrics, compact_chunks
+
+# Raw metric column -> rollup field
+RAW_FIELDS = {
+    'cpu_percent': 'cpu',
+    'memory_percent': 'memory',
+    'disk_percent': 'disk'
+}
+
+# Each tier is built from the next finer one
+SOURCES = {
+    'metrics_1m': 'metrics',
+    'metrics_5m': 'metrics_1m',
+    'metrics_1h': 'metrics_5m'
+}
+
+# History queries aim for about this many points
+MAX_POINTS = 500
+
+DEFAULT_ROLLUP_DAYS = {
+    'metrics_1m': 30,
+    'metrics_5m': 180,
+    'metrics_1h': 730
+}
+
+
+def floor_time(moment: datetime, width: int) -> datetime:
+    """Start of the width-second bucket containing moment"""
+    epoch = datetime(1970, 1, 1)
+    seconds = int((moment - epoch).total_seconds())
+    return epoch + timedelta(seconds=seconds - seconds % width)
+
+
+def rollup_retention(config: dict) -> Dict[str, int]:
+    """Days each rollup tier is kept (retention.rollup_days over the defaults)"""
+    days = dict(DEFAULT_ROLLUP_DAYS)
+    days.update({
+        f'metrics_{tier}': value
+        for tier, value in ((config.get('retention') or {}).get('rollup_days') or {}).items()
+    })
+    return days
+
+
+class Bucket:
+    """Running min/max/avg/last of each field for one host and bucket"""
+
+    def __init__(self, host_id: int, start: int):
+        self.host_id = host_id
+        self.start = start
+        self.samples = 0
+        self.uptime = None
+        self.stats = {field: {'min': None, 'max': None, 'sum': 0.0, 'weight': 0, 'last': None}
+                      for field in ROLLUP_FIELDS}
+
+    def add(self, samples: int, values: Dict[str, Dict], uptime):
+        """Merge one source row; values maps field -> min/max/avg/last"""
+        self.samples += samples
+        if uptime is not None:
+            self.uptime = uptime
+        for field, value in values.items():
+            if value['avg'] is None:
+                continue
+            stats = self.stats[field]
+            stats['min'] = value['min'] if stats['min'] is None else min(stats['min'], value['min'])
+            stats['max'] = value['max'] if stats['max'] is None else max(stats['max'], value['max'])
+            stats['sum'] += value['avg'] * samples
+            stats['weight'] += samples
+            stats['last'] = value['last']
+
+    def row(self) -> tuple:
+        values = []
+        for field in ROLLUP_FIELDS:
+            stats = self.stats[field]
+            avg = round(stats['sum'] / stats['weight'], 2) if stats['weight'] else None
+            values.extend([stats['min'], stats['max'], avg, stats['last']])
+        return (self.host_id, self.start, self.samples) + tuple(values) + (self.uptime,)
+
+
+class RollupManager:
+    """Builds rollup tiers from metric history
+
+    Each tier only aggregates buckets that have ended at least
+    rollups.grace seconds ago, so late samples still make it in. Averages
+    of coarser tiers are weighted by sample count. Buckets are keyed by
+    host id and epoch seconds, like the metrics table. Old data is pruned by
+    maintenance.py; the retention settings are read here to know how far
+    back each tier reaches.
+    """
+
+    def __init__(self, storage: Storage, config: dict):
+        self.storage = storage
+        # Raw metrics live in metric_chunks instead of metrics
+        self.chunked = (config.get('database') or {}).get('metrics_format', 'rows') == 'chunks'
+        rollups = config.get('rollups', {})
+        self.interval = rollups.get('interval', 60)
+        self.grace = rollups.get('grace', 60)
+
+        self.metrics_days = config.get('retention', {}).get('metrics_days', 30)
+        self.rollup_days = rollup_retention(config)
+
+    def run(self):
+        """Compact finished metric chunks and roll up new data"""
+        if self.chunked:
+            # Segments of hours that are over become one chunk each
+            compacted = compact_chunks(self.storage, floor_time(datetime.now(), 3600))
+            if compacted:
+                print(f"Compacted {compacted} metric chunk(s)")
+
+        for table, count in self.rollup().items():
+            if count:
+                print(f"Rolled up {count} bucket(s) into {table}")
+
+    def rollup(self, now: Optional[datetime] = None) -> Dict[str, int]:
+        """Aggregate every complete bucket not yet in its tier"""
+        now = now or datetime.now()
+        written = {}
+        for table, width in ROLLUP_TIERS.items():
+            written[table] = self._rollup_tier(table, width, now)
+        return written
+
+    def _rollup_tier(self, table: str, width: int, now: datetime) -> int:
+        source = SOURCES[table]
+        end = to_epoch(now) - self.grace
+        end -= end % width
+
+        row = self.storage.query_one(f'SELECT MAX(bucket) AS latest FROM {table}')
+        if row and row['latest'] is not None:
+            start = row['latest'] + width
+        else:
+            if source == 'metrics' and self.chunked:
+                row = self.storage.query_one('SELECT MIN(chunk_start) AS earliest FROM metric_chunks')
+                earliest = parse_timestamp(row['earliest']) if row else None
+                earliest = to_epoch(earliest) if earliest is not None else None
+            else:
+                time_column = 'timestamp' if source == 'metrics' else 'bucket'
+                row = self.storage.query_one(f'SELECT MIN({time_column}) AS earliest FROM {source}')
+                earliest = row['earliest'] if row else None
+            if earliest is None:
+                return 0
+            start = earliest - earliest % width
+
+        written = 0
+        # Bounded windows keep the first run over a long history cheap
+        step = width * 360
+        while start < end:
+            window_end = min(start + step, end)
+            if source == 'metrics':
+                rows = self._raw_rows(start, window_end)
+            else:
+                rows = self.storage.query(
+                    f'SELECT * FROM {source} WHERE bucket >= ? AND bucket < ? ORDER BY bucket',
+                    (start, window_end)
+                )
+            buckets = self._aggregate(rows, source, width)
+            if buckets:
+                self.storage.write_rows({table: [bucket.row() for bucket in buckets]})
+                written += len(buckets)
+            start = window_end
+        return written
+
+    def _raw_rows(self, start: int, end: int) -> List[Dict]:
+        """Raw samples with host_id and epoch timestamp, from either format"""
+        if not self.chunked:
+            return self.storage.query(
+                'SELECT * FROM metrics WHERE timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+                (start, end)
+            )
+        rows = read_metrics(self.storage, from_epoch(start), from_epoch(end))
+        ids = self.storage.host_ids({row['hostname'] for row in rows})
+        for row in rows:
+            row['host_id'] = ids[row['hostname']]
+            row['timestamp'] = to_epoch(row['timestamp'])
+        return rows
+
+    def _aggregate(self, rows: List[Dict], source: str, width: int) -> List[Bucket]:
+        buckets: Dict[tuple, Bucket] = {}
+        for row in rows:
+            moment = row['timestamp'] if source == 'metrics' else row['bucket']
+            key = (row['host_id'], moment - moment % width)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = Bucket(*key)
+
+            if source == 'metrics':
+                values = {
+                    field: {'min': row[column], 'max': row[column], 'avg': row[column], 'last': row[column]}
+                    for column, field in RAW_FIELDS.items()
+                }
+                bucket.add(1, values, row['uptime_seconds'])
+            else:
+                values = {
+                    field: {stat: row[f'{field}_{stat}'] for stat in ROLLUP_STATS}
+                    for field in ROLLUP_FIELDS
+                }
+                bucket.add(row['samples'] or 0, values, row['uptime_seconds'])
+        return list(buckets.values())
+
+    def choose_tier(self, hours: float) -> str:
+        """Table to answer a history query over the last `hours`
+
+        The coarsest tier whose buckets still give about MAX_POINTS points
+        over the range, moved coarser when the chosen tier's retention
+        doesn't reach back that far.
+        """
+        resolution = hours * 3600 / MAX_POINTS
+        options = ['metrics'] + list(ROLLUP_TIERS)
+        choice = 0
+        for index, table in enumerate(options[1:], start=1):
+            if ROLLUP_TIERS[table] <= resolution:
+                choice = index
+
+        while choice < len(options) - 1 and self._retention_days(options[choice]) * 24 < hours:
+            choice += 1
+        return options[choice]
+
+    def _retention_days(self, table: str) -> float:
+        if table == 'metrics':
+            return self.metrics_days
+        return self.rollup_days[table]
+
+    def raw(self, since: datetime, until: Optional[datetime] = None,
+            hostname: Optional[str] = None) -> List[Dict]:
+        """Raw metric samples in [since, until), oldest first, from
+        whichever of metrics and metric_chunks holds them; rows carry the
+        hostname and a datetime timestamp"""
+        if self.chunked:
+            return read_metrics(self.storage, since, until, hostname)
+
+        statement = '''
+            SELECT h.hostname, m.timestamp, m.cpu_percent, m.memory_percent, m.disk_percent, m.uptime_seconds
+            FROM metrics m JOIN hosts h ON h.id = m.host_id
+            WHERE m.timestamp >= ?'''
+        params = [to_epoch(since)]
+        if until is not None:
+            statement += ' AND m.timestamp < ?'
+            params.append(to_epoch(until))
+        if hostname is not None:
+            statement += ' AND m.host_id = ?'
+            params.append(self.storage.host_id(hostname))
+        rows = self.storage.query(statement + ' ORDER BY m.timestamp', tuple(params))
+        for row in rows:
+            row['timestamp'] = from_epoch(row['timestamp'])
+        return rows
+
+    def history(self, hostname: str, hours: float) -> List[Dict]:
+        """Metric history for a node from the best tier, oldest first
+
+        Rows always carry timestamp, cpu_percent, memory_percent and
+        disk_percent (bucket averages for rollup tiers); rollup rows add
+        the per-field min/max/last and the sample count.
+        """
+        table = self.choose_tier(hours)
+        since = datetime.now() - timedelta(hours=hours)
+
+        if table == 'metrics' and self.chunked:
+            fields = ('timestamp', 'cpu_percent', 'memory_percent', 'disk_percent')
+            return [{field: row[field] for field in fields} for row in self.raw(since, hostname=hostname)]
+
+        host_id = self.storage.host_id(hostname)
+        if host_id is None:
+            return []
+
+        if table == 'metrics':
+            rows = self.storage.query('''
+                SELECT timestamp, cpu_percent, memory_percent, disk_percent
+                FROM metrics
+                WHERE host_id = ? AND timestamp > ?
+                ORDER BY timestamp ASC
+            ''', (host_id, to_epoch(since)))
+        else:
+            extra = ', '.join(f'{field}_{stat}' for field in ROLLUP_FIELDS for stat in ('min', 'max', 'last'))
+            rows = self.storage.query(f'''
+                SELECT bucket AS timestamp, cpu_avg AS cpu_percent, memory_avg AS memory_percent,
+                       disk_avg AS disk_percent, samples, {extra}
+                FROM {table}
+                WHERE host_id = ? AND bucket > ?
+                ORDER BY bucket ASC
+            ''', (host_id, to_epoch(since)))
+
+        for row in rows:
+            row['timestamp'] = from_epoch(row['timestamp'])
+        return rows
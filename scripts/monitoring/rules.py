@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Alert Rules
+Declarative alert rules from config, compiled once and evaluated per cycle
+"""
+
+import operator
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne
+}
+
+# Lowest first; when several rules of one alert type fire, the most
+# severe one is reported
+SEVERITIES = ('warning', 'critical')
+
+# Settings a rule can override per node type
+OVERRIDABLE = ('threshold', 'clear', 'for', 'enabled')
+
+# Operators whose rules clear below (-1) or above (1) the threshold
+CLEAR_SIDES = {'>': -1, '>=': -1, '<': 1, '<=': 1}
+
+
+def default_rules(config: dict) -> List[Dict]:
+    """Built-in rules, with the levels of the thresholds section"""
+    thresholds = config.get('thresholds', {})
+    rules = [{
+        'type': 'node_down',
+        'severity': 'critical',
+        'metric': 'status',
+        'op': '==',
+        'threshold': 'unreachable',
+        'message': 'Node {hostname} is unreachable'
+    }]
+    for alert_type, metric, prefix, label, levels in (
+        ('high_cpu', 'cpu_percent', 'cpu', 'CPU', (70, 90)),
+        ('high_memory', 'memory_percent', 'memory', 'Memory', (80, 95)),
+        ('high_disk', 'disk_percent', 'disk', 'Disk', (80, 90))
+    ):
+        for severity, default in zip(SEVERITIES, levels):
+            rules.append({
+                'type': alert_type,
+                'severity': severity,
+                'metric': metric,
+                'op': '>=',
+                'threshold': thresholds.get(f'{prefix}_{severity}', default),
+                'message': f'{label} usage on {{hostname}} is {{value:.1f}}% ({severity})'
+            })
+    rules.append({
+        'type': 'service_down',
+        'severity': 'critical',
+        'metric': 'services.*',
+        'op': '!=',
+        'threshold': 'active',
+        'message': 'Service down on {hostname}: {matches}'
+    })
+    return rules
+
+
+class Rule:
+    """One compiled rule
+
+    metric is a key of the collected metrics, dotted to reach into nested
+    ones ('services.frr'); a final '*' checks every entry ('services.*')
+    and the rule holds when any of them matches. The rule starts to hold
+    when `value op threshold`, fires once it has held for `for` seconds
+    and, once firing, keeps firing while `value op clear` (clear defaults
+    to threshold, i.e. no hysteresis). An override of the threshold
+    alone moves clear by the same amount.
+    """
+
+    def __init__(self, spec: Dict, name: str):
+        missing = [key for key in ('type', 'metric', 'op', 'threshold') if key not in spec]
+        if missing:
+            raise ValueError(f"{name}: missing {', '.join(missing)}")
+        if spec['op'] not in OPERATORS:
+            raise ValueError(f"{name}: unknown op {spec['op']!r} (use one of {' '.join(OPERATORS)})")
+        self.severity = spec.get('severity', 'warning')
+        if self.severity not in SEVERITIES:
+            raise ValueError(f"{name}: severity must be one of {', '.join(SEVERITIES)}")
+
+        self.name = name
+        self.type = spec['type']
+        self.metric = spec['metric']
+        self.path = self.metric.split('.')
+        self.wildcard = self.path[-1] == '*'
+        if self.wildcard:
+            self.path = self.path[:-1]
+        self.compare = OPERATORS[spec['op']]
+        self.message = spec.get('message', f"{self.metric} on {{hostname}} is {{value}} ({self.severity})")
+
+        base = {
+            'threshold': spec['threshold'],
+            'clear': spec.get('clear', spec['threshold']),
+            'for': spec.get('for', 0),
+            'enabled': spec.get('enabled', True)
+        }
+        self.default = base
+        # Node type -> settings
+        self.overrides: Dict[str, Dict] = {}
+        for node_type, override in (spec.get('overrides') or {}).items():
+            unknown = set(override) - set(OVERRIDABLE)
+            if unknown:
+                raise ValueError(f"{name}: cannot override {', '.join(sorted(unknown))} for {node_type}")
+            settings = dict(base, **override)
+            if 'threshold' in override and 'clear' not in override:
+                try:
+                    settings['clear'] = override['threshold'] + (base['clear'] - base['threshold'])
+                except TypeError:
+                    settings['clear'] = override['threshold']
+            self.overrides[node_type] = settings
+
+        for where, settings in [('', base)] + [(f' for {node_type}', settings)
+                                               for node_type, settings in self.overrides.items()]:
+            self._check_clear(spec['op'], settings, f"{name}{where}")
+
+        # Catch message typos at startup rather than in the collector loop
+        try:
+            self.format('host', base['threshold'], [('name', base['threshold'])])
+        except (KeyError, ValueError, IndexError) as e:
+            raise ValueError(f"{name}: bad message {self.message!r}: {e}")
+
+    @staticmethod
+    def _check_clear(op: str, settings: Dict, name: str):
+        """clear must be on the side of threshold the rule clears towards"""
+        threshold, clear = settings['threshold'], settings['clear']
+        if clear == threshold:
+            return
+        side = CLEAR_SIDES.get(op)
+        try:
+            wrong = side is None or (clear - threshold) * side < 0
+        except TypeError:
+            wrong = True
+        if wrong:
+            if side is None:
+                expected = f"equal to the threshold for op {op}"
+            else:
+                expected = f"{'below' if side < 0 else 'above'} the threshold for op {op}"
+            raise ValueError(f"{name}: clear {clear!r} must be {expected} ({threshold!r})")
+
+    def settings(self, node_type: Optional[str]) -> Dict:
+        return self.overrides.get(node_type, self.default)
+
+    def value(self, metrics: Dict):
+        """The metric's value in metrics (a dict for wildcards), None if not collected"""
+        value = metrics
+        for key in self.path:
+            if not isinstance(value, dict):
+                return None
+            value = value.get(key)
+        if self.wildcard and not isinstance(value, dict):
+            return None
+        return value
+
+    def matches(self, value, level) -> List[Tuple[str, object]]:
+        """(key, value) pairs for which the rule holds at level"""
+        items = value.items() if self.wildcard else [(self.metric, value)]
+        found = []
+        for key, item in items:
+            try:
+                if item is not None and self.compare(item, level):
+                    found.append((key, item))
+            except TypeError:
+                # e.g. a string where a number was expected
+                pass
+        return found
+
+    def format(self, hostname: str, threshold, matches: List[Tuple[str, object]]) -> str:
+        return self.message.format(
+            hostname=hostname,
+            value=matches[0][1],
+            threshold=threshold,
+            metric=self.metric,
+            severity=self.severity,
+            type=self.type,
+            matches=', '.join(f'{key} ({value})' for key, value in matches)
+        )
+
+
+class AlertRules:
+    """The rule set from alerts.rules, on top of default_rules()
+
+    A configured rule with the type and severity of a built-in one
+    replaces it (enabled: false drops it); any other rule is added. Rules
+    are compiled once; evaluate() then runs them over a whole cycle's
+    metrics. The pending/firing state of each rule and host is kept in
+    memory. A host this process hasn't evaluated for two collection
+    intervals (another worker may have in between) starts over: rules
+    matching one of its open incidents resume as firing, the others as
+    not holding.
+    """
+
+    def __init__(self, config: dict):
+        specs = {(spec['type'], spec.get('severity', 'warning')): spec for spec in default_rules(config)}
+        for index, spec in enumerate((config.get('alerts') or {}).get('rules') or []):
+            if not isinstance(spec, dict) or 'type' not in spec:
+                raise ValueError(f"alerts.rules[{index}]: every rule needs a type")
+            key = (spec['type'], spec.get('severity', 'warning'))
+            # Settings left out of a built-in rule's replacement keep its values
+            specs[key] = dict(specs.get(key, {}), **spec)
+
+        self.rules = [
+            Rule(spec, f"alert rule {alert_type}/{severity}")
+            for (alert_type, severity), spec in specs.items()
+        ]
+        # Alert types evaluated on every check (see AlertEngine.evaluate)
+        self.types = {rule.type for rule in self.rules}
+        self.stale_after = 2 * (config.get('monitoring') or {}).get('interval', 30)
+        # (hostname, rule index) -> {'since', 'firing', 'alert'}
+        self._state: Dict[Tuple[str, int], Dict] = {}
+        # hostname -> time.monotonic() of its last evaluation
+        self._evaluated: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def evaluate(self, batch: List[Dict],
+                 incidents: Optional[Callable[[str], Dict[str, Dict]]] = None) -> List[Tuple[Dict, List[Dict]]]:
+        """(metrics, alerts) for each entry of batch, in order
+
+        alerts holds one alert (severity, type, message) per type with a
+        firing rule. A rule whose metric wasn't collected (e.g. CPU of an
+        unreachable node) keeps its previous state, as do all rules of a
+        node that missed its collection deadline (status 'timeout'): its
+        state is unknown, so e.g. an open node_down alert stays open. incidents (e.g.
+        AlertEngine.incidents) gives a host's open incidents by type, used
+        when its state starts over.
+        """
+        results = []
+        with self._lock:
+            for metrics in batch:
+                results.append((metrics, self._evaluate(metrics, incidents)))
+        return results
+
+    def _restart(self, hostname: str, incidents, now: datetime):
+        """Drop the state of hostname, resuming the rules of its open incidents"""
+        current = incidents(hostname) if incidents else {}
+        for index, rule in enumerate(self.rules):
+            incident = current.get(rule.type)
+            if incident and incident['severity'] == rule.severity:
+                alert = {'severity': rule.severity, 'type': rule.type, 'message': incident['message']}
+                self._state[(hostname, index)] = {'since': now, 'firing': True, 'alert': alert}
+            else:
+                self._state.pop((hostname, index), None)
+
+    def _evaluate(self, metrics: Dict, incidents) -> List[Dict]:
+        hostname = metrics['hostname']
+        node_type = metrics.get('type')
+        now = metrics.get('timestamp') or datetime.now()
+        firing: Dict[str, Dict] = {}
+
+        timed_out = metrics.get('status') == 'timeout'
+        clock = time.monotonic()
+        last = self._evaluated.get(hostname)
+        self._evaluated[hostname] = clock
+        if last is None or clock - last > self.stale_after:
+            self._restart(hostname, incidents, now)
+
+        for index, rule in enumerate(self.rules):
+            key = (hostname, index)
+            settings = rule.settings(node_type)
+            if not settings['enabled']:
+                self._state.pop(key, None)
+                continue
+
+            state = self._state.get(key)
+            value = None if timed_out else rule.value(metrics)
+            if value is not None:
+                state = self._step(rule, settings, state, hostname, value, now)
+                if state is None:
+                    self._state.pop(key, None)
+                else:
+                    self._state[key] = state
+
+            if state and state['firing']:
+                current = firing.get(rule.type)
+                if current is None or SEVERITIES.index(rule.severity) > SEVERITIES.index(current['severity']):
+                    firing[rule.type] = state['alert']
+
+        return list(firing.values())
+
+    @staticmethod
+    def _step(rule: Rule, settings: Dict, state: Optional[Dict], hostname: str, value,
+              now: datetime) -> Optional[Dict]:
+        """Next state of one rule for one host; None once it no longer holds"""
+        level = settings['clear'] if state and state['firing'] else settings['threshold']
+        matches = rule.matches(value, level)
+        if not matches:
+            return None
+
+        if state is None:
+            state = {'since': now, 'firing': False, 'alert': None}
+        if not state['firing'] and (now - state['since']).total_seconds() >= settings['for']:
+            state['firing'] = True
+        if state['firing']:
+            state['alert'] = {
+                'severity': rule.severity,
+                'type': rule.type,
+                'message': rule.format(hostname, settings['threshold'], matches)
+            }
+        return state
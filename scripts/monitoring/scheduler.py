@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Collection Scheduler
+Decides which nodes are due for collection and when
+"""
+
+import heapq
+import itertools
+import math
+import random
+import time
+from typing import Dict, List, Optional
+
+
+class ScheduledNode:
+    """Scheduling state for one node"""
+
+    def __init__(self, node: Dict, interval: float):
+        self.node = node
+        self.interval = interval
+        self.next_due = 0.0
+        self.failures = 0
+        self.version = 0
+
+
+class CollectionScheduler:
+    """Heap of next-due times with per-node intervals and backoff
+
+    Each node is polled every `interval` seconds, taken from the node's
+    own 'interval' key, then monitoring.intervals[<node type>], then
+    monitoring.interval. A random jitter of +/- monitoring.jitter spreads
+    nodes with the same interval across time. Nodes that come back
+    unreachable or timed out are backed off exponentially up to
+    monitoring.max_backoff. If a poll runs late, missed slots are skipped
+    instead of being polled back to back.
+    """
+
+    def __init__(self, config: dict):
+        monitoring = config.get('monitoring', {})
+        self.default_interval = monitoring.get('interval', 30)
+        self.type_intervals = monitoring.get('intervals', {})
+        self.jitter = monitoring.get('jitter', 0.1)
+        self.max_backoff = monitoring.get('max_backoff', 600)
+
+        self._nodes: Dict[str, ScheduledNode] = {}
+        self._heap = []
+        self._versions = itertools.count(1)
+
+    def interval_for(self, node: Dict) -> float:
+        if node.get('interval'):
+            return node['interval']
+        return self.type_intervals.get(node.get('type', 'unknown'), self.default_interval)
+
+    def _jittered_due(self, due: float, delay: float, now: float) -> float:
+        return max(now, due + delay * random.uniform(-self.jitter, self.jitter))
+
+    def _push(self, entry: ScheduledNode, due: float):
+        entry.next_due = due
+        entry.version = next(self._versions)
+        heapq.heappush(self._heap, (due, entry.version, entry.node['ip']))
+
+    def update_nodes(self, nodes: List[Dict]) -> List[Dict]:
+        """Sync the schedule with the current node list
+
+        New nodes are spread over their first interval, known nodes keep
+        their place and nodes that disappeared are dropped. Returns the
+        dropped nodes.
+        """
+        now = time.monotonic()
+        current = {node['ip']: node for node in nodes}
+
+        removed = []
+        for ip in list(self._nodes):
+            if ip not in current:
+                removed.append(self._nodes.pop(ip).node)
+
+        for ip, node in current.items():
+            entry = self._nodes.get(ip)
+            interval = self.interval_for(node)
+            if entry is None:
+                entry = ScheduledNode(node, interval)
+                self._nodes[ip] = entry
+                self._push(entry, now + random.uniform(0, interval * self.jitter))
+            else:
+                entry.node = node
+                entry.interval = interval
+        return removed
+
+    def pop_due(self, now: Optional[float] = None) -> List[Dict]:
+        """Remove and return every node that is due"""
+        now = time.monotonic() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, version, ip = heapq.heappop(self._heap)
+            entry = self._nodes.get(ip)
+            if entry is None or entry.version != version:
+                # Node removed or rescheduled since this heap entry was pushed
+                continue
+            due.append(entry.node)
+        return due
+
+    def record(self, node: Dict, metrics: Optional[Dict]):
+        """Schedule a node's next poll based on its collection result"""
+        entry = self._nodes.get(node['ip'])
+        if entry is None:
+            return
+
+        if metrics and metrics.get('status') == 'online':
+            entry.failures = 0
+            delay = entry.interval
+        else:
+            entry.failures += 1
+            delay = min(entry.interval * (2 ** entry.failures), max(self.max_backoff, entry.interval))
+
+        now = time.monotonic()
+        due = entry.next_due + delay
+        if due <= now:
+            # Overran: skip the missed slots rather than catching up on them
+            due += (math.floor((now - due) / delay) + 1) * delay
+        self._push(entry, self._jittered_due(due, delay, now))
+
+    def next_due(self) -> Optional[float]:
+        """Monotonic time of the earliest scheduled poll"""
+        while self._heap:
+            due, version, ip = self._heap[0]
+            entry = self._nodes.get(ip)
+            if entry is not None and entry.version == version:
+                return due
+            heapq.heappop(self._heap)
+        return None
+
+    def __len__(self):
+        return len(self._nodes)
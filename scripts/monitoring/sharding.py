@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Collector Sharding
+Assigns nodes to collector instances and worker processes by consistent hashing
+"""
+
+import bisect
+import hashlib
+import socket
+from typing import List, Optional, Tuple
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """Hash ring with virtual nodes
+
+    Adding or removing a member only moves the keys between it and its
+    neighbours on the ring (about 1/N of them), so most nodes keep their
+    collector and its warm SSH connections and CPU counters.
+    """
+
+    def __init__(self, members: List[str], vnodes: int = 64):
+        if not members:
+            raise ValueError("hash ring needs at least one member")
+
+        self.members = list(members)
+        points = []
+        for member in self.members:
+            for i in range(vnodes):
+                points.append((_hash(f'{member}#{i}'), member))
+        points.sort()
+
+        self._hashes = [point for point, _ in points]
+        self._owners = [owner for _, owner in points]
+
+    def owner(self, key: str) -> str:
+        index = bisect.bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._owners[index]
+
+
+class ShardMap:
+    """Two-level node ownership: instance first, then worker process
+
+    sharding.instances lists the cooperating collector instances (all
+    sharing one config and database); sharding.workers is the number of
+    worker processes each instance runs. A node's IP picks an instance on
+    one ring and a worker on that instance's own ring, so changing the
+    worker count of one instance never moves nodes between instances.
+    """
+
+    def __init__(self, config: dict, instance: Optional[str] = None, workers: Optional[int] = None):
+        sharding = config.get('sharding', {})
+        vnodes = sharding.get('vnodes', 64)
+
+        self.instance = instance or sharding.get('instance') or socket.gethostname()
+        self.instances = sharding.get('instances') or [self.instance]
+        self.workers = max(1, int(workers or sharding.get('workers', 1)))
+
+        self.instance_ring = ConsistentHashRing(self.instances, vnodes)
+        self.worker_ring = ConsistentHashRing([str(i) for i in range(self.workers)], vnodes)
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.instances) > 1 or self.workers > 1
+
+    def owner(self, ip: str) -> Tuple[str, int]:
+        """(instance, worker index) responsible for a node"""
+        return self.instance_ring.owner(ip), int(self.worker_ring.owner(ip))
+
+    def label(self, ip: str) -> str:
+        instance, worker = self.owner(ip)
+        return f'{instance}/{worker}'
+
+    def owns(self, ip: str, worker: int) -> bool:
+        """Whether worker on this instance collects the node"""
+        return self.owner(ip) == (self.instance, worker)
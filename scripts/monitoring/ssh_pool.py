@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - SSH Connection Pool
+Keeps one authenticated SSH transport per node and runs commands on it
+"""
+
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import paramiko
+
+
+class PooledConnection:
+    """One authenticated SSH client and its bookkeeping"""
+
+    def __init__(self, client: paramiko.SSHClient):
+        self.client = client
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.commands = 0
+
+    def is_active(self) -> bool:
+        transport = self.client.get_transport()
+        return transport is not None and transport.is_active()
+
+    def close(self):
+        try:
+            self.client.close()
+        except Exception:
+            pass
+
+
+class SSHConnectionPool:
+    """Keyed pool of persistent SSH connections
+
+    Each (host, port, user) gets a single authenticated transport that is
+    reused across commands and collection cycles. Commands run as separate
+    channels on that transport, so concurrent commands to the same node
+    share one handshake. Dead connections are replaced transparently and
+    connections unused for idle_timeout seconds are closed by evict_idle().
+    """
+
+    def __init__(self, username: str, key_filename: str, timeout: float = 5,
+                 keepalive: int = 30, idle_timeout: float = 300):
+        self.username = username
+        self.key_filename = key_filename
+        self.timeout = timeout
+        self.keepalive = keepalive
+        self.idle_timeout = idle_timeout
+
+        self._connections: Dict[Tuple[str, int, str], PooledConnection] = {}
+        self._key_locks: Dict[Tuple[str, int, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+        self.handshakes = 0
+        self.reuses = 0
+        self.reconnects = 0
+        self.failures = 0
+        self.evictions = 0
+
+    def _key_lock(self, key: Tuple[str, int, str]) -> threading.Lock:
+        with self._lock:
+            if key not in self._key_locks:
+                self._key_locks[key] = threading.Lock()
+            return self._key_locks[key]
+
+    def _connect(self, host: str, port: int) -> PooledConnection:
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(
+            host,
+            port=port,
+            username=self.username,
+            key_filename=self.key_filename,
+            timeout=self.timeout,
+            banner_timeout=self.timeout,
+            auth_timeout=self.timeout,
+            look_for_keys=False,
+            allow_agent=False
+        )
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        return PooledConnection(client)
+
+    def _acquire(self, host: str, port: int) -> PooledConnection:
+        """Return a live connection for host, handshaking only if needed"""
+        key = (host, port, self.username)
+        with self._key_lock(key):
+            conn = self._connections.get(key)
+            if conn is not None and conn.is_active():
+                with self._lock:
+                    self.reuses += 1
+                return conn
+
+            if conn is not None:
+                conn.close()
+                with self._lock:
+                    self.reconnects += 1
+
+            conn = self._connect(host, port)
+            with self._lock:
+                self.handshakes += 1
+                self._connections[key] = conn
+            return conn
+
+    def _discard(self, host: str, port: int, conn: PooledConnection):
+        key = (host, port, self.username)
+        with self._lock:
+            if self._connections.get(key) is conn:
+                del self._connections[key]
+        conn.close()
+
+    def execute(self, host: str, command: str, port: int = 22,
+                timeout: Optional[float] = None) -> Optional[str]:
+        """Run command on host and return its stdout, or None on failure
+
+        A command that fails because the pooled connection went away is
+        retried once on a fresh connection.
+        """
+        timeout = timeout or self.timeout
+
+        for attempt in range(2):
+            try:
+                conn = self._acquire(host, port)
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                return None
+
+            try:
+                stdin, stdout, stderr = conn.client.exec_command(command, timeout=timeout)
+                output = stdout.read().decode('utf-8')
+                stdout.channel.close()
+                conn.last_used = time.monotonic()
+                conn.commands += 1
+                return output
+            except socket.timeout:
+                # Slow command; the transport itself is still usable
+                with self._lock:
+                    self.failures += 1
+                return None
+            except (paramiko.SSHException, EOFError, socket.error):
+                # Broken transport: drop it and retry once on a fresh one
+                self._discard(host, port, conn)
+                if attempt == 0:
+                    with self._lock:
+                        self.reconnects += 1
+                    continue
+                with self._lock:
+                    self.failures += 1
+                return None
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                return None
+
+        return None
+
+    def evict_idle(self) -> int:
+        """Close connections idle for longer than idle_timeout"""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self._lock:
+            stale = [(key, conn) for key, conn in self._connections.items()
+                     if conn.last_used < cutoff or not conn.is_active()]
+            for key, _ in stale:
+                del self._connections[key]
+            self.evictions += len(stale)
+
+        for _, conn in stale:
+            conn.close()
+        return len(stale)
+
+    def close_all(self):
+        """Close every pooled connection"""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+
+    def stats(self) -> Dict:
+        """Handshake and reuse counters since the pool was created"""
+        with self._lock:
+            acquired = self.handshakes + self.reuses
+            return {
+                'connections': len(self._connections),
+                'handshakes': self.handshakes,
+                'reuses': self.reuses,
+                'reconnects': self.reconnects,
+                'failures': self.failures,
+                'evictions': self.evictions,
+                'reuse_ratio': self.reuses / acquired if acquired else 0.0
+            }
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - State History
+Point-in-time service and OSPF neighbor state from the transition tables
+"""
+
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# A state was in effect at a moment if it started at or before it and
+# had not ended yet
+AT_MOMENT = 'started_at <= ? AND (ended_at IS NULL OR ended_at > ?)'
+
+
+def _states_at(storage, table: str, moment: datetime, hostname: Optional[str]) -> List[Dict]:
+    statement = f'SELECT * FROM {table} WHERE {AT_MOMENT}'
+    params = [moment, moment]
+    if hostname is not None:
+        statement += ' AND hostname = ?'
+        params.append(hostname)
+    return storage.query(statement, tuple(params))
+
+
+def services_at(storage, moment: datetime, hostname: Optional[str] = None) -> Dict[str, Dict[str, str]]:
+    """hostname -> service -> status as it was at moment"""
+    services: Dict[str, Dict[str, str]] = {}
+    for row in _states_at(storage, 'service_states', moment, hostname):
+        services.setdefault(row['hostname'], {})[row['service_name']] = row['status']
+    return services
+
+
+def ospf_neighbors_at(storage, moment: datetime, hostname: Optional[str] = None) -> Dict[str, List[Dict]]:
+    """hostname -> OSPF neighbors (neighbor_id, neighbor_ip, state) at moment"""
+    neighbors: Dict[str, List[Dict]] = {}
+    for row in _states_at(storage, 'ospf_states', moment, hostname):
+        neighbors.setdefault(row['hostname'], []).append({
+            'neighbor_id': row['neighbor_id'],
+            'neighbor_ip': row['neighbor_ip'],
+            'state': row['state']
+        })
+    return neighbors
+
+
+def state_changes(storage, table: str, hostname: str, since: datetime,
+                  until: Optional[datetime] = None) -> List[Dict]:
+    """Transitions of one node that overlap [since, until), oldest first
+
+    table is 'service_states' or 'ospf_states'. Each row carries
+    started_at and ended_at (None while the state still holds).
+    """
+    statement = f'SELECT * FROM {table} WHERE hostname = ? AND (ended_at IS NULL OR ended_at > ?)'
+    params = [hostname, since]
+    if until is not None:
+        statement += ' AND started_at < ?'
+        params.append(until)
+    return storage.query(statement + ' ORDER BY started_at', tuple(params))
@@ -0,0 +1,1189 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Storage Backends
+SQLite and PostgreSQL behind one interface, selected by database.type
+"""
+
+import csv
+import io
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import psycopg2
+    import psycopg2.extras
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+DEFAULT_SQLITE_PATH = '/var/lib/mesh-monitor/metrics.db'
+
+# pg_advisory_xact_lock key held while migrating
+MIGRATION_LOCK_ID = 0x6d657368
+
+# WAL lets the dashboard read while the collector writes. With WAL,
+# synchronous=NORMAL only syncs at checkpoints instead of on every commit,
+# which matters on SD cards; a power cut can lose the last transactions
+# but never corrupts the database.
+SQLITE_PRAGMAS = [
+    'PRAGMA auto_vacuum=INCREMENTAL',  # takes effect for new database files
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA cache_size=-16000',      # 16 MB page cache
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA wal_autocheckpoint=1000'
+]
+
+# Tables written by BatchWriter and the columns of their rows
+COLUMNS = {
+    'nodes': ('hostname', 'ip', 'type', 'last_seen', 'status'),
+    'metrics': ('host_id', 'timestamp', 'cpu_percent', 'memory_percent', 'disk_percent', 'uptime_seconds'),
+    'reachability': ('host_id', 'timestamp', 'rtt_ms', 'packet_loss'),
+    'services': ('hostname', 'timestamp', 'service_name', 'status'),
+    'ospf_neighbors': ('hostname', 'timestamp', 'neighbor_id', 'neighbor_ip', 'state'),
+    'alerts': ('timestamp', 'hostname', 'severity', 'alert_type', 'message', 'last_seen', 'suppressed_by'),
+    'node_current': ('hostname', 'timestamp', 'cpu_percent', 'memory_percent', 'disk_percent', 'uptime_seconds'),
+    'service_current': ('hostname', 'service_name', 'timestamp', 'status'),
+    'ospf_current': ('hostname', 'neighbor_id', 'timestamp', 'neighbor_ip', 'state')
+}
+
+# History tables keyed by hosts.id with integer epoch-second timestamps.
+# BatchWriter buffers their rows as (hostname, datetime, ...) and
+# converts them when flushing.
+EPOCH_TABLES = ('metrics', 'reachability')
+
+# Rows for these tables replace the existing row with the same key
+UPSERT_KEYS = {
+    'nodes': ('hostname',),
+    'node_current': ('hostname',),
+    'service_current': ('hostname', 'service_name')
+}
+
+# A node's rows in these tables are replaced as a set each time it
+# reports (neighbors that went away must disappear)
+REPLACE_PER_HOST = ('ospf_current',)
+
+# Downsampled metric tiers (see rollups.py): table -> bucket width in seconds
+ROLLUP_TIERS = {
+    'metrics_1m': 60,
+    'metrics_5m': 300,
+    'metrics_1h': 3600
+}
+ROLLUP_FIELDS = ('cpu', 'memory', 'disk')
+ROLLUP_STATS = ('min', 'max', 'avg', 'last')
+COLUMNS.update({
+    table: ('host_id', 'bucket', 'samples') +
+           tuple(f'{field}_{stat}' for field in ROLLUP_FIELDS for stat in ROLLUP_STATS) +
+           ('uptime_seconds',)
+    for table in ROLLUP_TIERS
+})
+UPSERT_KEYS.update({table: ('host_id', 'bucket') for table in ROLLUP_TIERS})
+
+# Compressed metric history (see chunks.py, database.metrics_format: chunks)
+COLUMNS['metric_chunks'] = ('hostname', 'chunk_start', 'chunk_end', 'samples', 'data', 'sealed')
+UPSERT_KEYS['metric_chunks'] = ('hostname', 'chunk_start', 'sealed')
+
+# Service and OSPF state stored as transitions: a row per state with the
+# time it started and (once replaced) ended. Table -> identifying columns;
+# the open row of a key has ended_at NULL.
+TRANSITION_KEYS = {
+    'service_states': ('hostname', 'service_name'),
+    'ospf_states': ('hostname', 'neighbor_id')
+}
+COLUMNS['service_states'] = ('hostname', 'service_name', 'status', 'started_at')
+COLUMNS['ospf_states'] = ('hostname', 'neighbor_id', 'neighbor_ip', 'state', 'started_at')
+
+# Tables as first created; {id} and {false} are filled in per backend
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS nodes (
+        hostname TEXT PRIMARY KEY,
+        ip TEXT,
+        type TEXT,
+        last_seen TIMESTAMP,
+        status TEXT
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS metrics (
+        id {id},
+        hostname TEXT,
+        timestamp TIMESTAMP,
+        cpu_percent REAL,
+        memory_percent REAL,
+        disk_percent REAL,
+        uptime_seconds INTEGER,
+        FOREIGN KEY (hostname) REFERENCES nodes(hostname) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS services (
+        id {id},
+        hostname TEXT,
+        timestamp TIMESTAMP,
+        service_name TEXT,
+        status TEXT,
+        FOREIGN KEY (hostname) REFERENCES nodes(hostname) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS ospf_neighbors (
+        id {id},
+        hostname TEXT,
+        timestamp TIMESTAMP,
+        neighbor_id TEXT,
+        neighbor_ip TEXT,
+        state TEXT,
+        FOREIGN KEY (hostname) REFERENCES nodes(hostname) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS reachability (
+        id {id},
+        hostname TEXT,
+        timestamp TIMESTAMP,
+        rtt_ms REAL,
+        packet_loss REAL,
+        FOREIGN KEY (hostname) REFERENCES nodes(hostname) ON DELETE CASCADE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS alerts (
+        id {id},
+        timestamp TIMESTAMP,
+        hostname TEXT,
+        severity TEXT,
+        alert_type TEXT,
+        message TEXT,
+        resolved BOOLEAN DEFAULT {false},
+        resolved_at TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sent_notifications (
+        alert_id INTEGER PRIMARY KEY,
+        sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    '''
+]
+
+# Schema changes, applied in order by Storage.migrate(). Each entry is
+# (version, description, statements); never edit an applied migration,
+# append a new one instead.
+MIGRATIONS = [
+    (1, 'initial tables', SCHEMA),
+    (2, 'indexes for dashboard and alert queries', [
+        'CREATE INDEX IF NOT EXISTS idx_metrics_hostname_timestamp ON metrics(hostname, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_services_hostname ON services(hostname, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_services_latest ON services(hostname, service_name, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_ospf_hostname ON ospf_neighbors(hostname, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_ospf_state_timestamp ON ospf_neighbors(state, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_reachability_hostname ON reachability(hostname, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_resolved ON alerts(resolved, timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_hostname ON alerts(hostname)'
+    ]),
+    (3, 'latest-state tables maintained on write', [
+        '''
+        CREATE TABLE IF NOT EXISTS node_current (
+            hostname TEXT PRIMARY KEY,
+            timestamp TIMESTAMP,
+            cpu_percent REAL,
+            memory_percent REAL,
+            disk_percent REAL,
+            uptime_seconds INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS service_current (
+            hostname TEXT,
+            service_name TEXT,
+            timestamp TIMESTAMP,
+            status TEXT,
+            PRIMARY KEY (hostname, service_name)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ospf_current (
+            hostname TEXT,
+            neighbor_id TEXT,
+            timestamp TIMESTAMP,
+            neighbor_ip TEXT,
+            state TEXT,
+            PRIMARY KEY (hostname, neighbor_id)
+        )
+        ''',
+        # Seed from history; later rows come from BatchWriter
+        '''
+        INSERT INTO node_current (hostname, timestamp, cpu_percent, memory_percent, disk_percent, uptime_seconds)
+        SELECT hostname, timestamp, cpu_percent, memory_percent, disk_percent, uptime_seconds
+        FROM metrics
+        WHERE (hostname, timestamp) IN (
+            SELECT hostname, MAX(timestamp) FROM metrics GROUP BY hostname
+        )
+        ON CONFLICT DO NOTHING
+        ''',
+        '''
+        INSERT INTO service_current (hostname, service_name, timestamp, status)
+        SELECT hostname, service_name, timestamp, status
+        FROM services
+        WHERE (hostname, service_name, timestamp) IN (
+            SELECT hostname, service_name, MAX(timestamp) FROM services GROUP BY hostname, service_name
+        )
+        ON CONFLICT DO NOTHING
+        ''',
+        '''
+        INSERT INTO ospf_current (hostname, neighbor_id, timestamp, neighbor_ip, state)
+        SELECT hostname, neighbor_id, timestamp, neighbor_ip, state
+        FROM ospf_neighbors
+        WHERE (hostname, timestamp) IN (
+            SELECT hostname, MAX(timestamp) FROM ospf_neighbors GROUP BY hostname
+        )
+        ON CONFLICT DO NOTHING
+        '''
+    ]),
+    (4, 'metric rollup tiers', [
+        f'''
+        CREATE TABLE IF NOT EXISTS {table} (
+            hostname TEXT,
+            bucket TIMESTAMP,
+            samples INTEGER,
+            {', '.join(f'{field}_{stat} REAL' for field in ROLLUP_FIELDS for stat in ROLLUP_STATS)},
+            uptime_seconds INTEGER,
+            PRIMARY KEY (hostname, bucket)
+        )
+        '''
+        for table in ROLLUP_TIERS
+    ] + [
+        # Rollup scans and retention deletes select by time alone
+        'CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics(timestamp)'
+    ]),
+    (5, 'compressed metric chunks', [
+        '''
+        CREATE TABLE IF NOT EXISTS metric_chunks (
+            hostname TEXT,
+            chunk_start TIMESTAMP,
+            chunk_end TIMESTAMP,
+            samples INTEGER,
+            data {blob},
+            sealed BOOLEAN DEFAULT {false},
+            PRIMARY KEY (hostname, chunk_start)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_metric_chunks_end ON metric_chunks(chunk_end)'
+    ]),
+    (6, 'service and OSPF state transitions', [
+        '''
+        CREATE TABLE IF NOT EXISTS service_states (
+            hostname TEXT,
+            service_name TEXT,
+            status TEXT,
+            started_at TIMESTAMP,
+            ended_at TIMESTAMP,
+            PRIMARY KEY (hostname, service_name, started_at)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ospf_states (
+            hostname TEXT,
+            neighbor_id TEXT,
+            neighbor_ip TEXT,
+            state TEXT,
+            started_at TIMESTAMP,
+            ended_at TIMESTAMP,
+            PRIMARY KEY (hostname, neighbor_id, started_at)
+        )
+        ''',
+        # Open with the latest known state; earlier history stays in
+        # services / ospf_neighbors until retention removes it
+        '''
+        INSERT INTO service_states (hostname, service_name, status, started_at)
+        SELECT hostname, service_name, status, timestamp FROM service_current
+        WHERE 1 = 1  -- SQLite needs a WHERE before ON CONFLICT here
+        ON CONFLICT DO NOTHING
+        ''',
+        '''
+        INSERT INTO ospf_states (hostname, neighbor_id, neighbor_ip, state, started_at)
+        SELECT hostname, neighbor_id, neighbor_ip, state, timestamp FROM ospf_current
+        WHERE 1 = 1  -- SQLite needs a WHERE before ON CONFLICT here
+        ON CONFLICT DO NOTHING
+        '''
+    ]),
+    (7, 'indexes for batched retention deletes', [
+        'CREATE INDEX IF NOT EXISTS idx_reachability_timestamp ON reachability(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_services_timestamp ON services(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_ospf_timestamp ON ospf_neighbors(timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_service_states_ended ON service_states(ended_at)',
+        'CREATE INDEX IF NOT EXISTS idx_ospf_states_ended ON ospf_states(ended_at)'
+    ] + [
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)'
+        for table in ROLLUP_TIERS
+    ]),
+    (8, 'host ids and epoch timestamps for metric history', [
+        '''
+        CREATE TABLE IF NOT EXISTS hosts (
+            id {id},
+            hostname TEXT UNIQUE
+        )
+        ''',
+        f'''
+        INSERT INTO hosts (hostname)
+        SELECT hostname FROM (
+            {' UNION '.join(f'SELECT hostname FROM {table}'
+                            for table in ('nodes', 'metrics', 'reachability') + tuple(ROLLUP_TIERS))}
+        ) AS known
+        WHERE hostname IS NOT NULL
+        ORDER BY hostname
+        ''',
+        # Rebuild each table with the new columns, converting its rows
+        'ALTER TABLE metrics RENAME TO metrics_v7',
+        '''
+        CREATE TABLE metrics (
+            host_id INTEGER REFERENCES hosts(id),
+            timestamp BIGINT,
+            cpu_percent REAL,
+            memory_percent REAL,
+            disk_percent REAL,
+            uptime_seconds INTEGER
+        )
+        ''',
+        '''
+        INSERT INTO metrics (host_id, timestamp, cpu_percent, memory_percent, disk_percent, uptime_seconds)
+        SELECT h.id, {epoch_timestamp}, m.cpu_percent, m.memory_percent, m.disk_percent, m.uptime_seconds
+        FROM metrics_v7 m JOIN hosts h ON h.hostname = m.hostname
+        ''',
+        'DROP TABLE metrics_v7',
+        'CREATE INDEX IF NOT EXISTS idx_metrics_host_timestamp ON metrics(host_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_metrics_timestamp ON metrics(timestamp)',
+        'ALTER TABLE reachability RENAME TO reachability_v7',
+        '''
+        CREATE TABLE reachability (
+            host_id INTEGER REFERENCES hosts(id),
+            timestamp BIGINT,
+            rtt_ms REAL,
+            packet_loss REAL
+        )
+        ''',
+        '''
+        INSERT INTO reachability (host_id, timestamp, rtt_ms, packet_loss)
+        SELECT h.id, {epoch_timestamp}, r.rtt_ms, r.packet_loss
+        FROM reachability_v7 r JOIN hosts h ON h.hostname = r.hostname
+        ''',
+        'DROP TABLE reachability_v7',
+        'CREATE INDEX IF NOT EXISTS idx_reachability_host_timestamp ON reachability(host_id, timestamp)',
+        'CREATE INDEX IF NOT EXISTS idx_reachability_timestamp ON reachability(timestamp)'
+    ] + [
+        statement
+        for table in ROLLUP_TIERS
+        for statement in (
+            f'ALTER TABLE {table} RENAME TO {table}_v7',
+            f'''
+            CREATE TABLE {table} (
+                host_id INTEGER REFERENCES hosts(id),
+                bucket BIGINT,
+                samples INTEGER,
+                {', '.join(f'{field}_{stat} REAL' for field in ROLLUP_FIELDS for stat in ROLLUP_STATS)},
+                uptime_seconds INTEGER,
+                PRIMARY KEY (host_id, bucket)
+            )
+            ''',
+            f'''
+            INSERT INTO {table} ({', '.join(COLUMNS[table])})
+            SELECT h.id, {{epoch_bucket}}, {', '.join('t.' + column for column in COLUMNS[table][2:])}
+            FROM {table}_v7 t JOIN hosts h ON h.hostname = t.hostname
+            ''',
+            f'DROP TABLE {table}_v7',
+            f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)'
+        )
+    ]),
+    (9, 'one alerts row per incident', [
+        'ALTER TABLE alerts ADD COLUMN last_seen TIMESTAMP',
+        'ALTER TABLE alerts ADD COLUMN notified_at TIMESTAMP',
+        # Rows so far were notified (or not) by the previous collector
+        'UPDATE alerts SET last_seen = timestamp, notified_at = timestamp',
+        # Fold the row written every cycle into the first row of each
+        # unresolved incident
+        '''
+        UPDATE alerts SET last_seen = (
+            SELECT MAX(a.timestamp) FROM alerts a
+            WHERE a.hostname = alerts.hostname AND a.alert_type = alerts.alert_type AND a.resolved = {false}
+        )
+        WHERE resolved = {false}
+        ''',
+        '''
+        DELETE FROM alerts
+        WHERE resolved = {false} AND id NOT IN (
+            SELECT MIN(id) FROM alerts WHERE resolved = {false} GROUP BY hostname, alert_type
+        )
+        ''',
+        # Replaced by alerts.notified_at
+        'DROP TABLE IF EXISTS sent_notifications',
+        'CREATE INDEX IF NOT EXISTS idx_alerts_open ON alerts(hostname, alert_type, resolved)'
+    ]),
+    (10, 'topology-suppressed alerts', [
+        # Hostname of the root-cause node_down alert, see topology.py
+        'ALTER TABLE alerts ADD COLUMN suppressed_by TEXT'
+    ]),
+    (11, 'sealed flag in the metric_chunks key', [
+        # A segment starting on the hour had the key of that hour's sealed
+        # chunk and replaced it. Built under a new name so the primary key
+        # index doesn't clash with the old table's on PostgreSQL.
+        '''
+        CREATE TABLE metric_chunks_v11 (
+            hostname TEXT,
+            chunk_start TIMESTAMP,
+            chunk_end TIMESTAMP,
+            samples INTEGER,
+            data {blob},
+            sealed BOOLEAN DEFAULT {false},
+            PRIMARY KEY (hostname, chunk_start, sealed)
+        )
+        ''',
+        '''
+        INSERT INTO metric_chunks_v11 (hostname, chunk_start, chunk_end, samples, data, sealed)
+        SELECT hostname, chunk_start, chunk_end, samples, data, sealed FROM metric_chunks
+        ''',
+        'DROP TABLE metric_chunks',
+        'ALTER TABLE metric_chunks_v11 RENAME TO metric_chunks',
+        'CREATE INDEX IF NOT EXISTS idx_metric_chunks_end ON metric_chunks(chunk_end)'
+    ]),
+    (12, 'import progress', [
+        # Written in the same transaction as each imported chunk, see
+        # export.Importer
+        '''
+        CREATE TABLE IF NOT EXISTS import_progress (
+            export_id TEXT,
+            table_name TEXT,
+            imported_rows INTEGER,
+            imported_parts INTEGER,
+            PRIMARY KEY (export_id, table_name)
+        )
+        '''
+    ]),
+    (13, 'rollup tiers rebuilt', [
+        # Migration 8 failed on PostgreSQL until _run_migration_statement
+        # renamed primary key indexes along with their tables; rebuild
+        # the tiers so every database has them from the same statements
+        statement
+        for table in ROLLUP_TIERS
+        for statement in (
+            f'''
+            CREATE TABLE {table}_v13 (
+                host_id INTEGER REFERENCES hosts(id),
+                bucket BIGINT,
+                samples INTEGER,
+                {', '.join(f'{field}_{stat} REAL' for field in ROLLUP_FIELDS for stat in ROLLUP_STATS)},
+                uptime_seconds INTEGER,
+                PRIMARY KEY (host_id, bucket)
+            )
+            ''',
+            f"INSERT INTO {table}_v13 ({', '.join(COLUMNS[table])}) SELECT {', '.join(COLUMNS[table])} FROM {table}",
+            f'DROP TABLE {table}',
+            f'ALTER TABLE {table}_v13 RENAME TO {table}',
+            f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)'
+        )
+    ])
+]
+
+# Matches a migration's ALTER TABLE ... RENAME TO
+RENAME_TABLE = re.compile(r'^\s*ALTER TABLE (\w+) RENAME TO (\w+)\s*$', re.IGNORECASE)
+
+SCHEMA_VERSION_TABLE = '''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_at TIMESTAMP
+    )
+'''
+
+# The queries the dashboard and collector run most, with the index each
+# must use (checked by `mesh_monitor.py schema`)
+HOT_QUERIES = [
+    ('node metrics history', '''
+        SELECT timestamp, cpu_percent, memory_percent, disk_percent
+        FROM metrics
+        WHERE host_id = ? AND timestamp > ?
+        ORDER BY timestamp ASC
+    ''', (1, 0), 'idx_metrics_host_timestamp'),
+    ('active alerts', '''
+        SELECT id, timestamp, hostname, severity, alert_type, message
+        FROM alerts
+        WHERE resolved = ?
+        ORDER BY timestamp DESC
+        LIMIT 50
+    ''', (False,), 'idx_alerts_resolved'),
+    ('alerts pending notification', '''
+        SELECT id, timestamp, hostname, severity, alert_type, message
+        FROM alerts
+        WHERE resolved = ? AND notified_at IS NULL AND suppressed_by IS NULL
+        ORDER BY timestamp
+    ''', (False,), 'idx_alerts_resolved')
+]
+
+
+def parse_timestamp(value) -> Optional[datetime]:
+    """Timestamps come back as datetime from PostgreSQL and as text from SQLite"""
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def to_epoch(moment: datetime) -> int:
+    """Naive local datetime -> epoch seconds (EPOCH_TABLES, rollup buckets)"""
+    return int(moment.timestamp())
+
+
+def from_epoch(seconds) -> Optional[datetime]:
+    return None if seconds is None else datetime.fromtimestamp(seconds)
+
+
+def insert_sql(table: str, values: str) -> str:
+    """INSERT statement for a COLUMNS table; upserts where UPSERT_KEYS says so"""
+    columns = COLUMNS[table]
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}"
+    key = UPSERT_KEYS.get(table)
+    if key:
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c not in key)
+        sql += f" ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+    return sql
+
+
+class Storage:
+    """Common interface of the storage backends
+
+    SQL is written once with '?' placeholders and portable syntax; each
+    backend translates the placeholders. Rows come back as dicts.
+    """
+
+    placeholder = '?'
+    # Physical row identifier, for deleting a bounded batch of rows
+    row_id = 'rowid'
+    schema_types = {
+        'id': 'INTEGER PRIMARY KEY AUTOINCREMENT',
+        'false': '0',
+        'blob': 'BLOB',
+        # TIMESTAMP text (local time) -> epoch seconds, for migration 8
+        'epoch_timestamp': "CAST(strftime('%s', timestamp, 'utc') AS INTEGER)",
+        'epoch_bucket': "CAST(strftime('%s', bucket, 'utc') AS INTEGER)"
+    }
+
+    def sql(self, statement: str) -> str:
+        if self.placeholder == '?':
+            return statement
+        return statement.replace('?', self.placeholder)
+
+    @contextmanager
+    def transaction(self) -> Iterator:
+        """Cursor whose statements are committed together (or rolled back)"""
+        raise NotImplementedError
+
+    def query(self, statement: str, params: tuple = ()) -> List[Dict]:
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(statement), params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def query_one(self, statement: str, params: tuple = ()) -> Optional[Dict]:
+        rows = self.query(statement, params)
+        return rows[0] if rows else None
+
+    def stream(self, statement: str, params: tuple = (), size: int = 1000) -> Iterator[List[Dict]]:
+        """Yield the rows of a query in lists of at most size rows,
+        without loading the whole result"""
+        raise NotImplementedError
+
+    def execute(self, statement: str, params: tuple = ()) -> int:
+        """Run one statement and commit; returns the affected row count"""
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(statement), params)
+            return cursor.rowcount
+
+    def host_ids(self, hostnames, create: bool = True) -> Dict[str, int]:
+        """hosts.id for each hostname, adding unknown ones when create is set
+
+        Ids never change, so they are cached for the life of the object.
+        """
+        cache = self._host_ids
+        missing = [hostname for hostname in set(hostnames) if hostname not in cache]
+        if missing:
+            with self.transaction() as cursor:
+                if create:
+                    cursor.executemany(
+                        self.sql('INSERT INTO hosts (hostname) VALUES (?) ON CONFLICT (hostname) DO NOTHING'),
+                        [(hostname,) for hostname in missing]
+                    )
+                cursor.execute(
+                    self.sql(f"SELECT id, hostname FROM hosts WHERE hostname IN ({', '.join('?' * len(missing))})"),
+                    tuple(missing)
+                )
+                for row in cursor.fetchall():
+                    cache[row['hostname']] = row['id']
+        return {hostname: cache[hostname] for hostname in hostnames if hostname in cache}
+
+    def host_id(self, hostname: str) -> Optional[int]:
+        """hosts.id of a known hostname, None if it never reported"""
+        return self.host_ids([hostname], create=False).get(hostname)
+
+    def delete_batch(self, table: str, where: str, params: tuple, order: str, limit: int) -> int:
+        """Delete at most limit rows matching where, lowest order first
+
+        Walking the order column's index keeps each batch a short
+        transaction; returns the rows deleted.
+        """
+        return self.execute(
+            f'DELETE FROM {table} WHERE {self.row_id} IN ('
+            f'SELECT {self.row_id} FROM {table} WHERE {where} ORDER BY {order} LIMIT ?)',
+            tuple(params) + (limit,)
+        )
+
+    def reclaim_space(self, pages: int) -> Optional[int]:
+        """Return up to pages free pages to the filesystem; bytes freed,
+        or None when the backend reclaims space itself"""
+        return None
+
+    def _lock_schema(self, cursor):
+        """Serialize migrations between processes sharing the database"""
+        raise NotImplementedError
+
+    def _run_migration_statement(self, cursor, statement: str):
+        """Run one statement of a migration"""
+        cursor.execute(statement)
+
+    def schema_version(self) -> int:
+        with self.transaction() as cursor:
+            cursor.execute(SCHEMA_VERSION_TABLE)
+            cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+            row = cursor.fetchone()
+        return (row['version'] if row else None) or 0
+
+    def migrate(self) -> List[int]:
+        """Apply pending MIGRATIONS in place; returns the versions applied
+
+        Each migration runs in its own transaction together with its
+        schema_version row, under a lock, so collector workers starting
+        at the same time apply it exactly once.
+        """
+        applied = []
+        for version, description, statements in MIGRATIONS:
+            if version <= self.schema_version():
+                continue
+            with self.transaction() as cursor:
+                self._lock_schema(cursor)
+                cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+                row = cursor.fetchone()
+                if ((row['version'] if row else None) or 0) >= version:
+                    continue
+                for statement in statements:
+                    self._run_migration_statement(cursor, statement.format(**self.schema_types))
+                cursor.execute(
+                    self.sql('INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)'),
+                    (version, description, datetime.now())
+                )
+            applied.append(version)
+        return applied
+
+    def explain(self, statement: str, params: tuple = ()) -> str:
+        """Query plan of a statement as text"""
+        raise NotImplementedError
+
+    def check_query_plans(self) -> List[str]:
+        """Problems with HOT_QUERIES plans; empty when every index is used"""
+        problems = []
+        for name, statement, params, index in HOT_QUERIES:
+            plan = self.explain(statement, params)
+            if index not in plan:
+                problems.append(f"{name}: expected {index}, plan was: {' / '.join(plan.splitlines())}")
+        return problems
+
+    def write_rows(self, rows: Dict[str, List[tuple]], clear: Optional[Dict[str, List[str]]] = None,
+                   transitions: Optional[Dict[str, List[tuple]]] = None, alerts: Optional[List[tuple]] = None):
+        """Write rows for COLUMNS tables in one transaction
+
+        clear maps a table to hostnames whose existing rows are deleted
+        first (for REPLACE_PER_HOST tables). transitions maps a
+        TRANSITION_KEYS table to (timestamp, key, row) changes, see
+        _apply_transitions; alerts are AlertEngine changes, see
+        _apply_alerts.
+        """
+        raise NotImplementedError
+
+    def _clear(self, cursor, clear: Optional[Dict[str, List[str]]]):
+        for table, hostnames in (clear or {}).items():
+            cursor.executemany(
+                self.sql(f'DELETE FROM {table} WHERE hostname = ?'),
+                [(hostname,) for hostname in hostnames]
+            )
+
+    def _apply_transitions(self, cursor, transitions: Optional[Dict[str, List[tuple]]]):
+        """End the open row of each key at timestamp, then open row if given
+
+        Applied one by one and in order, since a key can change more than
+        once in a batch. Transitions are rare, so this stays cheap.
+        """
+        for table, changes in (transitions or {}).items():
+            key_columns = TRANSITION_KEYS[table]
+            close = self.sql(
+                f'UPDATE {table} SET ended_at = ? WHERE ' +
+                ' AND '.join(f'{column} = ?' for column in key_columns) + ' AND ended_at IS NULL'
+            )
+            insert = self.sql(insert_sql(table, '(' + ', '.join('?' * len(COLUMNS[table])) + ')'))
+            for timestamp, key, row in changes:
+                cursor.execute(close, (timestamp,) + key)
+                if row is not None:
+                    cursor.execute(insert, row)
+
+    def _apply_alerts(self, cursor, changes: Optional[List[tuple]]):
+        """Apply AlertEngine changes in order
+
+        'open' inserts an incident, 'update' refreshes the open row of
+        its key (clearing notified_at when the severity changed, and
+        setting or lifting its suppression) and
+        'resolve' closes it. An update that finds no open row, because
+        the incident was resolved by hand, opens a new one.
+        """
+        open_row = self.sql(insert_sql('alerts', '(' + ', '.join('?' * len(COLUMNS['alerts'])) + ')'))
+        update = self.sql('''
+            UPDATE alerts
+            SET notified_at = CASE WHEN severity = ? THEN notified_at END,
+                severity = ?, message = ?, last_seen = ?, suppressed_by = ?
+            WHERE hostname = ? AND alert_type = ? AND resolved = ?
+        ''')
+        resolve = self.sql(
+            'UPDATE alerts SET resolved = ?, resolved_at = ? WHERE hostname = ? AND alert_type = ? AND resolved = ?'
+        )
+        for action, key, value in changes or ():
+            if action == 'open':
+                cursor.execute(open_row, value)
+            elif action == 'update':
+                _started, _hostname, severity, _type, message, last_seen, suppressed_by = value
+                cursor.execute(update, (severity, severity, message, last_seen, suppressed_by) + key + (False,))
+                if cursor.rowcount == 0:
+                    cursor.execute(open_row, value)
+            else:
+                cursor.execute(resolve, (True, value) + key + (False,))
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage(Storage):
+    """SQLite database file, one connection per thread"""
+
+    def __init__(self, path: str, timeout: float = 30):
+        self.path = path
+        # Several collector workers may share the database; wait for locks
+        self.timeout = timeout
+        self._local = threading.local()
+        self._host_ids: Dict[str, int] = {}
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def connection(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=self.timeout)
+            for pragma in SQLITE_PRAGMAS:
+                db.execute(pragma)
+            db.row_factory = sqlite3.Row
+            self._local.db = db
+            with self._lock:
+                self._connections.append(db)
+        return db
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Cursor]:
+        db = self.connection()
+        cursor = db.cursor()
+        try:
+            yield cursor
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            cursor.close()
+
+    def stream(self, statement: str, params: tuple = (), size: int = 1000) -> Iterator[List[Dict]]:
+        cursor = self.connection().cursor()
+        try:
+            cursor.execute(self.sql(statement), params)
+            while True:
+                rows = cursor.fetchmany(size)
+                if not rows:
+                    break
+                yield [dict(row) for row in rows]
+        finally:
+            cursor.close()
+
+    def _lock_schema(self, cursor):
+        # Takes the database write lock now rather than at the first write
+        cursor.execute('BEGIN IMMEDIATE')
+
+    def reclaim_space(self, pages: int) -> Optional[int]:
+        # Only files created with auto_vacuum=INCREMENTAL can shrink in
+        # steps; older ones need a one-off VACUUM
+        if self.query_one('PRAGMA auto_vacuum')['auto_vacuum'] != 2:
+            return 0
+        page_size = self.query_one('PRAGMA page_size')['page_size']
+        before = self.query_one('PRAGMA freelist_count')['freelist_count']
+        # executescript steps the pragma to completion (execute() frees one page)
+        self.connection().executescript(f'PRAGMA incremental_vacuum({int(pages)});')
+        after = self.query_one('PRAGMA freelist_count')['freelist_count']
+        return (before - after) * page_size
+
+    def explain(self, statement: str, params: tuple = ()) -> str:
+        rows = self.query('EXPLAIN QUERY PLAN ' + statement, params)
+        return '\n'.join(row['detail'] for row in rows)
+
+    def write_rows(self, rows: Dict[str, List[tuple]], clear: Optional[Dict[str, List[str]]] = None,
+                   transitions: Optional[Dict[str, List[tuple]]] = None, alerts: Optional[List[tuple]] = None):
+        with self.transaction() as cursor:
+            self._clear(cursor, clear)
+            self._apply_transitions(cursor, transitions)
+            self._apply_alerts(cursor, alerts)
+            for table, batch in rows.items():
+                values = '(' + ', '.join('?' * len(COLUMNS[table])) + ')'
+                cursor.executemany(insert_sql(table, values), batch)
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for db in connections:
+            try:
+                db.close()
+            except sqlite3.ProgrammingError:
+                # Opened by another thread; it is closed with that thread
+                pass
+        self._local = threading.local()
+
+
+class PostgresStorage(Storage):
+    """PostgreSQL through a thread-safe connection pool
+
+    Append-only metric tables are loaded with COPY, everything else with
+    multi-row INSERTs, so a cycle is a handful of round trips.
+    """
+
+    placeholder = '%s'
+    row_id = 'ctid'
+    schema_types = {
+        'id': 'SERIAL PRIMARY KEY',
+        'false': 'FALSE',
+        'blob': 'BYTEA',
+        # Interpreted in the session time zone
+        'epoch_timestamp': 'CAST(EXTRACT(EPOCH FROM CAST(timestamp AS TIMESTAMPTZ)) AS BIGINT)',
+        'epoch_bucket': 'CAST(EXTRACT(EPOCH FROM CAST(bucket AS TIMESTAMPTZ)) AS BIGINT)'
+    }
+    copy_tables = ('metrics', 'reachability', 'services', 'ospf_neighbors')
+
+    def __init__(self, host: str, port: int, dbname: str, user: str, password: str,
+                 min_connections: int = 1, max_connections: int = 10, connect_timeout: int = 10):
+        if psycopg2 is None:
+            raise RuntimeError("database.type 'postgresql' requires psycopg2 (pip install psycopg2-binary)")
+
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            min_connections,
+            max_connections,
+            host=host,
+            port=port,
+            dbname=dbname,
+            user=user,
+            password=password,
+            connect_timeout=connect_timeout
+        )
+        self._host_ids: Dict[str, int] = {}
+
+    @contextmanager
+    def transaction(self) -> Iterator:
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                yield cursor
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            # Broken connections are dropped instead of going back to the pool
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def stream(self, statement: str, params: tuple = (), size: int = 1000) -> Iterator[List[Dict]]:
+        conn = self.pool.getconn()
+        try:
+            # A named cursor keeps the result on the server
+            with conn.cursor(name='mesh_stream', cursor_factory=psycopg2.extras.RealDictCursor) as cursor:
+                cursor.itersize = size
+                cursor.execute(self.sql(statement), params)
+                while True:
+                    rows = cursor.fetchmany(size)
+                    if not rows:
+                        break
+                    yield [dict(row) for row in rows]
+            conn.commit()
+        except BaseException:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            self.pool.putconn(conn, close=bool(conn.closed))
+
+    def _lock_schema(self, cursor):
+        cursor.execute('SELECT pg_advisory_xact_lock(%s)', (MIGRATION_LOCK_ID,))
+
+    def _run_migration_statement(self, cursor, statement: str):
+        cursor.execute(statement)
+        # A renamed table keeps its <table>_pkey index name here (SQLite
+        # names these internally), so a new table of the old name couldn't
+        # create its own
+        renamed = RENAME_TABLE.match(statement)
+        if renamed:
+            old, new = renamed.groups()
+            cursor.execute(f'ALTER INDEX IF EXISTS {old}_pkey RENAME TO {new}_pkey')
+
+    def explain(self, statement: str, params: tuple = ()) -> str:
+        with self.transaction() as cursor:
+            # Small tables are cheaper to scan; ask whether the index is usable
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('EXPLAIN ' + self.sql(statement), params)
+            return '\n'.join(row['QUERY PLAN'] for row in cursor.fetchall())
+
+    def _copy(self, cursor, table: str, rows: List[tuple]):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow(['\\N' if value is None else value for value in row])
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {table} ({', '.join(COLUMNS[table])}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+            buffer
+        )
+
+    def write_rows(self, rows: Dict[str, List[tuple]], clear: Optional[Dict[str, List[str]]] = None,
+                   transitions: Optional[Dict[str, List[tuple]]] = None, alerts: Optional[List[tuple]] = None):
+        with self.transaction() as cursor:
+            self._clear(cursor, clear)
+            self._apply_transitions(cursor, transitions)
+            self._apply_alerts(cursor, alerts)
+            for table, batch in rows.items():
+                if table in self.copy_tables:
+                    self._copy(cursor, table, batch)
+                else:
+                    psycopg2.extras.execute_values(cursor, insert_sql(table, '%s'), batch, page_size=500)
+
+    def close(self):
+        self.pool.closeall()
+
+
+def create_storage(config: dict, default_path: str = DEFAULT_SQLITE_PATH) -> Storage:
+    """Build the backend configured in the database section
+
+    database.type is 'sqlite' (default) or 'postgresql'. Connection
+    settings fall back to the DB_HOST/DB_PORT/DB_NAME/DB_USER/DB_PASSWORD
+    environment variables set by docker-compose, and DB_TYPE selects the
+    backend when the config doesn't.
+    """
+    database = config.get('database') or {}
+    db_type = database.get('type') or os.environ.get('DB_TYPE', 'sqlite')
+
+    if db_type in ('postgresql', 'postgres'):
+        return PostgresStorage(
+            host=database.get('host') or os.environ.get('DB_HOST', 'localhost'),
+            port=int(database.get('port') or os.environ.get('DB_PORT', 5432)),
+            dbname=database.get('name') or os.environ.get('DB_NAME', 'mesh_monitor'),
+            user=database.get('user') or os.environ.get('DB_USER', 'mesh_monitor'),
+            password=database.get('password') or os.environ.get('DB_PASSWORD', ''),
+            min_connections=database.get('pool_min', 1),
+            max_connections=database.get('pool_max', 10)
+        )
+
+    if db_type != 'sqlite':
+        raise ValueError(f"Unknown database type: {db_type}")
+
+    path = database.get('path') or config.get('retention', {}).get('database') or default_path
+    return SQLiteStorage(path, timeout=database.get('timeout', 30))
+
+
+class BatchWriter:
+    """Buffers rows for a whole cycle and writes them in one transaction
+
+    Rows are grouped per table and handed to the storage backend at once
+    (executemany on SQLite, COPY / multi-row INSERT on PostgreSQL), so a
+    cycle costs one commit regardless of node count.
+
+    Service and OSPF neighbor state is compared with the last state
+    written (loaded from the open transition rows on first use) and only
+    changes are stored. Alert changes queued by an alerts.AlertEngine are
+    written in the same transaction.
+    """
+
+    def __init__(self, storage: Storage, chunks=None, alerts=None):
+        self.storage = storage
+        # chunks.ChunkBuffer when metrics are stored compressed
+        self.chunks = chunks
+        self.alerts = alerts
+        self._rows: Dict[str, List[tuple]] = {table: [] for table in COLUMNS}
+        # REPLACE_PER_HOST table -> hostname -> that host's latest rows
+        self._replace: Dict[str, Dict[str, List[tuple]]] = {table: {} for table in REPLACE_PER_HOST}
+        # TRANSITION_KEYS table -> key -> state of its open row
+        self._states: Optional[Dict[str, Dict[tuple, tuple]]] = None
+        self._transitions: Dict[str, List[tuple]] = {table: [] for table in TRANSITION_KEYS}
+        self._lock = threading.Lock()
+
+    def add_metrics(self, metrics: Dict):
+        """Buffer the node, metrics, reachability, service and OSPF rows"""
+        hostname = metrics['hostname']
+        timestamp = metrics['timestamp']
+        rows = []
+
+        rows.append(('nodes', (
+            hostname,
+            metrics.get('ip', ''),
+            metrics.get('type', 'unknown'),
+            timestamp,
+            metrics.get('status', 'unknown')
+        )))
+
+        if 'cpu_percent' in metrics:
+            values = (
+                metrics.get('cpu_percent'),
+                metrics.get('memory_percent'),
+                metrics.get('disk_percent'),
+                metrics.get('uptime_seconds')
+            )
+            if self.chunks is not None:
+                self.chunks.add(hostname, timestamp, values)
+            else:
+                rows.append(('metrics', (hostname, timestamp) + values))
+            rows.append(('node_current', (hostname, timestamp) + values))
+
+        if 'packet_loss' in metrics:
+            rows.append(('reachability', (
+                hostname,
+                timestamp,
+                metrics.get('rtt_ms'),
+                metrics.get('packet_loss')
+            )))
+
+        services = {}
+        for service, status in metrics.get('services', {}).items():
+            rows.append(('service_current', (hostname, service, timestamp, status)))
+            services[(hostname, service)] = (status,)
+
+        neighbors = []
+        adjacencies = {}
+        for neighbor_id, neighbor_data in metrics.get('ospf_neighbors', {}).items():
+            if isinstance(neighbor_data, dict):
+                address = neighbor_data.get('address', '')
+                state = neighbor_data.get('state', '')
+                neighbors.append((hostname, neighbor_id, timestamp, address, state))
+                adjacencies[(hostname, neighbor_id)] = (address, state)
+
+        self._add(rows)
+        with self._lock:
+            # A missing service is just not reported; a missing neighbor is gone
+            self._track('service_states', hostname, timestamp, services, complete=False)
+            if 'ospf_neighbors' in metrics:
+                self._replace['ospf_current'][hostname] = neighbors
+                self._track('ospf_states', hostname, timestamp, adjacencies, complete=True)
+
+    def _track(self, table: str, hostname: str, timestamp, current: Dict[tuple, tuple], complete: bool):
+        """Queue transitions for keys of one host whose state changed
+
+        With complete set, open keys of the host missing from current are
+        ended. Called with the lock held.
+        """
+        if self._states is None:
+            self._states = {
+                name: {
+                    tuple(row[column] for column in key): tuple(row[column] for column in COLUMNS[name][len(key):-1])
+                    for row in self.storage.query(f'SELECT * FROM {name} WHERE ended_at IS NULL')
+                }
+                for name, key in TRANSITION_KEYS.items()
+            }
+
+        states = self._states[table]
+        changes = self._transitions[table]
+        for key, state in current.items():
+            if states.get(key) != state:
+                states[key] = state
+                changes.append((timestamp, key, key + state + (timestamp,)))
+        if complete:
+            for key in [key for key in states if key[0] == hostname and key not in current]:
+                del states[key]
+                changes.append((timestamp, key, None))
+
+    def _add(self, rows: List[tuple]):
+        with self._lock:
+            for table, row in rows:
+                self._rows[table].append(row)
+
+    def pending(self) -> int:
+        with self._lock:
+            return (sum(len(rows) for rows in self._rows.values()) +
+                    sum(len(rows) for hosts in self._replace.values() for rows in hosts.values()) +
+                    sum(len(changes) for changes in self._transitions.values()))
+
+    def flush(self, final: bool = False) -> Dict[str, int]:
+        """Write all buffered rows in one transaction
+
+        Chunk segments are only included once due, or all of them when
+        final is set (on shutdown). Returns the number of rows written
+        per table. On error the transaction is rolled back and the rows
+        are dropped.
+        """
+        with self._lock:
+            batch = {table: rows for table, rows in self._rows.items() if rows}
+            replace = {table: hosts for table, hosts in self._replace.items() if hosts}
+            self._rows = {table: [] for table in COLUMNS}
+            self._replace = {table: {} for table in REPLACE_PER_HOST}
+            transitions = {table: changes for table, changes in self._transitions.items() if changes}
+            self._transitions = {table: [] for table in TRANSITION_KEYS}
+
+        # hostname/datetime -> host id/epoch seconds
+        epoch_rows = [table for table in EPOCH_TABLES if table in batch]
+        if epoch_rows:
+            ids = self.storage.host_ids({row[0] for table in epoch_rows for row in batch[table]})
+            for table in epoch_rows:
+                batch[table] = [(ids[row[0]], to_epoch(row[1])) + row[2:] for row in batch[table]]
+
+        if self.chunks is not None:
+            segments = self.chunks.take(force=final)
+            if segments:
+                batch['metric_chunks'] = segments
+
+        alerts = self.alerts.take() if self.alerts is not None else []
+
+        # A node may appear twice in one batch (e.g. several pushes); an
+        # upsert can only touch each key once per statement, keep the last
+        for table, key in UPSERT_KEYS.items():
+            if table in batch:
+                indexes = [COLUMNS[table].index(column) for column in key]
+                latest = {tuple(row[i] for i in indexes): row for row in batch[table]}
+                batch[table] = list(latest.values())
+
+        clear = {}
+        for table, hosts in replace.items():
+            clear[table] = list(hosts)
+            rows = [row for host_rows in hosts.values() for row in host_rows]
+            if rows:
+                batch[table] = rows
+
+        if batch or clear or transitions or alerts:
+            try:
+                self.storage.write_rows(batch, clear, transitions, alerts)
+            except Exception:
+                # The known states ran ahead of the database; reload them
+                with self._lock:
+                    self._states = None
+                if self.alerts is not None:
+                    self.alerts.reset()
+                raise
+        written = {table: len(rows) for table, rows in batch.items()}
+        written.update({table: len(changes) for table, changes in transitions.items()})
+        if alerts:
+            written['alerts'] = len(alerts)
+        return written
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Mesh Network Monitor - Topology-aware Alert Suppression
+Reports one root cause per partition instead of a node_down alert per node behind it
+"""
+
+from collections import deque
+from typing import Dict, List, Set, Tuple
+
+from storage import Storage
+
+ALERT_TYPE = 'node_down'
+
+
+def build_graph(nodes: List[Dict], adjacencies: List[Dict]) -> Dict[str, Set[str]]:
+    """Undirected hostname graph of the OSPF adjacencies
+
+    An edge is taken from either end's report, so a node that went down
+    keeps the edges of its last report even though its neighbors no
+    longer list it. Neighbors are matched to nodes by router id or
+    address.
+    """
+    hostname_by_ip = {node['ip']: node['hostname'] for node in nodes if node.get('ip')}
+    graph: Dict[str, Set[str]] = {node['hostname']: set() for node in nodes}
+    for row in adjacencies:
+        if not (row.get('state') or '').startswith('Full'):
+            continue
+        neighbor = hostname_by_ip.get(row['neighbor_id']) or hostname_by_ip.get(row['neighbor_ip'])
+        if neighbor is None or neighbor == row['hostname']:
+            continue
+        graph.setdefault(row['hostname'], set()).add(neighbor)
+        graph.setdefault(neighbor, set()).add(row['hostname'])
+    return graph
+
+
+def root_causes(graph: Dict[str, Set[str]], down: Set[str]) -> Dict[str, str]:
+    """Map each down node that sits behind another down node to its root cause
+
+    Down nodes with an adjacency to a node that is up are where the
+    partition starts (the failed node, or the far end of a failed link);
+    the down nodes reached only through them are attributed to the
+    nearest one. Down nodes not connected to any up node (no topology
+    known) are their own root cause and don't appear in the result.
+    """
+    parents: Dict[str, str] = {}
+    queue = deque()
+    for hostname in down:
+        if any(neighbor not in down for neighbor in graph.get(hostname, ())):
+            parents[hostname] = hostname
+            queue.append(hostname)
+
+    while queue:
+        hostname = queue.popleft()
+        for neighbor in graph.get(hostname, ()):
+            if neighbor in down and neighbor not in parents:
+                parents[neighbor] = parents[hostname]
+                queue.append(neighbor)
+
+    return {hostname: root for hostname, root in parents.items() if hostname != root}
+
+
+class TopologySuppressor:
+    """Marks node_down alerts of nodes behind a failed node as its children
+
+    When a node or link fails, everything reachable only through it goes
+    down with it. The node where the partition starts keeps its alert
+    (with the number of nodes behind it added to the message); the
+    alerts of the nodes behind it get suppressed_by set to it, are
+    stored but not notified. The graph comes from the latest OSPF
+    adjacencies (ospf_current) and node statuses, read only for
+    cycles that raise node_down alerts.
+    """
+
+    def __init__(self, storage: Storage, config: dict):
+        self.storage = storage
+        suppression = (config.get('alerts') or {}).get('suppression') or {}
+        self.enabled = suppression.get('enabled', True)
+
+    def apply(self, results: List[Tuple[Dict, List[Dict]]]) -> List[Tuple[Dict, List[Dict]]]:
+        """Annotate the (metrics, alerts) pairs of AlertRules.evaluate"""
+        firing = {
+            metrics['hostname'] for metrics, alerts in results
+            if any(alert['type'] == ALERT_TYPE for alert in alerts)
+        }
+        if not self.enabled or not firing:
+            return results
+
+        nodes = self.storage.query('SELECT hostname, ip, status FROM nodes')
+        # This batch is not written yet; its statuses are the newest
+        status = {node['hostname']: node['status'] for node in nodes}
+        status.update({metrics['hostname']: metrics.get('status') for metrics, _alerts in results})
+        down = {hostname for hostname, state in status.items() if state == 'unreachable'} | firing
+
+        adjacencies = self.storage.query('SELECT hostname, neighbor_id, neighbor_ip, state FROM ospf_current')
+        parents = root_causes(build_graph(nodes, adjacencies), down)
+        if not parents:
+            return results
+
+        behind: Dict[str, int] = {}
+        for root in parents.values():
+            behind[root] = behind.get(root, 0) + 1
+
+        annotated = []
+        for metrics, alerts in results:
+            hostname = metrics['hostname']
+            marked = []
+            for alert in alerts:
+                if alert['type'] == ALERT_TYPE:
+                    # Copies: the rules keep the originals as their state
+                    if hostname in parents:
+                        alert = dict(alert, suppressed_by=parents[hostname])
+                    elif hostname in behind:
+                        alert = dict(alert, message=f"{alert['message']} "
+                                                    f"({behind[hostname]} node(s) behind it unreachable)")
+                marked.append(alert)
+            annotated.append((metrics, marked))
+        return annotated
@@ -13,5 +13,148 @@ echo "2. Checking file structure..."
 [ -f ../install.sh ] && echo "✓ install.sh exists" || echo "✗ install.sh missing"
 [ -f ../README.md ] && echo "✓ README.md exists" || echo "✗ README.md missing"
 
+echo
+echo "3. Checking database schema and query plans..."
+tmpdir=$(mktemp -d)
+printf 'network:\n  auto_discovery: false\ndatabase:\n  type: sqlite\n  path: %s/metrics.db\n' "$tmpdir" > "$tmpdir/config.yml"
+python3 ../scripts/monitoring/mesh_monitor.py schema --config "$tmpdir/config.yml" && echo "✓ Schema and query plans OK" || echo "✗ Schema check failed"
+rm -rf "$tmpdir"
+
+echo
+echo "4. Checking that importing an export twice adds nothing..."
+tmpdir=$(mktemp -d)
+for db in source target; do
+    printf 'network:\n  auto_discovery: false\ndatabase:\n  type: sqlite\n  path: %s/%s.db\n' "$tmpdir" "$db" > "$tmpdir/$db.yml"
+done
+python3 - "$tmpdir" <<'EOF'
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, '../scripts/monitoring')
+from storage import create_storage, BatchWriter
+storage = create_storage({'database': {'type': 'sqlite', 'path': f'{sys.argv[1]}/source.db'}})
+storage.migrate()
+writer = BatchWriter(storage)
+start = datetime.now() - timedelta(hours=2)
+for i in range(240):
+    writer.add_metrics({'hostname': f'router{i % 4}', 'timestamp': start + timedelta(seconds=30 * i), 'status': 'online',
+                        'cpu_percent': 10.0, 'memory_percent': 20.0, 'disk_percent': 30.0, 'uptime_seconds': i,
+                        'rtt_ms': 1.5, 'packet_loss': 0.0})
+writer.flush()
+storage.execute('INSERT INTO alerts (timestamp, hostname, severity, alert_type, message, last_seen) VALUES (?, ?, ?, ?, ?, ?)',
+                (start, 'router1', 'warning', 'high_cpu', 'CPU usage on router1 is 75.0%', start))
+EOF
+python3 ../scripts/monitoring/mesh_monitor.py export --config "$tmpdir/source.yml" --dir "$tmpdir/export" --chunk-size 100 > /dev/null
+python3 ../scripts/monitoring/mesh_monitor.py import --config "$tmpdir/target.yml" --dir "$tmpdir/export" --chunk-size 100 > /dev/null
+python3 ../scripts/monitoring/mesh_monitor.py import --config "$tmpdir/target.yml" --dir "$tmpdir/export" --chunk-size 100 > /dev/null
+python3 - "$tmpdir" <<'EOF' && echo "✓ Import is idempotent" || echo "✗ Import check failed"
+import sqlite3, sys
+counts = {}
+for db in ('source', 'target'):
+    connection = sqlite3.connect(f'{sys.argv[1]}/{db}.db')
+    counts[db] = {table: connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                  for table in ('nodes', 'metrics', 'reachability', 'alerts')}
+print(f"  source {counts['source']}, target {counts['target']}")
+sys.exit(0 if counts['source'] == counts['target'] and counts['source']['metrics'] else 1)
+EOF
+rm -rf "$tmpdir"
+
+echo
+echo "5. Checking alert rule overrides and hysteresis..."
+python3 - <<'EOF' && echo "✓ Alert rules OK" || echo "✗ Alert rules check failed"
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, '../scripts/monitoring')
+from rules import AlertRules
+rule = {'type': 'high_cpu', 'severity': 'warning', 'metric': 'cpu_percent', 'op': '>=',
+        'threshold': 70, 'clear': 60, 'overrides': {'gateway': {'threshold': 50}}}
+rules = AlertRules({'alerts': {'rules': [rule]}})
+start = datetime.now()
+firing = []
+# Gateways fire at 50 and, with clear moved along to 40, hold at a steady 55
+for i, cpu in enumerate([55, 55, 55, 45, 39]):
+    metrics = {'hostname': 'gw1', 'type': 'gateway', 'timestamp': start + timedelta(seconds=30 * i), 'cpu_percent': cpu}
+    firing.append(any(alert['type'] == 'high_cpu' for _, alerts in rules.evaluate([metrics]) for alert in alerts))
+assert firing == [True, True, True, True, False], firing
+for bad in ({'clear': 80}, {'overrides': {'gateway': {'clear': 75}}}):
+    try:
+        AlertRules({'alerts': {'rules': [dict(rule, **bad)]}})
+    except ValueError:
+        continue
+    sys.exit(f'accepted {bad}')
+# A node timing out neither resolves nor raises node_down
+rules = AlertRules({})
+down = []
+for i, status in enumerate(['unreachable', 'timeout', 'online', 'timeout']):
+    metrics = {'hostname': 'r1', 'timestamp': start + timedelta(seconds=30 * i), 'status': status}
+    down.append(any(alert['type'] == 'node_down' for _, alerts in rules.evaluate([metrics]) for alert in alerts))
+assert down == [True, True, False, False], down
+EOF
+
+echo
+echo "6. Checking that a failed collection cycle keeps its nodes scheduled..."
+python3 - <<'EOF' && echo "✓ Scheduler OK" || echo "✗ Scheduler check failed"
+import sys, time
+sys.path.insert(0, '../scripts/monitoring')
+from collector import collect_due
+from scheduler import CollectionScheduler
+
+class FailingMonitor:
+    def collect_nodes(self, nodes):
+        raise RuntimeError('database is locked')
+
+scheduler = CollectionScheduler({'monitoring': {'interval': 30, 'jitter': 0}})
+nodes = [{'hostname': f'router{i}', 'ip': f'10.0.0.{i}'} for i in range(3)]
+scheduler.update_nodes(nodes)
+try:
+    collect_due(FailingMonitor(), scheduler)
+    sys.exit('collect_due swallowed the error')
+except RuntimeError:
+    pass
+due = scheduler.pop_due(time.monotonic() + 3600)
+assert sorted(node['ip'] for node in due) == sorted(node['ip'] for node in nodes), due
+# Nodes leaving the schedule are handed back (their CPU baselines are dropped)
+assert scheduler.update_nodes(nodes[1:]) == nodes[:1]
+EOF
+
+echo
+echo "7. Checking that notification payloads encode as JSON..."
+python3 - <<'EOF' && echo "✓ Notification payloads OK" || echo "✗ Notification payload check failed"
+import json, sys
+from datetime import datetime
+sys.path.insert(0, '../scripts/monitoring')
+from collector import notification_alert
+from notifications import NotificationManager
+# PostgreSQL returns datetimes, SQLite text
+for timestamp in (datetime(2026, 1, 1, 12, 0, 30), '2026-01-01 12:00:30'):
+    alert = notification_alert({'id': 1, 'timestamp': timestamp, 'hostname': 'router1', 'severity': 'critical',
+                                'alert_type': 'node_down', 'message': 'Node router1 is unreachable'})
+    assert alert['timestamp'] == '2026-01-01T12:00:30', alert
+    json.dumps(alert)
+    json.dumps(NotificationManager({})._format_discord_embed(alert))
+EOF
+
+echo
+echo "8. Checking service state history..."
+tmpdir=$(mktemp -d)
+python3 - "$tmpdir" <<'EOF' && echo "✓ State history OK" || echo "✗ State history check failed"
+import sys
+from datetime import datetime, timedelta
+sys.path.insert(0, '../scripts/monitoring')
+from storage import create_storage
+from state_history import services_at, state_changes
+storage = create_storage({'database': {'type': 'sqlite', 'path': f'{sys.argv[1]}/metrics.db'}})
+storage.migrate()
+now = datetime.now()
+statement = 'INSERT INTO service_states (hostname, service_name, status, started_at, ended_at) VALUES (?, ?, ?, ?, ?)'
+storage.execute(statement, ('router1', 'frr', 'active', now - timedelta(days=2), now - timedelta(hours=2)))
+storage.execute(statement, ('router1', 'frr', 'failed', now - timedelta(hours=2), now - timedelta(hours=1)))
+storage.execute(statement, ('router1', 'frr', 'active', now - timedelta(hours=1), None))
+changes = state_changes(storage, 'service_states', 'router1', now - timedelta(hours=3))
+assert [row['status'] for row in changes] == ['active', 'failed', 'active'], changes
+assert len(state_changes(storage, 'service_states', 'router1', now - timedelta(minutes=30))) == 1
+assert services_at(storage, now - timedelta(minutes=90)) == {'router1': {'frr': 'failed'}}
+EOF
+rm -rf "$tmpdir"
+
 echo
 echo "✓ Tests completed!"